@@ -0,0 +1,78 @@
+"""
+Compressed archive of events dropped at ingest.
+
+Dropped events are buffered in memory and appended to one gzip file per day
+from a thread, so archiving never blocks the poller. Each flush appends a
+gzip member, and concatenated members read back as a single JSON lines file
+(e.g. `zcat dropped-20261016.jsonl.gz`).
+"""
+
+import asyncio
+import gzip
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+import orjson
+from loguru import logger
+
+
+class DroppedEventArchive:
+    """Appends dropped events to daily gzip JSON lines files."""
+
+    def __init__(self, directory: str | Path, flush_interval: float = 5.0):
+        """
+        Args:
+            directory: Directory of the archive files
+            flush_interval: Seconds between writes to disk
+        """
+        self.directory = Path(directory)
+        self.flush_interval = flush_interval
+
+        self._lines: list[bytes] = []
+        self._task: Optional[asyncio.Task[None]] = None
+
+    def add(self, batch_id: str, reason: str, event: dict[str, Any]) -> None:
+        """Buffer a dropped event."""
+        self._lines.append(
+            orjson.dumps({"batch_id": batch_id, "reason": reason, "event": event})
+        )
+
+    async def start(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop periodic flushes and write what is buffered."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        await self.flush()
+
+    async def flush(self) -> None:
+        lines, self._lines = self._lines, []
+        if not lines:
+            return
+
+        path = self.directory / (
+            "dropped-%s.jsonl.gz" % datetime.now(timezone.utc).strftime("%Y%m%d")
+        )
+        try:
+            await asyncio.to_thread(self._append, path, lines)
+        except OSError as e:
+            logger.error(
+                "Failed to archive %d dropped event(s): %s" % (len(lines), str(e))
+            )
+
+    @staticmethod
+    def _append(path: Path, lines: list[bytes]) -> None:
+        with gzip.open(path, "ab") as archive:
+            archive.write(b"\n".join(lines) + b"\n")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
@@ -0,0 +1,228 @@
+"""
+Suppression of repeated attendance punches.
+
+Face terminals report a person lingering in front of them as several
+identical punches a few seconds apart. A punch is suppressed when another
+punch with the same key (person, device and attendance status by default)
+was delivered less than `window` seconds before or after it, by event time.
+
+Kept punches are remembered in memory with time-based eviction. With a
+Redis client they are also kept in Redis, so all worker replicas share one
+view, and the memory only saves Redis round trips for repeats seen locally.
+
+Every kept punch records the event that kept it. A message that is handled
+again (webhook failure, reclaimed entry) therefore delivers its own punches
+again instead of having them suppressed as duplicates of themselves.
+"""
+
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from datetime import datetime
+from typing import Any, Iterable, Optional
+
+from loguru import logger
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from apps.utils.metrics import metrics
+
+# Per key: suppress the punch if a punch of another event was kept within
+# the window, otherwise remember it as kept. KEYS are the punch keys, ARGV
+# the window and TTL (ms) followed by "<time ms> <owner>" per key. Returns
+# 1 for kept and 0 for suppressed punches, in order.
+_CHECK_SCRIPT = """
+local window, ttl = tonumber(ARGV[1]), tonumber(ARGV[2])
+local kept = {}
+for i, key in ipairs(KEYS) do
+    local punch = ARGV[i + 2]
+    local sep = string.find(punch, ' ', 1, true)
+    local ts, owner = tonumber(string.sub(punch, 1, sep - 1)), string.sub(punch, sep + 1)
+
+    kept[i] = 1
+    local last = redis.call('GET', key)
+    if last then
+        local last_sep = string.find(last, ' ', 1, true)
+        local last_ts = tonumber(string.sub(last, 1, last_sep - 1))
+        local last_owner = string.sub(last, last_sep + 1)
+        if last_owner ~= owner and math.abs(ts - last_ts) < window then
+            kept[i] = 0
+        end
+    end
+
+    if kept[i] == 1 then
+        redis.call('SET', key, punch, 'PX', ttl)
+    end
+end
+return kept
+"""
+
+
+def _punch_time_ms(value: Any) -> int:
+    """Get the time of a punch in ms, the current time if it has none."""
+    if isinstance(value, str):
+        try:
+            return int(datetime.fromisoformat(value).timestamp() * 1000)
+        except ValueError:
+            pass
+    return int(time.time() * 1000)
+
+
+class PunchDeduplicator:
+    """
+    Sliding-window duplicate suppression for extracted webhook events.
+
+    Events missing a key field (e.g. alarms without a person) or with an
+    unhashable one are never suppressed.
+    """
+
+    def __init__(
+        self,
+        window: float = 10.0,
+        key_fields: Iterable[str] = ("person_id", "device_id", "attendance_status"),
+        time_field: str = "occur_time",
+        max_keys: int = 100_000,
+        redis_client: Optional[Redis] = None,
+        key_prefix: str = "hr:punch",
+    ):
+        """
+        Args:
+            window: Punches with the same key closer than this are
+                duplicates (seconds, 0 to disable)
+            key_fields: Event fields identifying repeated punches
+            time_field: Event field holding the ISO 8601 punch time
+            max_keys: Keys remembered in memory at most
+            redis_client: Share kept punches through Redis if given
+            key_prefix: Redis key prefix
+        """
+        self.window_ms = int(window * 1000)
+        self.key_fields = tuple(key_fields)
+        self.time_field = time_field
+        self.max_keys = max_keys
+        self.key_prefix = key_prefix
+
+        # Key -> (punch time ms, owner, monotonic expiry), oldest first
+        self._kept: OrderedDict[tuple, tuple[int, str, float]] = OrderedDict()
+
+        self.redis: Optional[Redis] = None
+        self._script = None
+        if redis_client is not None:
+            self.use_redis(redis_client)
+
+    def use_redis(self, redis_client: Redis) -> None:
+        """Share kept punches through Redis from now on."""
+        self.redis = redis_client
+        self._script = redis_client.register_script(_CHECK_SCRIPT)
+
+    async def filter(
+        self, events: list[dict[str, Any]], message_id: Any
+    ) -> list[dict[str, Any]]:
+        """
+        Drop repeated punches
+
+        Args:
+            events: Extracted events of a message, in message order
+            message_id: ID of the message, identifies the events on retries
+
+        Returns:
+            Events that are not suppressed, in order
+        """
+        if self.window_ms <= 0 or not events:
+            return events
+
+        self._evict()
+
+        # (index, key, punch time, owner) of the punches to check
+        punches = []
+        for index, event in enumerate(events):
+            key = tuple(event.get(field) for field in self.key_fields)
+            if any(part is None or not isinstance(part, Hashable) for part in key):
+                continue
+            punches.append(
+                (
+                    index,
+                    key,
+                    _punch_time_ms(event.get(self.time_field)),
+                    "%s:%d" % (message_id, index),
+                )
+            )
+
+        suppressed = set()
+        pending = []
+        for punch in punches:
+            if self._is_duplicate(*punch[1:]):
+                suppressed.add(punch[0])
+            else:
+                pending.append(punch)
+                # Repeats within this message see it as kept
+                self._remember(*punch[1:])
+
+        if pending and self._script is not None:
+            suppressed.update(await self._check_shared(pending))
+
+        metrics.incr("worker.punches.passed", len(punches) - len(suppressed))
+        if not suppressed:
+            return events
+
+        metrics.incr("worker.punches.suppressed", len(suppressed))
+        logger.info(
+            "Suppressed %d repeated punch(es) of message %s"
+            % (len(suppressed), message_id)
+        )
+        return [event for index, event in enumerate(events) if index not in suppressed]
+
+    def _is_duplicate(self, key: tuple, punch_ms: int, owner: str) -> bool:
+        kept = self._kept.get(key)
+        return (
+            kept is not None
+            and kept[1] != owner
+            and abs(punch_ms - kept[0]) < self.window_ms
+        )
+
+    def _remember(self, key: tuple, punch_ms: int, owner: str) -> None:
+        self._kept[key] = (punch_ms, owner, time.monotonic() + self.window_ms / 1000)
+        self._kept.move_to_end(key)
+        while len(self._kept) > self.max_keys:
+            self._kept.popitem(last=False)
+
+    def _evict(self) -> None:
+        """Forget punches older than the window, oldest first."""
+        now = time.monotonic()
+        while self._kept:
+            key, (_, _, expires) = next(iter(self._kept.items()))
+            if expires > now:
+                break
+            del self._kept[key]
+
+    async def _check_shared(self, punches: list[tuple]) -> set[int]:
+        """
+        Check punches against the other replicas in one round trip
+
+        Returns:
+            Indexes of the suppressed punches
+        """
+        try:
+            kept = await self._script(
+                keys=[
+                    "%s:%s" % (self.key_prefix, ":".join(map(str, key)))
+                    for _, key, _, _ in punches
+                ],
+                args=[
+                    self.window_ms,
+                    2 * self.window_ms,
+                    *("%d %s" % (punch_ms, owner) for _, _, punch_ms, owner in punches),
+                ],
+            )
+        except RedisError as e:
+            # Better a duplicate punch than a lost one
+            metrics.incr("worker.punches.shared_errors")
+            logger.warning("Shared punch check failed, using local view: %s" % e)
+            return set()
+
+        suppressed = set()
+        for (index, key, _, _), is_kept in zip(punches, kept):
+            if not int(is_kept):
+                suppressed.add(index)
+                # Kept by another replica, its punch time is not known here
+                self._kept.pop(key, None)
+        return suppressed
@@ -0,0 +1,201 @@
+"""
+Batched webhook delivery.
+
+Filtered events from many stream messages are merged into a single webhook
+POST. A batch is sent once it reaches `max_events` events or `max_bytes`
+bytes, or `max_linger` seconds after its first message arrived. Each caller
+waits for the outcome of its own events, so stream entries are only acked
+once the webhook accepted them.
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import httpx
+import orjson
+from loguru import logger
+
+# Statuses with which the webhook rejects the content of a request. Only these
+# can be caused by a single message; anything else (outages, auth) fails the
+# whole batch alike, and splitting it would only multiply the requests.
+PAYLOAD_REJECTED_STATUSES = frozenset({400, 413, 422})
+
+
+class WebhookDeliveryError(Exception):
+    """Raised when the webhook rejects the events of a message"""
+
+    def __init__(self, status_code: int, text: str):
+        self.status_code = status_code
+        self.text = text
+        super().__init__("HTTP %d: %s" % (status_code, text))
+
+
+@dataclass(slots=True)
+class _PendingDelivery:
+    fragments: list[bytes]
+    size: int
+    future: asyncio.Future[None] = field(
+        default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
+
+
+class WebhookBatcher:
+    """
+    Merges events of many messages into one webhook request.
+
+    When the webhook rejects the payload of a merged batch (HTTP 400, 413 or
+    422), the batch is split in halves and each half is retried, down to
+    single messages, so one poison event only fails the message it came
+    from. Other failures fail the whole batch.
+    """
+
+    def __init__(
+        self,
+        get_client: Callable[[], Awaitable[httpx.AsyncClient]],
+        url: str,
+        token: str,
+        max_events: int = 500,
+        max_bytes: int = 1024 * 1024,
+        max_linger: float = 0.05,
+    ):
+        """
+        Args:
+            get_client: Coroutine returning the HTTP client to use
+            url: Webhook URL
+            token: Value of the X-EXTERNAL-TOKEN header
+            max_events: Maximum number of events per request
+            max_bytes: Maximum request body size in bytes
+            max_linger: Maximum time a message waits for a batch (seconds)
+        """
+        self.get_client = get_client
+        self.url = url
+        self.token = token
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.max_linger = max_linger
+
+        self._pending: list[_PendingDelivery] = []
+        self._pending_events = 0
+        self._pending_bytes = 0
+        self._timer: Optional[asyncio.Task[None]] = None
+        self._send_tasks: set[asyncio.Task[None]] = set()
+
+    async def deliver(self, events: list[dict[str, Any]]) -> None:
+        """
+        Queue events for delivery and wait until the webhook accepted them.
+
+        Args:
+            events: Events of one stream message
+
+        Raises:
+            WebhookDeliveryError: If the webhook rejected these events
+            httpx.HTTPError: On transport errors
+        """
+        fragments = [orjson.dumps(event) for event in events]
+        item = _PendingDelivery(
+            fragments=fragments,
+            size=sum(len(fragment) + 1 for fragment in fragments),
+        )
+
+        # Send what we have first if this message would overflow the batch
+        if self._pending and (
+            self._pending_events + len(fragments) > self.max_events
+            or self._pending_bytes + item.size > self.max_bytes
+        ):
+            self._start_send()
+
+        self._pending.append(item)
+        self._pending_events += len(fragments)
+        self._pending_bytes += item.size
+
+        if (
+            self._pending_events >= self.max_events
+            or self._pending_bytes >= self.max_bytes
+        ):
+            self._start_send()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._send_later())
+
+        await item.future
+
+    async def close(self) -> None:
+        """Send remaining events and wait for running requests."""
+        if self._pending:
+            self._start_send()
+
+        if self._send_tasks:
+            await asyncio.gather(*self._send_tasks, return_exceptions=True)
+
+    def _start_send(self) -> None:
+        """Send the current batch in the background."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        self._pending_events = 0
+        self._pending_bytes = 0
+
+        task = asyncio.create_task(self._send(batch))
+        self._send_tasks.add(task)
+        task.add_done_callback(self._send_tasks.discard)
+
+    async def _send_later(self) -> None:
+        """Send the current batch after `max_linger` seconds."""
+        await asyncio.sleep(self.max_linger)
+        self._timer = None
+        self._start_send()
+
+    async def _send(self, batch: list[_PendingDelivery]) -> None:
+        """POST a batch, splitting it if its payload is rejected."""
+        body = b'{"events":[%s]}' % b",".join(
+            fragment for item in batch for fragment in item.fragments
+        )
+
+        try:
+            client = await self.get_client()
+            response = await client.post(
+                self.url,
+                content=body,
+                headers={
+                    "Content-Type": "application/json",
+                    "X-EXTERNAL-TOKEN": self.token,
+                },
+            )
+        except Exception as e:
+            # Transport errors affect every message alike, splitting won't help
+            self._resolve(batch, e)
+            return
+
+        if response.status_code == 200:
+            logger.debug("Delivered %d message(s) in one webhook request" % len(batch))
+            self._resolve(batch)
+            return
+
+        if len(batch) == 1 or response.status_code not in PAYLOAD_REJECTED_STATUSES:
+            self._resolve(
+                batch, WebhookDeliveryError(response.status_code, response.text)
+            )
+            return
+
+        logger.warning(
+            "Webhook rejected a batch of %d message(s) with HTTP %d, splitting"
+            % (len(batch), response.status_code)
+        )
+        middle = len(batch) // 2
+        await asyncio.gather(self._send(batch[:middle]), self._send(batch[middle:]))
+
+    @staticmethod
+    def _resolve(
+        batch: list[_PendingDelivery],
+        error: Optional[BaseException] = None,
+    ) -> None:
+        for item in batch:
+            if item.future.done():
+                continue
+            if error is None:
+                item.future.set_result(None)
+            else:
+                item.future.set_exception(error)
@@ -0,0 +1,314 @@
+"""
+Extraction of webhook events from HikCentral events.
+
+Door access events (check-ins and check-outs) are extracted by hand-written
+code, the worker's hot path. Other msgTypes can be given their own output
+shape in `settings.WORKER.EVENT_EXTRACTORS`, as output field -> dotted path,
+together with the fields that are required and the rules an event must
+match. Their paths are turned into accessor closures once, when the
+extractors are built: every object holding values is read by one closure,
+shared by all paths below it.
+
+The EVENT_FILTER rules are applied at ingest when ingest filtering is
+enabled. Otherwise the worker applies them before extracting.
+"""
+
+import operator
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Iterable, Optional
+
+from apps.events.rules import OPERATORS, expected_value, is_member
+from core.config import EventExtractor, EventRule, settings
+
+ANY_MSG_TYPE = "*"
+
+_EMPTY: dict[str, Any] = {}
+
+# Object of a door access event holding the person and attendance status
+INTELLI_INFO_PATH = "data.openDoorInfo.event.intelliInfo"
+
+
+def extract_access_events(
+    events: Iterable[dict[str, Any]],
+    rules: Iterable[tuple[str, str, Any]] = (),
+) -> list[dict[str, Any]]:
+    """
+    Extract the webhook events of door access events
+
+    Events missing the person, time or device are skipped, and so are
+    irregular events (e.g. a string where an object belongs).
+
+    Args:
+        events: Events as received from HikCentral
+        rules: (key, operator, expected value) of the rules the values of
+            the intelliInfo object must match, checked before the rest of
+            the event is read
+
+    Returns:
+        Webhook events, in order
+    """
+    rules = tuple(rules)
+    results = []
+    for event in events:
+        try:
+            event_data = (
+                (event.get("data") or _EMPTY).get("openDoorInfo") or _EMPTY
+            ).get("event") or _EMPTY
+            intelli_info = event_data.get("intelliInfo") or _EMPTY
+
+            rejected = False
+            for key, op, expected in rules:
+                value = intelli_info.get(key)
+                if op == "eq":
+                    rejected = value != expected
+                elif op == "in":
+                    rejected = not is_member(value, expected)
+                else:
+                    rejected = not OPERATORS[op](value, expected)
+                if rejected:
+                    break
+            if rejected:
+                continue
+
+            person_id = intelli_info.get("personId")
+            occur_time = (event_data.get("basicInfo") or _EMPTY).get("occurTime")
+
+            first_basic_info = event.get("basicInfo") or _EMPTY
+            device_id = (first_basic_info.get("device") or _EMPTY).get("id")
+            msg_type = first_basic_info.get("msgType")
+        except AttributeError:
+            continue  # A path crosses a non-object value
+
+        if not person_id or not occur_time or not device_id:
+            continue  # Skip if essential data is missing
+
+        results.append(
+            {
+                "device_id": device_id,
+                "msg_type": msg_type,
+                "occur_time": occur_time,
+                "person_id": person_id,
+                "attendance_status": intelli_info.get("attendanceStatus"),
+            }
+        )
+    return results
+
+
+def _accessor(path: tuple[str, ...]) -> Callable[[dict[str, Any]], dict[str, Any]]:
+    """
+    Build a function getting the object at a path of nested objects
+
+    The function returns an empty dict if a part of the path is missing or
+    not an object, so its keys can always be looked up with `.get()`.
+    """
+    if not path:
+        return lambda event: event
+
+    def get(event: dict[str, Any]) -> dict[str, Any]:
+        value = event
+        for key in path:
+            value = value.get(key)
+            if value.__class__ is not dict:
+                return _EMPTY
+        return value
+
+    return get
+
+
+def _check(rule: EventRule) -> Callable[[Any], bool]:
+    """Build a function telling whether a value matches a rule."""
+    expected = expected_value(rule)
+    if rule.op == "eq":
+        return partial(operator.eq, expected)
+    if rule.op == "ne":
+        return partial(operator.ne, expected)
+    if rule.op == "in":
+        return partial(is_member, values=expected)
+    if rule.op == "not_in":
+        return lambda value: not is_member(value, expected)
+    if rule.op == "present":
+        return bool
+    raise ValueError("Unknown event rule operator: %s" % rule.op)
+
+
+@dataclass(frozen=True)
+class _Plan:
+    """A configured extractor with its paths and rules turned into closures."""
+
+    # Objects holding the values, in index order
+    accessors: tuple[Callable[[dict[str, Any]], dict[str, Any]], ...]
+    # (object index, key, check): rules first, then required fields
+    checks: tuple[tuple[int, str, Callable[[Any], bool]], ...]
+    # (output field, object index, key)
+    fields: tuple[tuple[str, int, str], ...]
+
+    @classmethod
+    def build(cls, config: EventExtractor, rules: Iterable[EventRule] = ()) -> "_Plan":
+        accessors: list[Callable[[dict[str, Any]], dict[str, Any]]] = []
+        objects: dict[tuple[str, ...], int] = {}
+
+        def locate(dotted: str) -> tuple[int, str]:
+            *parent, key = dotted.split(".")
+            index = objects.get(tuple(parent))
+            if index is None:
+                index = objects[tuple(parent)] = len(accessors)
+                accessors.append(_accessor(tuple(parent)))
+            return index, key
+
+        checks = [
+            (*locate(rule.path), _check(rule)) for rule in [*rules, *config.rules]
+        ]
+        # Null, empty and 0 all count as missing
+        checks.extend(
+            (*locate(config.fields[output]), bool) for output in config.required
+        )
+        fields = tuple(
+            (output, *locate(dotted)) for output, dotted in config.fields.items()
+        )
+        return cls(tuple(accessors), tuple(checks), fields)
+
+    def matches(self, event: dict[str, Any]) -> bool:
+        objects = [get(event) for get in self.accessors]
+        for index, key, check in self.checks:
+            if not check(objects[index].get(key)):
+                return False
+        return True
+
+    def extract(self, event: dict[str, Any]) -> Optional[dict[str, Any]]:
+        objects = [get(event) for get in self.accessors]
+        for index, key, check in self.checks:
+            if not check(objects[index].get(key)):
+                return None
+        return {output: objects[index].get(key) for output, index, key in self.fields}
+
+
+class EventExtractors:
+    """Extraction of all msgTypes, door access events unless configured."""
+
+    def __init__(
+        self,
+        extractors: Iterable[EventExtractor] = (),
+        rules: Iterable[EventRule] = (),
+        msg_types: Iterable[str] = (),
+    ):
+        """
+        Args:
+            extractors: Configured extractors
+            rules: Rules every event must match, checked before the
+                extractor's own (empty if already applied at ingest)
+            msg_types: msgTypes handled at all (empty for all)
+
+        Raises:
+            ValueError: If a msgType has more than one extractor or an
+                extractor is invalid
+        """
+        rules = list(rules)
+        self._msg_types = frozenset(msg_types)
+
+        # Rules on values of the intelliInfo object are checked by the
+        # built-in extraction while it reads an event, the others beforehand
+        intelli_checks = []
+        other_rules = []
+        for rule in rules:
+            parent, _, key = rule.path.rpartition(".")
+            if parent == INTELLI_INFO_PATH:
+                intelli_checks.append((key, rule.op, expected_value(rule)))
+            else:
+                other_rules.append(rule)
+        self._intelli_checks = tuple(intelli_checks)
+        self._access_rules: Optional[_Plan] = (
+            _Plan.build(EventExtractor(fields={}), other_rules) if other_rules else None
+        )
+
+        # msgType -> plan, None for the plan of any other msgType
+        self._plans: dict[Optional[str], _Plan] = {}
+        for config in extractors:
+            if unknown := set(config.required) - config.fields.keys():
+                raise ValueError(
+                    "Required fields are not extracted: %s" % sorted(unknown)
+                )
+
+            plan = _Plan.build(config, rules)
+            for msg_type in config.msg_types:
+                key = None if msg_type == ANY_MSG_TYPE else msg_type
+                if key in self._plans:
+                    raise ValueError("More than one extractor for %s" % msg_type)
+                self._plans[key] = plan
+
+    @classmethod
+    def from_settings(cls) -> "EventExtractors":
+        if settings.EVENT_FILTER.ENABLED:
+            # Only relevant events are stored, checking again is wasted work
+            return cls(settings.WORKER.EVENT_EXTRACTORS)
+        return cls(
+            settings.WORKER.EVENT_EXTRACTORS,
+            rules=settings.EVENT_FILTER.RULES,
+            msg_types=settings.EVENT_FILTER.MSG_TYPES,
+        )
+
+    @staticmethod
+    def _msg_type(event: dict[str, Any]) -> Any:
+        info = event.get("basicInfo")
+        return info.get("msgType") if info.__class__ is dict else None
+
+    def _plan_for(self, event: dict[str, Any]) -> Optional[_Plan]:
+        msg_type = self._msg_type(event)
+        if is_member(msg_type, self._plans):
+            return self._plans[msg_type]
+        return self._plans.get(None)
+
+    def extract(self, event: dict[str, Any]) -> Optional[dict[str, Any]]:
+        """
+        Extract the webhook event of a single HikCentral event
+
+        Args:
+            event: Event as received from HikCentral
+
+        Returns:
+            Output fields or None if the event is skipped
+        """
+        extracted = self.extract_all([event])
+        return extracted[0] if extracted else None
+
+    def extract_all(self, events: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Extract the webhook events of a batch
+
+        Args:
+            events: Events as received from HikCentral
+
+        Returns:
+            Output fields of the events that are not skipped, in order
+        """
+        if self._msg_types:
+            events = [
+                event
+                for event in events
+                if event.__class__ is dict
+                and is_member(self._msg_type(event), self._msg_types)
+            ]
+        if not self._plans:
+            return self._extract_access(events)
+
+        results = []
+        for event in events:
+            if event.__class__ is not dict:
+                continue
+            plan = self._plan_for(event)
+            if plan is None:
+                results.extend(self._extract_access([event]))
+            elif (extracted := plan.extract(event)) is not None:
+                results.append(extracted)
+        return results
+
+    def _extract_access(self, events: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+        if self._access_rules is not None:
+            matches = self._access_rules.matches
+            events = [
+                event for event in events if event.__class__ is dict and matches(event)
+            ]
+        return extract_access_events(events, self._intelli_checks)
+
+
+event_extractors = EventExtractors.from_settings()
@@ -0,0 +1,167 @@
+"""
+Buffered Message status transitions.
+
+The worker records status changes here instead of issuing one UPDATE per
+transition. Transitions are coalesced per message id, so intermediate
+states that never need to be visible (e.g. processing -> done within the
+same window) are dropped, and the remaining ones are written with a single
+`UPDATE ... FROM (VALUES ...)` per flush.
+"""
+
+import asyncio
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+from loguru import logger
+
+from apps.hr.tables import Message
+
+
+@dataclass(slots=True)
+class _Transition:
+    status: str
+    last_error: Optional[str] = None
+    retry_increment: int = 0
+
+    def merge(self, newer: "_Transition") -> None:
+        """Fold a newer transition for the same message into this one."""
+        self.status = newer.status
+        if newer.last_error is not None:
+            self.last_error = newer.last_error
+        self.retry_increment += newer.retry_increment
+
+
+class StatusBuffer:
+    """
+    Coalesces Message status transitions and flushes them periodically.
+
+    Flushes happen every `flush_interval` seconds, or earlier once
+    `max_items` distinct messages are buffered. A failed flush puts the
+    transitions back so the next flush retries them.
+    """
+
+    def __init__(self, flush_interval: float = 0.5, max_items: int = 500):
+        """
+        Args:
+            flush_interval: Seconds between flushes
+            max_items: Flush early when this many messages are buffered
+        """
+        self.flush_interval = flush_interval
+        self.max_items = max_items
+
+        self._pending: dict[uuid.UUID, _Transition] = {}
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task[None]] = None
+
+    def set(
+        self,
+        message_id: uuid.UUID,
+        status: Message.Status,
+        last_error: Optional[str] = None,
+        increment_retry: bool = False,
+    ) -> None:
+        """
+        Record a status transition for a message.
+
+        Args:
+            message_id: Message row id
+            status: New status
+            last_error: Error to store (None keeps the current one)
+            increment_retry: Whether to bump retry_count by one
+        """
+        self._merge(
+            message_id,
+            _Transition(
+                status=status.value,
+                last_error=last_error,
+                retry_increment=1 if increment_retry else 0,
+            ),
+        )
+
+        if len(self._pending) >= self.max_items:
+            self._wakeup.set()
+
+    async def flush(self) -> None:
+        """Write all buffered transitions with a single UPDATE."""
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+
+            items = list(pending.items())
+            for start in range(0, len(items), self.max_items):
+                chunk = items[start : start + self.max_items]
+                try:
+                    await self._write(chunk)
+                except Exception as e:
+                    logger.error(
+                        "Failed to flush %d status transition(s): %s"
+                        % (len(items) - start, str(e))
+                    )
+                    # Put them back in front of anything recorded meanwhile
+                    newer, self._pending = self._pending, dict(items[start:])
+                    for message_id, transition in newer.items():
+                        self._merge(message_id, transition)
+                    return
+
+            logger.debug("Flushed %d status transition(s)" % len(pending))
+
+    async def start(self) -> None:
+        """Start the periodic flush task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        """Stop the periodic flush and write everything still buffered."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        await self.flush()
+
+    async def _write(self, chunk: list[tuple[uuid.UUID, _Transition]]) -> None:
+        """Apply transitions with one `UPDATE ... FROM (VALUES ...)`."""
+        values = []
+        args: list = []
+        for message_id, transition in chunk:
+            values.append("({}::uuid, {}::varchar, {}::text, {}::integer)")
+            args.extend(
+                [
+                    message_id,
+                    transition.status,
+                    transition.last_error,
+                    transition.retry_increment,
+                ]
+            )
+
+        query = (
+            "UPDATE message AS m SET "
+            "status = v.status, "
+            "last_error = COALESCE(v.last_error, m.last_error), "
+            "retry_count = m.retry_count + v.retry_increment, "
+            "updated_at = now() "
+            "FROM (VALUES %s) AS v(id, status, last_error, retry_increment) "
+            "WHERE m.id = v.id" % ", ".join(values)
+        )
+
+        await Message.raw(query, *args)
+
+    def _merge(self, message_id: uuid.UUID, transition: _Transition) -> None:
+        current = self._pending.get(message_id)
+        if current is None:
+            self._pending[message_id] = transition
+        else:
+            current.merge(transition)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+            await self.flush()
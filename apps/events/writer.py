@@ -0,0 +1,255 @@
+"""
+Buffered writer for ingested event batches.
+
+Accumulates polled batches and persists them with a single multi-row
+INSERT into the `message` table, then publishes all of them to the
+`events` stream in one Redis pipeline. Callers are released only after both
+steps have committed, so HikCentral confirmation keeps its at-least-once
+guarantee.
+
+Ingest is idempotent: the Message id is derived from the HikCentral batch id,
+and every published batch is remembered in a Redis seen-set with a TTL. A
+batch re-delivered after a crash between publishing and confirming is
+recognized with a single pipelined EXISTS and not stored or published again.
+The primary key on the derived id backs this up once the seen-set entry has
+expired.
+"""
+
+import asyncio
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+from loguru import logger
+
+from apps.hik.models.message import AnyMessageBatch, RawMessageBatch
+from apps.hr.tables import Message
+from apps.utils.metrics import metrics
+from core.mq.broker import broker
+
+# Namespace of the Message ids derived from HikCentral batch ids
+MESSAGE_ID_NAMESPACE = uuid.UUID("6f1c3b0e-8f5a-4d2b-9a7e-3c4d5e6f7a8b")
+
+SEEN_KEY_PREFIX = "hr:ingest:seen"
+
+
+def message_id_for_batch(batch_id: str) -> uuid.UUID:
+    """Get the deterministic Message id of a HikCentral batch."""
+    return uuid.uuid5(MESSAGE_ID_NAMESPACE, batch_id)
+
+
+@dataclass(slots=True)
+class _PendingMessage:
+    batch_id: str
+    # Kept apart from message.id: piccolo assigns RETURNING rows to the
+    # inserted instances by position, which is off once conflicts are skipped
+    id: uuid.UUID
+    message: Message
+    body: bytes
+    future: asyncio.Future[uuid.UUID]
+
+
+class MessageWriter:
+    """
+    Batches Message inserts and stream publishes.
+
+    A flush happens when `max_items` batches are buffered or `max_delay`
+    seconds after the first buffered batch, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        max_items: int = 50,
+        max_delay: float = 0.02,
+        stream: str = "events",
+        seen_ttl: int = 86400,
+    ):
+        """
+        Args:
+            max_items: Flush as soon as this many batches are buffered
+            max_delay: Maximum time a batch waits in the buffer (seconds)
+            stream: Redis stream to publish to
+            seen_ttl: How long published batch ids are remembered (seconds)
+        """
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self.stream = stream
+        self.seen_ttl = seen_ttl
+
+        self._pending: list[_PendingMessage] = []
+        self._pending_ids: dict[str, asyncio.Future[uuid.UUID]] = {}
+        self._timer: Optional[asyncio.Task[None]] = None
+        self._flush_tasks: set[asyncio.Task[None]] = set()
+        self._lock = asyncio.Lock()
+
+    async def write(self, batch: AnyMessageBatch) -> uuid.UUID:
+        """
+        Buffer a batch and wait until it is stored and published.
+
+        Args:
+            batch: Batch received from HikCentral, a RawMessageBatch is
+                stored and published without being serialized again
+
+        Returns:
+            ID of the Message row, the same for every delivery of the batch
+
+        Raises:
+            Exception: Whatever the flush failed with (insert or publish)
+        """
+        # Same batch delivered again while still buffered
+        if (future := self._pending_ids.get(batch.batch_id)) is not None:
+            metrics.incr("poller.duplicates")
+            return await asyncio.shield(future)
+
+        if isinstance(batch, RawMessageBatch):
+            # JSONB validates the received JSON when the row is inserted,
+            # before anything is published
+            payload, body = batch.body.decode(), batch.body
+        else:
+            payload, body = batch.model_dump(), batch.model_dump_json().encode()
+
+        message_id = message_id_for_batch(batch.batch_id)
+        message = Message(
+            id=message_id,
+            payload=payload,
+            status=Message.Status.pending,
+        )
+        future = asyncio.get_running_loop().create_future()
+        self._pending_ids[batch.batch_id] = future
+
+        self._pending.append(
+            _PendingMessage(
+                batch_id=batch.batch_id,
+                id=message_id,
+                message=message,
+                body=body,
+                future=future,
+            )
+        )
+
+        if len(self._pending) >= self.max_items:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+        return await future
+
+    async def flush(self) -> None:
+        """Persist and publish everything buffered so far."""
+        async with self._lock:
+            pending, self._pending = self._pending, []
+            self._pending_ids = {}
+            if not pending:
+                return
+
+            try:
+                fresh = await self._drop_seen(pending)
+                if fresh:
+                    fresh = await self._insert(fresh)
+                if fresh:
+                    await self._publish(fresh)
+
+            except Exception as e:
+                logger.error(
+                    "Failed to write %d message(s): %s" % (len(pending), str(e))
+                )
+                for item in pending:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                return
+
+            for item in pending:
+                if not item.future.done():
+                    item.future.set_result(item.id)
+
+            duplicates = len(pending) - len(fresh)
+            if duplicates:
+                metrics.incr("poller.duplicates", duplicates)
+                logger.info("Skipped %d already ingested batch(es)" % duplicates)
+            if fresh:
+                logger.info("Saved and published %d message(s)" % len(fresh))
+
+    async def _drop_seen(self, pending: list[_PendingMessage]) -> list[_PendingMessage]:
+        """Drop batches found in the seen-set, in one round trip."""
+        async with broker._connection.pipeline(transaction=False) as pipe:
+            for item in pending:
+                pipe.exists(self._seen_key(item.batch_id))
+            seen = await pipe.execute()
+
+        return [item for item, exists in zip(pending, seen) if not exists]
+
+    async def _insert(self, pending: list[_PendingMessage]) -> list[_PendingMessage]:
+        """
+        Store batches and return the ones still to be published.
+
+        A batch whose row already exists was stored by an earlier delivery
+        whose seen-set entry is gone. It is published again only if no
+        worker has picked it up yet.
+        """
+        # One multi-row INSERT for the whole buffer
+        inserted = await (
+            Message.insert(*(item.message for item in pending))
+            .on_conflict(action="DO NOTHING")
+            .returning(Message.id)
+        )
+        inserted_ids = {row["id"] for row in inserted}
+
+        existing = [item for item in pending if item.id not in inserted_ids]
+        if not existing:
+            return pending
+
+        unpublished = {
+            row["id"]
+            for row in await Message.select(Message.id).where(
+                Message.id.is_in([item.id for item in existing]),
+                Message.status == Message.Status.pending,
+            )
+        }
+        return [
+            item
+            for item in pending
+            if item.id in inserted_ids or item.id in unpublished
+        ]
+
+    async def _publish(self, pending: list[_PendingMessage]) -> None:
+        """Publish batches and mark them seen, atomically in one round trip."""
+        async with broker._connection.pipeline(transaction=True) as pipe:
+            for item in pending:
+                await broker.publish(
+                    item.body,
+                    stream=self.stream,
+                    headers={"event_id": str(item.id)},
+                    pipeline=pipe,
+                )
+                pipe.set(self._seen_key(item.batch_id), 1, ex=self.seen_ttl)
+            await pipe.execute()
+
+    def _seen_key(self, batch_id: str) -> str:
+        return "%s:%s" % (SEEN_KEY_PREFIX, batch_id)
+
+    async def close(self) -> None:
+        """Flush remaining batches and wait for running flushes."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        await self.flush()
+
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+
+    def _start_flush(self) -> None:
+        """Start a flush in the background and cancel the pending timer."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        task = asyncio.create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush_later(self) -> None:
+        """Flush after `max_delay` seconds."""
+        await asyncio.sleep(self.max_delay)
+        self._timer = None
+        self._start_flush()
@@ -0,0 +1,228 @@
+"""
+Circuit breaker for HikCentral OpenAPI base URLs.
+
+Tracks the outcome of recent calls per base URL. When too many of them fail
+or are too slow, the circuit opens and calls fail immediately with
+CircuitOpenError instead of waiting for timeouts and retries. After a cool
+down a single probe call is let through (half-open) to decide whether to
+close the circuit again.
+"""
+
+import time
+from collections import deque
+from contextlib import contextmanager
+from enum import Enum
+from typing import Any, Iterator
+
+import httpx
+from loguru import logger
+
+from apps.utils.metrics import metrics
+from core.config import settings
+
+from .exceptions import CircuitOpenError
+
+
+class CircuitState(str, Enum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Error-rate and latency driven circuit breaker.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 10.0,
+        open_seconds: float = 30.0,
+    ):
+        """
+        Args:
+            name: Name used in logs and health output (the base URL)
+            window: Number of recent calls the failure rate is computed over
+            min_calls: Calls needed in the window before the circuit can open
+            failure_rate: Share of failed or slow calls that opens the circuit
+            slow_call_seconds: Calls taking longer count as failures
+            open_seconds: Time the circuit stays open before a probe call
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+
+        # True for failed calls
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._state = CircuitState.closed
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> CircuitState:
+        """Current state, open turns half-open once the cool down passed."""
+        if (
+            self._state is CircuitState.open
+            and time.monotonic() - self._opened_at >= self.open_seconds
+        ):
+            self._state = CircuitState.half_open
+            self._probe_in_flight = False
+        return self._state
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until the next call may be attempted."""
+        if self.state is not CircuitState.open:
+            return 0.0
+        return max(self.open_seconds - (time.monotonic() - self._opened_at), 0.0)
+
+    def before_call(self) -> None:
+        """
+        Check whether a call may be made.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with the
+                probe call still in flight
+        """
+        state = self.state
+
+        if state is CircuitState.closed:
+            return
+
+        if state is CircuitState.half_open and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+
+        metrics.incr("hik.circuit.rejected")
+        raise CircuitOpenError(
+            "HikCentral at %s is unavailable (circuit %s)" % (self.name, state.value),
+            retry_after=self.retry_after,
+        )
+
+    def record_success(self, duration: float) -> None:
+        """Record a completed call, slow calls count as failures."""
+        if duration > self.slow_call_seconds:
+            self.record_failure()
+            return
+
+        if self._state is CircuitState.half_open:
+            self._close()
+            return
+
+        self._outcomes.append(False)
+
+    def record_failure(self) -> None:
+        """Record a failed call and open the circuit if needed."""
+        if self._state is CircuitState.half_open:
+            self._open()
+            return
+
+        self._outcomes.append(True)
+
+        if (
+            self._state is CircuitState.closed
+            and len(self._outcomes) >= self.min_calls
+            and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate
+        ):
+            self._open()
+
+    @contextmanager
+    def guard(self, track_latency: bool = True) -> Iterator[None]:
+        """
+        Wrap a single HTTP call.
+
+        Transport errors and 5xx responses (raised by raise_for_status())
+        count as failures. Any other outcome means the server answered.
+
+        Args:
+            track_latency: Count slow calls as failures. Disable for calls
+                that are slow by design (e.g. waiting for a card swipe).
+
+        Raises:
+            CircuitOpenError: If the call is not allowed
+        """
+        self.before_call()
+        started = time.monotonic()
+
+        def elapsed() -> float:
+            return time.monotonic() - started if track_latency else 0.0
+
+        try:
+            yield
+        except httpx.RequestError:
+            self.record_failure()
+            raise
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code >= 500:
+                self.record_failure()
+            else:
+                self.record_success(elapsed())
+            raise
+        except BaseException:
+            # Not an outcome of the call (e.g. cancellation), free the probe
+            self._probe_in_flight = False
+            raise
+        else:
+            self.record_success(elapsed())
+
+    def snapshot(self) -> dict[str, Any]:
+        """Get the breaker state for health checks."""
+        return {
+            "name": self.name,
+            "state": self.state.value,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": sum(self._outcomes),
+            "retry_after": round(self.retry_after, 3),
+        }
+
+    def _open(self) -> None:
+        self._state = CircuitState.open
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        metrics.incr("hik.circuit.opened")
+        metrics.set("hik.circuit.open_count", _count_open())
+        logger.warning(
+            "Circuit for %s opened, failing fast for %.0fs"
+            % (self.name, self.open_seconds)
+        )
+
+    def _close(self) -> None:
+        self._state = CircuitState.closed
+        self._outcomes.clear()
+        self._probe_in_flight = False
+        metrics.set("hik.circuit.open_count", _count_open())
+        logger.info("Circuit for %s closed" % self.name)
+
+
+# One breaker per base URL, shared by all clients in the process
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(base_url: str) -> CircuitBreaker:
+    """Get the circuit breaker of a base URL, creating it from settings."""
+    breaker = _breakers.get(base_url)
+    if breaker is None:
+        breaker = _breakers[base_url] = CircuitBreaker(
+            name=base_url,
+            window=settings.HIK.CIRCUIT_WINDOW,
+            min_calls=settings.HIK.CIRCUIT_MIN_CALLS,
+            failure_rate=settings.HIK.CIRCUIT_FAILURE_RATE,
+            slow_call_seconds=settings.HIK.CIRCUIT_SLOW_CALL_SECONDS,
+            open_seconds=settings.HIK.CIRCUIT_OPEN_SECONDS,
+        )
+    return breaker
+
+
+def _count_open() -> int:
+    return sum(b._state is not CircuitState.closed for b in _breakers.values())
+
+
+def circuit_breakers() -> list[CircuitBreaker]:
+    """Get all circuit breakers created in this process."""
+    return list(_breakers.values())
@@ -1,5 +1,6 @@
 import asyncio
-from typing import Any, Awaitable, Callable, Literal, Optional
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Literal, Optional
 
 import httpx
 from loguru import logger
@@ -9,6 +10,7 @@ from apps.hik.models.area import AreaFilter, BriefArea
 from apps.hik.models.device import (
     AddDeviceResponse,
     CapturedPic,
+    Device,
     DeviceInfo,
     DeviceInfo2,
     GetDeviceInfo,
@@ -16,11 +18,18 @@ from apps.hik.models.device import (
     ImportToArea,
     TimeZone,
 )
+from apps.utils.metrics import metrics
 from core.config import settings
 
-from .exceptions import APIError, AuthenticationError, NetworkError
+from .circuit_breaker import CircuitState, get_circuit_breaker
+from .exceptions import APIError, AuthenticationError, CircuitOpenError, NetworkError
 from .models.auth import TokenRequest, TokenResponse
-from .models.message import MessageBatch, MessageSubscription
+from .models.message import (
+    AnyMessageBatch,
+    MessageBatch,
+    MessageSubscription,
+    RawMessageBatch,
+)
 from .models.person import (
     CardCollectionRequest,
     CardCollectionResponse,
@@ -38,7 +47,20 @@ from .models.person import (
     PersonPinCode,
     PersonSearchParams,
 )
-from .utils import deserialize_json, is_token_expired, serialize_json
+from .pagination import MAX_PAGE_SIZE, iter_pages
+from .polling import AdaptiveInterval
+from .rate_limit import (
+    RateLimiter,
+    create_rate_limiter,
+    endpoint_family,
+    parse_retry_after,
+)
+from .utils import (
+    deserialize_json,
+    is_token_expired,
+    serialize_json,
+    split_json_envelope,
+)
 
 ServerRegion = Literal[
     "russia",
@@ -61,6 +83,8 @@ class HikClient:
         timeout: float = settings.HIK.DEFAULT_TIMEOUT,
         connect_timeout: float = settings.HIK.DEFAULT_CONNECT_TIMEOUT,
         max_retries: int = settings.HIK.MAX_RETRIES,
+        http_client: Optional[httpx.AsyncClient] = None,
+        rate_limiter: Optional[RateLimiter] = None,
     ):
         self.app_key = app_key
         self.secret_key = secret_key
@@ -73,6 +97,16 @@ class HikClient:
         self.max_retries = max_retries
 
         self._client: Optional[httpx.AsyncClient] = None
+        # Connection pool owned by the caller and shared with other clients
+        # of the same base URL; it is not closed together with this client
+        self._shared_http_client = http_client
+
+        # Shared with all clients of the same base URL in this process
+        self.circuit_breaker = get_circuit_breaker(self.base_url)
+
+        self.rate_limiter = (
+            rate_limiter if rate_limiter is not None else create_rate_limiter(app_key)
+        )
 
         self._token: Optional[str] = self.token_data.get("access_token")
         self._token_expire_time: Optional[int] = self.token_data.get(
@@ -80,10 +114,19 @@ class HikClient:
         )  # Token expiration timestamp int
         self._user_id: Optional[str] = self.token_data.get("user_id")
 
+        # Shared by all coroutines waiting for the same token refresh
+        self._refresh_future: Optional[asyncio.Future[None]] = None
+        # Optional hook obtaining a new token, given the stale one. Set by
+        # HikClientManager to coordinate refreshes across processes.
+        self.token_refresher: Optional[
+            Callable[[Optional[str]], Awaitable[dict[str, Any]]]
+        ] = None
+
         # Polling state
         self._polling_active = False
         self._stop_signal: Optional[asyncio.Event] = None
         self._message_tasks: set[asyncio.Task[Any]] = set()
+        self._poll_interval: Optional[AdaptiveInterval] = None
 
     async def __aenter__(self) -> "HikClient":
         await self.open()
@@ -97,12 +140,15 @@ class HikClient:
             logger.warning("Client already opened")
             return
 
-        # Create HTTP client with orjson for JSON serialization
-        self._client = httpx.AsyncClient(
-            timeout=self.timeout,
-            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
-            http2=True,
-        )
+        if self._shared_http_client is not None:
+            self._client = self._shared_http_client
+        else:
+            # Create HTTP client with orjson for JSON serialization
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                http2=True,
+            )
 
         # Authenticate and get token
         await self._authenticate()
@@ -114,7 +160,8 @@ class HikClient:
             await self.stop_polling()
 
         if self._client is not None:
-            await self._client.aclose()
+            if self._client is not self._shared_http_client:
+                await self._client.aclose()
             self._client = None
         logger.info("HikClient session closed")
 
@@ -123,15 +170,67 @@ class HikClient:
             raise RuntimeError("Client not opened. Use 'async with' or call open()")
 
         if self.token_data.get("access_token") and not expired:
-            self._token = self.token_data["access_token"]
-            self._token_expire_time = self.token_data.get("expire_time")
-            self._user_id = self.token_data.get("user_id")
+            self._set_token_data(self.token_data)
         else:
-            token_request = TokenRequest(
-                app_key=self.app_key, secret_key=self.secret_key
-            )
+            await self.refresh_token(stale_token=self._token)
 
-            try:
+        logger.info(f"Authentication successful. User ID: {self._user_id}")
+        logger.info(f"Token: {self._token}")
+        logger.info(f"Token expires at: {self._token_expire_time}")
+
+    async def refresh_token(self, stale_token: Optional[str] = None) -> None:
+        """
+        Refresh the access token, single-flight.
+
+        Concurrent callers share one in-flight refresh instead of each
+        requesting a new token. If the current token already differs from
+        `stale_token`, another caller refreshed it meanwhile and nothing
+        is requested.
+
+        Args:
+            stale_token: Token the caller found expired or rejected
+        """
+        if stale_token is not None and self._token != stale_token:
+            return
+
+        if self._refresh_future is None:
+            self._refresh_future = asyncio.ensure_future(self._do_refresh_token())
+            self._refresh_future.add_done_callback(self._clear_refresh_future)
+
+        # Shielded so a cancelled waiter doesn't cancel the shared refresh
+        await asyncio.shield(self._refresh_future)
+
+    def _clear_refresh_future(self, future: asyncio.Future) -> None:
+        if self._refresh_future is future:
+            self._refresh_future = None
+
+    async def _do_refresh_token(self) -> None:
+        if self.token_refresher is not None:
+            # Coordinated with other processes sharing the same app key
+            token_data = await self.token_refresher(self._token)
+        else:
+            token_data = await self.fetch_token()
+
+        self._set_token_data(token_data)
+
+    async def fetch_token(self) -> dict[str, Any]:
+        """
+        Request a new access token from the API.
+
+        The client's current token is left untouched.
+
+        Returns:
+            Token data dictionary with access_token, expire_time, user_id
+        """
+        if self._client is None:
+            raise RuntimeError("Client not opened. Use 'async with' or call open()")
+
+        token_request = TokenRequest(app_key=self.app_key, secret_key=self.secret_key)
+
+        await self._throttle("/api/hccgw/platform/v1/token/get")
+
+        try:
+            with self.circuit_breaker.guard():
                 response = await self._client.post(
                     f"{self.base_url}/api/hccgw/platform/v1/token/get",
                     content=serialize_json(token_request.model_dump(by_alias=True)),
@@ -139,43 +238,46 @@ class HikClient:
                 )
                 response.raise_for_status()
 
-                data = deserialize_json(response.content)
-
-                if data.get("errorCode") != "0":
-                    raise AuthenticationError(
-                        data.get("message", "Authentication failed"),
-                        error_code=data.get("errorCode"),
-                    )
+            data = deserialize_json(response.content)
 
-                token_data = TokenResponse(**data["data"])
+            if data.get("errorCode") != "0":
+                raise AuthenticationError(
+                    data.get("message", "Authentication failed"),
+                    error_code=data.get("errorCode"),
+                )
 
-                self._token = token_data.access_token
-                self._token_expire_time = token_data.expire_time
-                self._user_id = token_data.user_id
+            token_data = TokenResponse(**data["data"])
+        except httpx.HTTPStatusError as e:
+            raise AuthenticationError(f"HTTP error during authentication: {e}")
+        except httpx.RequestError as e:
+            raise NetworkError(f"Network error during authentication: {e}")
+        except ValidationError as e:
+            raise AuthenticationError(f"Invalid token response format: {e}")
+
+        metrics.incr("hik.token_fetches")
+        logger.info("New access token fetched")
+
+        return {
+            "access_token": token_data.access_token,
+            "expire_time": token_data.expire_time,
+            "user_id": token_data.user_id,
+            # Lets renewal be scheduled at a fraction of the lifetime
+            "issued_at": int(time.time()),
+        }
 
-                self.token_data = {
-                    "access_token": self._token,
-                    "expire_time": self._token_expire_time,
-                    "user_id": self._user_id,
-                }
-            except httpx.HTTPStatusError as e:
-                raise AuthenticationError(f"HTTP error during authentication: {e}")
-            except httpx.RequestError as e:
-                raise NetworkError(f"Network error during authentication: {e}")
-            except ValidationError as e:
-                raise AuthenticationError(f"Invalid token response format: {e}")
+    async def _throttle(self, endpoint: str) -> None:
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire(endpoint_family(endpoint))
 
-        logger.info(f"Authentication successful. User ID: {self._user_id}")
-        logger.info(f"Token: {self._token}")
-        logger.info(f"Token expires at: {self._token_expire_time}")
+    def _set_token_data(self, token_data: dict[str, Any]) -> None:
+        self._token = token_data.get("access_token")
+        self._token_expire_time = token_data.get("expire_time")
+        self._user_id = token_data.get("user_id")
+        self.token_data = token_data
 
     async def _ensure_token_valid(self) -> None:
-        if self._token_expire_time is None:
-            await self._authenticate(expired=True)
-            return
-
-        if is_token_expired(self._token_expire_time):
-            await self._authenticate(expired=True)
+        if self._token_expire_time is None or is_token_expired(self._token_expire_time):
+            await self.refresh_token(stale_token=self._token)
 
     async def _request(
         self,
@@ -183,16 +285,32 @@ class HikClient:
         endpoint: str,
         data: Optional[list[dict[str, Any]]] = None,
         params: Optional[dict[str, Any]] = None,
+        raw_data: bool = False,
     ) -> dict[str, Any]:
+        """
+        Send a request to the API, retrying transient failures
+
+        Args:
+            method: HTTP method
+            endpoint: API endpoint path
+            data: JSON body
+            params: Query parameters
+            raw_data: Return the "data" member as JSON bytes instead of
+                parsing it, see split_json_envelope()
+
+        Returns:
+            Response envelope
+        """
         if self._client is None:
             raise RuntimeError("Client not opened. Use 'async with' or call open()")
 
         await self._ensure_token_valid()
 
+        token = self._token
         url = f"{self.base_url}{endpoint}"
         headers = {
             "Content-Type": "application/json",
-            "Token": self._token or "",
+            "Token": token or "",
         }
 
         content = serialize_json(data) if data else None
@@ -200,17 +318,24 @@ class HikClient:
         # Retry logic with exponential backoff
         last_exception = None
         for attempt in range(self.max_retries):
+            await self._throttle(endpoint)
             try:
-                response = await self._client.request(
-                    method=method,
-                    url=url,
-                    content=content,
-                    headers=headers,
-                    params=params,
-                )
-                response.raise_for_status()
+                # Fails fast with CircuitOpenError, which is not retried
+                with self.circuit_breaker.guard():
+                    response = await self._client.request(
+                        method=method,
+                        url=url,
+                        content=content,
+                        headers=headers,
+                        params=params,
+                    )
+                    response.raise_for_status()
 
-                result = deserialize_json(response.content)
+                if raw_data:
+                    result, raw = split_json_envelope(response.content)
+                    result["data"] = raw
+                else:
+                    result = deserialize_json(response.content)
 
                 if result.get("errorCode") == "0":
                     return result
@@ -219,8 +344,8 @@ class HikClient:
                 if error_code == "OPEN000006":
                     # Token expired, re-authenticate and retry
                     logger.warning("Token expired during request, re-authenticating...")
-                    await self._authenticate(expired=True)
-                    return await self._request(method, endpoint, data, params)
+                    await self.refresh_token(stale_token=token)
+                    return await self._request(method, endpoint, data, params, raw_data)
 
                 raise APIError(
                     message=result.get("message", "API request failed"),
@@ -233,6 +358,18 @@ class HikClient:
                     message=f"HTTP error: {e}",
                     status_code=e.response.status_code,
                 )
+                if e.response.status_code == 429:
+                    retry_after = parse_retry_after(
+                        e.response.headers.get("Retry-After")
+                    )
+                    if retry_after is not None and attempt < self.max_retries - 1:
+                        # Honor the server's hint instead of the fixed backoff
+                        if self.rate_limiter is not None:
+                            await self.rate_limiter.block(retry_after)
+                        else:
+                            await asyncio.sleep(retry_after)
+                        continue
+
                 # Don't retry on client errors (4xx) except 429
                 if (
                     400 <= e.response.status_code < 500
@@ -388,6 +525,44 @@ class HikClient:
 
         return GetDevicesResVo(**result.get("data", {}))
 
+    async def iter_devices(
+        self,
+        page_size: int = MAX_PAGE_SIZE,
+        prefetch: int = settings.HIK.PAGE_PREFETCH,
+        area_id: Optional[str] = None,
+        device_category: Optional[str] = None,
+        match_key: Optional[str] = None,
+        job_number: Optional[str] = None,
+    ) -> AsyncIterator[Device]:
+        """
+        Iterate over all devices, prefetching the next pages
+
+        Args:
+            page_size: Number of records per page (1-500)
+            prefetch: Number of pages requested ahead of the current one
+            area_id: Area ID (optional)
+            device_category: Device category (optional)
+            match_key: Fuzzy search for device name, serial No., version (optional)
+            job_number: Work order No. (optional, max length 128)
+
+        Yields:
+            Device objects
+        """
+
+        async def fetch_page(page_index: int) -> list[Device]:
+            page = await self.get_device_list(
+                page_index=page_index,
+                page_size=page_size,
+                area_id=area_id,
+                device_category=device_category,
+                match_key=match_key,
+                job_number=job_number,
+            )
+            return page.devices
+
+        async for device in iter_pages(fetch_page, page_size, prefetch):
+            yield device
+
     async def device_detail(
         self,
         serial_no: str,
@@ -519,6 +694,32 @@ class HikClient:
         area_list = result.get("data", {}).get("area", [])
         return [BriefArea(**area) for area in area_list]
 
+    async def iter_areas(
+        self,
+        page_size: int = MAX_PAGE_SIZE,
+        prefetch: int = settings.HIK.PAGE_PREFETCH,
+        filter: Optional[AreaFilter] = None,
+    ) -> AsyncIterator[BriefArea]:
+        """
+        Iterate over all areas, prefetching the next pages
+
+        Args:
+            page_size: Number of records per page (1-500)
+            prefetch: Number of pages requested ahead of the current one
+            filter: AreaFilter object for filtering (optional)
+
+        Yields:
+            BriefArea objects
+        """
+
+        async def fetch_page(page_index: int) -> list[BriefArea]:
+            return await self.get_area(
+                page_index=page_index, page_size=page_size, filter=filter
+            )
+
+        async for area in iter_pages(fetch_page, page_size, prefetch):
+            yield area
+
     async def get_area_detail(
         self,
         area_ids: list[str],
@@ -671,6 +872,36 @@ class HikClient:
             for group in result.get("data", {}).get("personGroupList", [])
         ]
 
+    async def iter_person_groups(
+        self,
+        parent_group_id: str = "",
+        group_name: str = "",
+        depth_traversal: bool = False,
+        group_ids: Optional[list[str]] = None,
+    ) -> AsyncIterator[PersonGroup]:
+        """
+        Iterate over person groups (departments)
+
+        The group search endpoint is not paginated, all groups arrive in a
+        single response. Provided for symmetry with the other iterators.
+
+        Args:
+            parent_group_id: Parent group ID (optional)
+            group_name: Group name for fuzzy search (optional)
+            depth_traversal: Whether to perform depth traversal (default: False)
+            group_ids: List of specific group IDs to retrieve (optional)
+
+        Yields:
+            PersonGroup objects
+        """
+        for group in await self.get_person_groups(
+            parent_group_id=parent_group_id,
+            group_name=group_name,
+            depth_traversal=depth_traversal,
+            group_ids=group_ids,
+        ):
+            yield group
+
     async def get_persons(
         self,
         page_index: int = 1,
@@ -703,6 +934,32 @@ class HikClient:
         person_list = result.get("data", {}).get("personList", [])
         return [Person(**item["personInfo"]) for item in person_list]
 
+    async def iter_persons(
+        self,
+        page_size: int = MAX_PAGE_SIZE,
+        prefetch: int = settings.HIK.PAGE_PREFETCH,
+        name_filter: Optional[str] = None,
+    ) -> AsyncIterator[Person]:
+        """
+        Iterate over all persons, prefetching the next pages
+
+        Args:
+            page_size: Items per page (max 500)
+            prefetch: Number of pages requested ahead of the current one
+            name_filter: Name filter for fuzzy search
+
+        Yields:
+            Person objects
+        """
+
+        async def fetch_page(page_index: int) -> list[Person]:
+            return await self.get_persons(
+                page_index=page_index, page_size=page_size, name_filter=name_filter
+            )
+
+        async for person in iter_pages(fetch_page, page_size, prefetch):
+            yield person
+
     async def add_person(self, person: Person) -> str:
         """
         Add a new person
@@ -846,6 +1103,8 @@ class HikClient:
         collection_request = FingerprintCollectionRequest(device_serial=device_serial)
 
         # Use extended timeout for collection operations (30 seconds)
+        await self._throttle("/api/hccgw/person/v1/persons/fingercollect")
+
         url = f"{self.base_url}/api/hccgw/person/v1/persons/fingercollect"
         headers = {
             "Content-Type": "application/json",
@@ -860,10 +1119,12 @@ class HikClient:
         extended_timeout = httpx.Timeout(30.0, connect=self.timeout.connect)
 
         try:
-            response = await self._client.post(
-                url, headers=headers, content=content, timeout=extended_timeout
-            )
-            response.raise_for_status()
+            # Collection waits for the user, slow responses are expected
+            with self.circuit_breaker.guard(track_latency=False):
+                response = await self._client.post(
+                    url, headers=headers, content=content, timeout=extended_timeout
+                )
+                response.raise_for_status()
             result = deserialize_json(response.content)
 
             error_code = result.get("errorCode", "")
@@ -903,6 +1164,8 @@ class HikClient:
         collection_request = CardCollectionRequest(device_serial=device_serial)
 
         # Use extended timeout for collection operations (30 seconds)
+        await self._throttle("/api/hccgw/person/v1/persons/cardcollect")
+
         url = f"{self.base_url}/api/hccgw/person/v1/persons/cardcollect"
         headers = {
             "Content-Type": "application/json",
@@ -917,10 +1180,12 @@ class HikClient:
         extended_timeout = httpx.Timeout(30.0, connect=self.timeout.connect)
 
         try:
-            response = await self._client.post(
-                url, headers=headers, content=content, timeout=extended_timeout
-            )
-            response.raise_for_status()
+            # Collection waits for the user, slow responses are expected
+            with self.circuit_breaker.guard(track_latency=False):
+                response = await self._client.post(
+                    url, headers=headers, content=content, timeout=extended_timeout
+                )
+                response.raise_for_status()
             result = deserialize_json(response.content)
 
             error_code = result.get("errorCode", "")
@@ -962,23 +1227,31 @@ class HikClient:
             data=subscription.model_dump(by_alias=True, exclude_none=True),
         )
 
-    async def get_messages(self) -> MessageBatch | None:
+    async def get_messages(self, raw: bool = False) -> AnyMessageBatch | None:
         """
         Get messages from queue
 
+        Args:
+            raw: Keep the batch as the received JSON bytes and parse only its
+                header, for callers that forward batches without reading them
+
         Returns:
-            MessageBatch object or None if no messages
+            MessageBatch (RawMessageBatch if raw) object or None if no messages
         """
 
         result = await self._request(
             "POST",
             "/api/hccgw/rawmsg/v1/mq/messages",
+            raw_data=raw,
         )
 
         batch_data = result.get("data")
         if not batch_data:
             return None
 
+        if raw:
+            return RawMessageBatch.from_json(batch_data)
+
         return MessageBatch(**batch_data)
 
     async def confirm_messages(self, batch_id: str) -> None:
@@ -997,23 +1270,48 @@ class HikClient:
     async def start_polling(
         self,
         callback: (
-            Callable[[MessageBatch], Any] | Callable[[MessageBatch], Awaitable[Any]]
+            Callable[[AnyMessageBatch], Any]
+            | Callable[[AnyMessageBatch], Awaitable[Any]]
         ),
-        interval: float = 0.5,
+        interval: float = settings.HIK.POLL_INTERVAL,
         auto_confirm: bool = True,
         subscribe_msg_types: Optional[list[str]] = None,
+        max_in_flight: int = settings.HIK.POLL_MAX_IN_FLIGHT,
+        drain: bool = True,
+        max_interval: Optional[float] = settings.HIK.POLL_MAX_INTERVAL,
+        backoff_factor: float = settings.HIK.POLL_BACKOFF_FACTOR,
+        raw: bool = False,
     ) -> None:
         """
         Start polling for messages in the background
 
+        Polling is pipelined: up to ``max_in_flight`` batches may be fetched
+        and handed to the callback before the oldest one is confirmed.
+        Confirmations are always sent in fetch order and only after the
+        callback for that batch has succeeded (at-least-once delivery).
+
+        The delay between polls is adaptive: zero while a backlog exists,
+        ``interval`` after a non-empty batch, and growing by
+        ``backoff_factor`` per consecutive empty poll up to ``max_interval``.
+
         Args:
             callback: Callback function to handle received messages (sync or async)
             interval: Polling interval in seconds (default: 0.5)
             auto_confirm: Automatically confirm messages after callback (default: True)
             subscribe_msg_types: Message types to subscribe to (None for all)
+            max_in_flight: Maximum number of fetched but not yet confirmed
+                batches (default: 4, use 1 for strictly serial polling)
+            drain: Skip the polling interval while the server reports
+                remaining messages (default: True)
+            max_interval: Back-off ceiling for idle polling in seconds
+                (default: 10.0, None for a fixed interval)
+            backoff_factor: Interval multiplier per empty poll (default: 2.0)
+            raw: Hand RawMessageBatch objects to the callback, see
+                get_messages() (default: False)
 
         Raises:
             RuntimeError: If polling is already active
+            ValueError: If max_in_flight is less than 1
         """
         if self._polling_active:
             raise RuntimeError("Polling is already active")
@@ -1021,6 +1319,9 @@ class HikClient:
         if self._client is None:
             raise RuntimeError("Client not opened. Use 'async with' or call open()")
 
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+
         logger.info("Starting message polling...")
 
         # Subscribe to messages
@@ -1033,13 +1334,26 @@ class HikClient:
         self._stop_signal = asyncio.Event()
         self._polling_active = True
 
+        self._poll_interval = AdaptiveInterval(
+            min_interval=interval,
+            max_interval=max_interval,
+            backoff_factor=backoff_factor,
+            drain=drain,
+        )
+
         # Create and start polling task
-        task = asyncio.create_task(self._polling_loop(callback, interval, auto_confirm))
+        task = asyncio.create_task(
+            self._polling_loop(
+                callback, self._poll_interval, auto_confirm, max_in_flight, raw
+            )
+        )
         self._message_tasks.add(task)
         task.add_done_callback(self._message_tasks.discard)
 
         logger.info(
-            f"Polling started (interval: {interval}s, auto_confirm: {auto_confirm})"
+            f"Polling started (interval: {interval}-{self._poll_interval.max_interval}s, "
+            f"auto_confirm: {auto_confirm}, max_in_flight: {max_in_flight}, "
+            f"drain: {drain}, raw: {raw})"
         )
 
     async def stop_polling(self) -> None:
@@ -1073,48 +1387,123 @@ class HikClient:
     async def _polling_loop(
         self,
         callback: (
-            Callable[[MessageBatch], Any] | Callable[[MessageBatch], Awaitable[Any]]
+            Callable[[AnyMessageBatch], Any]
+            | Callable[[AnyMessageBatch], Awaitable[Any]]
         ),
-        interval: float,
+        scheduler: AdaptiveInterval,
         auto_confirm: bool,
+        max_in_flight: int = 1,
+        raw: bool = False,
     ) -> None:
         """
-        Internal polling loop that fetches and processes messages
+        Internal polling loop that fetches messages and dispatches them
+
+        Each fetched batch takes a slot in the in-flight window and is handed
+        to the callback in its own task, so the next fetch overlaps with the
+        processing of the previous batches. A separate confirmer task
+        releases the slots in fetch order. After a batch failed, no new batch
+        is fetched until the batches already in the window are done.
 
         Args:
             callback: Callback function to handle messages
-            interval: Polling interval in seconds
+            scheduler: Adaptive interval deciding the delay between polls
             auto_confirm: Whether to auto-confirm messages
+            max_in_flight: Size of the in-flight window
+            raw: Fetch batches as RawMessageBatch
         """
         logger.debug("Polling loop started")
 
+        window = asyncio.Semaphore(max_in_flight)
+        in_flight: asyncio.Queue[tuple[AnyMessageBatch, asyncio.Task[Any]]] = (
+            asyncio.Queue()
+        )
+        in_flight_ids: set[str] = set()
+        # Set by the confirmer when a batch failed
+        batch_failed = asyncio.Event()
+
+        confirmer = asyncio.create_task(
+            self._confirm_loop(
+                in_flight, in_flight_ids, window, auto_confirm, batch_failed
+            )
+        )
+        # Seconds to wait while the circuit breaker is open
+        paused_for: Optional[float] = None
+
         try:
             while self._polling_active and not (
                 self._stop_signal and self._stop_signal.is_set()
             ):
+                batch = None
+                failed = False
+                interval = scheduler.current
+
+                # Wait for a free slot in the in-flight window
+                await window.acquire()
+
+                if batch_failed.is_set():
+                    # Batches after the failed one are left unconfirmed too,
+                    # confirming resumes once they are all done
+                    await in_flight.join()
+                    batch_failed.clear()
+                dispatched = False
+                redelivered = False
+
                 try:
                     # Fetch messages
-                    batch = await self.get_messages()
+                    batch = await self.get_messages(raw=raw)
 
                     if batch and batch.batch_id and batch.batch_id != "0":
-                        # Call the callback (handle both sync and async)
-                        if asyncio.iscoroutinefunction(callback):
-                            await callback(batch)
+                        if batch.batch_id in in_flight_ids:
+                            # Server re-delivered a batch we have not confirmed yet
+                            redelivered = True
                         else:
-                            # Run sync callback in executor to avoid blocking
-                            loop = asyncio.get_event_loop()
-                            await loop.run_in_executor(None, callback, batch)
-
-                        # Auto-confirm if enabled
-                        if auto_confirm:
-                            await self.confirm_messages(batch.batch_id)
-                            logger.debug(f"Auto-confirmed batch: {batch.batch_id}")
-
-                except asyncio.CancelledError:
-                    logger.debug("Polling loop cancelled")
-                    break
+                            in_flight_ids.add(batch.batch_id)
+                            task = asyncio.create_task(
+                                self._run_callback(callback, batch)
+                            )
+                            in_flight.put_nowait((batch, task))
+                            dispatched = True
+
+                    if not redelivered:
+                        interval = scheduler.next_delay(batch)
+
+                    if paused_for is not None:
+                        logger.info("HikCentral reachable again, polling resumed")
+                        paused_for = None
+                        metrics.set("poller.paused", 0)
+
+                except CircuitOpenError as e:
+                    # Expected while HikCentral is down, not worth an error
+                    if paused_for is None:
+                        logger.warning(f"Polling paused: {e.message}")
+                        metrics.set("poller.paused", 1)
+                    paused_for = max(e.retry_after, scheduler.min_interval)
                 except Exception as e:
+                    failed = True
                     logger.error(f"Error in polling loop: {e}", exc_info=True)
+                finally:
+                    # The slot is released by the confirmer once dispatched
+                    if not dispatched:
+                        window.release()
+
+                if redelivered:
+                    # Wait for outstanding confirmations instead of re-fetching
+                    logger.debug("Batch re-delivered, waiting for confirmations")
+                    await in_flight.join()
+                    continue
+
+                if paused_for is not None:
+                    # Sleep until the circuit lets a probe call through
+                    interval = paused_for
+                elif failed:
+                    # Errors keep the current interval, they are not idle polls
+                    interval = scheduler.current
+                metrics.set("poller.interval_seconds", scheduler.current)
+                metrics.set("poller.idle_streak", scheduler.idle_streak)
+
+                # Drain the backlog without waiting
+                if interval <= 0:
+                    continue
 
                 # Wait for next poll
                 try:
@@ -1131,17 +1520,104 @@ class HikClient:
                 except asyncio.TimeoutError:
                     pass  # Normal timeout, continue polling
 
+            # Let batches already fetched finish and get confirmed
+            await in_flight.join()
+
+        except asyncio.CancelledError:
+            logger.debug("Polling loop cancelled")
         except Exception as e:
             logger.error(f"Fatal error in polling loop: {e}", exc_info=True)
         finally:
+            confirmer.cancel()
+            await asyncio.gather(confirmer, return_exceptions=True)
             logger.debug("Polling loop ended")
 
+    async def _confirm_loop(
+        self,
+        in_flight: asyncio.Queue[tuple[AnyMessageBatch, asyncio.Task[Any]]],
+        in_flight_ids: set[str],
+        window: asyncio.Semaphore,
+        auto_confirm: bool,
+        batch_failed: asyncio.Event,
+    ) -> None:
+        """
+        Confirm dispatched batches in fetch order
+
+        A batch is confirmed only after its callback has succeeded. Batches
+        whose callback or confirmation failed are left unconfirmed so the
+        server re-delivers them, and so are all batches behind them in the
+        window: confirming a later batch would acknowledge messages past the
+        failed one. Confirming resumes once the window is empty.
+
+        Args:
+            in_flight: Queue of dispatched batches with their callback tasks
+            in_flight_ids: Batch IDs currently in the window
+            window: Semaphore bounding the in-flight window
+            auto_confirm: Whether to confirm batches
+            batch_failed: Set when a batch failed, cleared by the polling loop
+        """
+        while True:
+            batch, task = await in_flight.get()
+
+            try:
+                await task
+
+                if batch_failed.is_set():
+                    logger.warning(
+                        f"Batch {batch.batch_id} not confirmed: "
+                        "an earlier batch failed"
+                    )
+                # Auto-confirm if enabled
+                elif auto_confirm:
+                    await self.confirm_messages(batch.batch_id)
+                    logger.debug(f"Auto-confirmed batch: {batch.batch_id}")
+
+            except Exception as e:
+                batch_failed.set()
+                logger.error(
+                    f"Batch {batch.batch_id} not confirmed: {e}", exc_info=True
+                )
+            finally:
+                in_flight_ids.discard(batch.batch_id)
+                window.release()
+                in_flight.task_done()
+
+    async def _run_callback(
+        self,
+        callback: (
+            Callable[[AnyMessageBatch], Any]
+            | Callable[[AnyMessageBatch], Awaitable[Any]]
+        ),
+        batch: AnyMessageBatch,
+    ) -> Any:
+        """
+        Call the polling callback (handle both sync and async)
+
+        Args:
+            callback: Callback function to handle messages
+            batch: Batch to pass to the callback
+        """
+        if asyncio.iscoroutinefunction(callback):
+            return await callback(batch)
+
+        # Run sync callback in executor to avoid blocking
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, callback, batch)
+
     # ========== Utility Methods ==========
 
     @property
     def is_authenticated(self) -> bool:
         return self._token is not None
 
+    @property
+    def is_polling(self) -> bool:
+        return self._polling_active
+
+    @property
+    def circuit_state(self) -> CircuitState:
+        return self.circuit_breaker.state
+
     @property
     def user_id(self) -> str | None:
         return self._user_id
@@ -1149,3 +1625,11 @@ class HikClient:
     @property
     def token_expires_at(self) -> int | None:
         return self._token_expire_time
+
+    @property
+    def polling_interval(self) -> float | None:
+        return self._poll_interval.current if self._poll_interval else None
+
+    @property
+    def polling_idle_streak(self) -> int:
+        return self._poll_interval.idle_streak if self._poll_interval else 0
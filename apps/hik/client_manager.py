@@ -1,43 +1,93 @@
 """
 HikClient Manager for application-level lifecycle management.
 
-Provides a singleton HikClient instance with proper startup/shutdown
-handling and token management integration.
+Provides a pool of HikClient instances, one per tenant (app key and region),
+with proper startup/shutdown handling and token management integration.
+The tenant configured in settings is the default one.
 """
 
 import asyncio
-from typing import Any, Optional
-
+import random
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, AsyncIterator, Optional
+
+import httpx
 from loguru import logger
 from redis.asyncio import Redis
 
-from apps.hik.client import HikClient
-from apps.hik.token_manager import TokenManager
+from apps.hik.client import HikClient, ServerRegion
+from apps.hik.rate_limit import create_rate_limiter
+from apps.hik.token_manager import TOKEN_KEY_PREFIX, TokenManager
+from apps.hik.utils import is_token_expired
+from apps.utils.metrics import metrics
 from core.config import settings
 
+# (app_key, region)
+TenantKey = tuple[str, ServerRegion]
+
+DEFAULT_REGION: ServerRegion = "singapore_team"
+
+
+@dataclass
+class _Tenant:
+    """A pooled client together with its token manager and renewal task."""
+
+    key: TenantKey
+    client: HikClient
+    token_manager: TokenManager
+    renewal_task: Optional[asyncio.Task] = None
+    last_used: float = field(default_factory=time.monotonic)
+    # Users holding the client through lease(), it is only closed at zero
+    leases: int = 0
+    # Removed from the pool, closed once the last lease is released
+    closing: bool = False
+
 
 class HikClientManager:
     """
-    Application-level HikClient manager with singleton pattern.
+    Application-level pool of HikClient instances keyed by tenant.
 
     Features:
-    - Single long-lived HikClient instance per application
-    - Integrated with TokenManager for token persistence
-    - Proper lifecycle management (startup/shutdown)
-    - Thread-safe client access
-    - Automatic token refresh and persistence
+    - One long-lived HikClient per (app_key, region), opened lazily
+    - Per-tenant TokenManager for token persistence
+    - LRU eviction of idle tenants with graceful close, deferred while leased
+    - HTTP/2 connection pools shared by all tenants of a base URL
+    - One pub/sub subscription for the token changes of all tenants
+    - Background token renewal ahead of expiry
     """
 
-    def __init__(self):
-        self._client: Optional[HikClient] = None
-        self._token_manager: Optional[TokenManager] = None
+    def __init__(
+        self,
+        max_clients: int = settings.HIK.CLIENT_POOL_MAX_SIZE,
+        idle_ttl: float = settings.HIK.CLIENT_POOL_IDLE_TTL,
+    ):
+        """
+        Args:
+            max_clients: Maximum number of open tenant clients
+            idle_ttl: Seconds after which an unused tenant client is closed
+        """
+        self.max_clients = max_clients
+        self.idle_ttl = idle_ttl
+
+        # Least recently used first
+        self._tenants: OrderedDict[TenantKey, _Tenant] = OrderedDict()
+        self._tenant_locks: dict[TenantKey, asyncio.Lock] = {}
+        self._http_clients: dict[str, httpx.AsyncClient] = {}
+        self._default_key: Optional[TenantKey] = None
+
         self._redis: Optional[Redis] = None
         self._lock = asyncio.Lock()
         self._initialized = False
+        self._listener_task: Optional[asyncio.Task] = None
+        self._evictor_task: Optional[asyncio.Task] = None
 
     async def initialize(self, redis_client: Redis) -> None:
         """
-        Initialize the client manager.
+        Initialize the client manager and open the default tenant.
 
         Args:
             redis_client: Redis client for token caching
@@ -51,37 +101,25 @@ class HikClientManager:
 
             self._redis = redis_client
 
-            # Create token manager
-            self._token_manager = TokenManager(
-                redis_client=redis_client,
-                app_key=settings.HIK.APP_KEY,
-                secret_key=settings.HIK.SECRET_KEY,
+            # Subscribe before any token is loaded so no change is missed
+            pubsub = await self._subscribe_token_changes()
+            self._listener_task = asyncio.create_task(
+                self._listen_token_changes(pubsub)
             )
 
-            # Try to get existing token from cache
-            token_data = await self._token_manager.get_token_data()
-
-            # Create HikClient instance
-            self._client = HikClient(
-                app_key=settings.HIK.APP_KEY,
-                secret_key=settings.HIK.SECRET_KEY,
-                token_data=token_data,  # Reuse cached token if available
-                region="singapore_team",
+            self._default_key = (settings.HIK.APP_KEY, DEFAULT_REGION)
+            await self._open_tenant(
+                settings.HIK.APP_KEY, settings.HIK.SECRET_KEY, DEFAULT_REGION
             )
 
-            # Open the client session
-            await self._client.open()
-
-            # Save the new token to cache (in case it was refreshed)
-            if self._client.token_data:
-                await self._token_manager.save_token_data(self._client.token_data)
+            self._evictor_task = asyncio.create_task(self._evict_idle_loop())
 
             self._initialized = True
             logger.info("HikClientManager initialized successfully")
 
     async def shutdown(self) -> None:
         """
-        Shutdown the client manager.
+        Shutdown the client manager and close all tenant clients.
 
         Should be called during application shutdown.
         """
@@ -90,125 +128,432 @@ class HikClientManager:
                 logger.warning("HikClientManager not initialized, nothing to shutdown")
                 return
 
-            # Save current token before closing
-            if self._client and self._client.token_data and self._token_manager:
-                try:
-                    await self._token_manager.save_token_data(self._client.token_data)
-                    logger.info("Token saved before shutdown")
-                except Exception as e:
-                    logger.error("Failed to save token during shutdown: %s" % str(e))
+            for task in (self._evictor_task, self._listener_task):
+                if task:
+                    task.cancel()
+            await asyncio.gather(
+                *(t for t in (self._evictor_task, self._listener_task) if t),
+                return_exceptions=True,
+            )
+            self._evictor_task = None
+            self._listener_task = None
 
-            # Close the client
-            if self._client:
-                await self._client.close()
-                self._client = None
+            for key in list(self._tenants):
+                await self._close_tenant(key)
 
-            self._token_manager = None
+            for http_client in self._http_clients.values():
+                await http_client.aclose()
+            self._http_clients.clear()
+
+            self._default_key = None
             self._redis = None
             self._initialized = False
 
             logger.info("HikClientManager shutdown complete")
 
-    async def get_client(self) -> HikClient:
+    async def get_client(
+        self,
+        app_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        region: ServerRegion = DEFAULT_REGION,
+    ) -> HikClient:
         """
-        Get the shared HikClient instance.
+        Get the HikClient of a tenant, opening it on first use.
+
+        The default tenant is never evicted. Clients of other tenants may be
+        closed once idle or over capacity, use lease() to hold one across
+        requests.
+
+        Args:
+            app_key: Tenant app key, the default tenant if omitted
+            secret_key: Tenant secret key, required if the tenant isn't open
+            region: Tenant server region
 
         Returns:
             HikClient instance
 
         Raises:
             RuntimeError: If manager not initialized
+            ValueError: If a tenant must be opened without secret_key
+        """
+        tenant = await self._get_tenant(app_key, secret_key, region)
+        await self._evict_over_capacity()
+        return tenant.client
+
+    @asynccontextmanager
+    async def lease(
+        self,
+        app_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        region: ServerRegion = DEFAULT_REGION,
+    ) -> AsyncIterator[HikClient]:
+        """
+        Hold the HikClient of a tenant, opening it on first use.
+
+        A leased tenant is not evicted. If it is removed from the pool
+        anyway (shutdown), its client is closed when the last lease ends.
+
+        Usage:
+            async with manager.lease(app_key, secret_key) as client:
+                await client.get_devices()
+
+        Args:
+            app_key: Tenant app key, the default tenant if omitted
+            secret_key: Tenant secret key, required if the tenant isn't open
+            region: Tenant server region
+
+        Yields:
+            HikClient instance
+
+        Raises:
+            RuntimeError: If manager not initialized
+            ValueError: If a tenant must be opened without secret_key
         """
-        if not self.is_initialized or not self._client:
+        tenant = await self._get_tenant(app_key, secret_key, region)
+        tenant.leases += 1
+        try:
+            await self._evict_over_capacity()
+            yield tenant.client
+        finally:
+            tenant.leases -= 1
+            tenant.last_used = time.monotonic()
+            if tenant.closing and not tenant.leases:
+                await self._release_tenant(tenant)
+
+    async def _get_tenant(
+        self, app_key: Optional[str], secret_key: Optional[str], region: ServerRegion
+    ) -> _Tenant:
+        if not self.is_initialized:
             raise RuntimeError(
                 "HikClientManager not initialized. "
                 "Call initialize() during application startup."
             )
 
-        # Sync token with cache before returning client
-        try:
-            await self._sync_token_with_cache()
-        except Exception as e:
-            logger.error("Failed to sync token from cache: %s" % str(e))
-            # If token sync fails due to corruption, clear and re-authenticate
-            if self._token_manager:
-                logger.warning("Clearing corrupted token and re-authenticating")
-                await self._token_manager.clear_token()
-                await self._client._authenticate(expired=True)
-                await self._token_manager.save_token_data(self._client.token_data)
-
-        return self._client
+        # Token changes are pushed by the token manager, nothing to sync here
+        metrics.incr("hik.get_client_calls")
+
+        key = self._default_key if app_key is None else (app_key, region)
+
+        tenant = self._tenants.get(key)
+        if tenant is None:
+            if secret_key is None:
+                raise ValueError("secret_key is required to open tenant %s" % key[0])
+            tenant = await self._open_tenant(key[0], secret_key, key[1])
+        else:
+            self._tenants.move_to_end(key)
+
+        tenant.last_used = time.monotonic()
+        return tenant
 
     async def refresh_token(self) -> dict[str, Any]:
         """
-        Manually trigger token refresh.
+        Manually trigger token refresh of the default tenant.
 
         Useful for testing or recovering from token issues.
 
         Returns:
             Dictionary containing new token data
         """
-        if not self.is_initialized or not self._client:
+        if not self.is_initialized or self._default_key not in self._tenants:
             raise RuntimeError("HikClientManager not initialized")
 
-        # Acquire distributed lock to ensure only one process refreshes
-        if self._token_manager:
-            lock_acquired = await self._token_manager.acquire_distributed_lock(
-                timeout=10.0
+        client = self._tenants[self._default_key].client
+
+        logger.info("Manually refreshing token...")
+        # Single-flight, in-process and across processes
+        await client.refresh_token(stale_token=client._token)
+
+        return client.token_data
+
+    async def _open_tenant(
+        self, app_key: str, secret_key: str, region: ServerRegion
+    ) -> _Tenant:
+        """Open a tenant client once, even if requested concurrently."""
+        key = (app_key, region)
+        lock = self._tenant_locks.setdefault(key, asyncio.Lock())
+
+        async with lock:
+            tenant = self._tenants.get(key)
+            if tenant is not None:
+                return tenant
+
+            # Token keys are namespaced by app key
+            token_manager = TokenManager(
+                redis_client=self._redis,
+                app_key=app_key,
+                secret_key=secret_key,
             )
-            if not lock_acquired:
-                logger.warning("Another process is refreshing token, waiting...")
-                # Wait a bit and get the new token from cache
-                await asyncio.sleep(2)
-                token_data = await self._token_manager.get_token_data()
-                if token_data:
-                    return token_data
-                raise RuntimeError("Failed to acquire lock and no token available")
-        else:
-            lock_acquired = False
+            # Changes arrive through the manager's pattern subscription
+            await token_manager.start(subscribe=False)
+            try:
+                client = await self._create_client(
+                    app_key, secret_key, region, token_manager
+                )
+            except BaseException:
+                await token_manager.stop()
+                raise
+
+            tenant = _Tenant(key=key, client=client, token_manager=token_manager)
+            # Renew ahead of expiry so requests never wait for a token
+            tenant.renewal_task = asyncio.create_task(self._renewal_loop(client))
+
+            self._tenants[key] = tenant
+            metrics.set("hik.tenants", len(self._tenants))
+            logger.info("Opened HikClient for tenant %s (%s)" % key)
+
+        return tenant
+
+    async def _create_client(
+        self,
+        app_key: str,
+        secret_key: str,
+        region: ServerRegion,
+        token_manager: TokenManager,
+    ) -> HikClient:
+        """Create and open the client of a tenant."""
+        token_data = await token_manager.get_token_data()
+
+        client = HikClient(
+            app_key=app_key,
+            secret_key=secret_key,
+            token_data=token_data,  # Reuse cached token if available
+            region=region,
+            http_client=self._get_http_client(settings.HIK.SERVERS[region]),
+            rate_limiter=create_rate_limiter(
+                app_key,
+                self._redis if settings.HIK.RATE_LIMIT_SHARED else None,
+            ),
+        )
+        # Route refreshes through the token manager so that only one
+        # process requests a new token and the others adopt it
+        client.token_refresher = partial(
+            self._refresh_shared_token, client, token_manager
+        )
+        # Push tokens written by other processes into the client
+        token_manager.on_token_change = partial(self._apply_token, client)
+
+        await client.open()
+        return client
+
+    async def _close_tenant(self, key: TenantKey) -> None:
+        """
+        Remove a tenant from the pool and close its client.
 
-        try:
-            async with self._lock:
-                logger.info("Manually refreshing token...")
-                await self._client._authenticate(expired=True)
+        A leased client is closed when its last lease is released instead.
+        """
+        tenant = self._tenants.pop(key, None)
+        self._tenant_locks.pop(key, None)
+        metrics.set("hik.tenants", len(self._tenants))
+        if tenant is None:
+            return
 
-                # Save refreshed token
-                if self._client.token_data and self._token_manager:
-                    await self._token_manager.save_token_data(self._client.token_data)
+        if tenant.leases:
+            tenant.closing = True
+            logger.info("Closing HikClient for tenant %s (%s) once released" % key)
+            return
 
-                return self._client.token_data
-        finally:
-            if lock_acquired and self._token_manager:
-                await self._token_manager.release_distributed_lock()
+        await self._release_tenant(tenant)
+
+    async def _release_tenant(self, tenant: _Tenant) -> None:
+        """Close the client of a tenant removed from the pool."""
+        key = tenant.key
+        if tenant.renewal_task:
+            tenant.renewal_task.cancel()
+            await asyncio.gather(tenant.renewal_task, return_exceptions=True)
+
+        await tenant.token_manager.stop()
+
+        # Save current token before closing
+        if tenant.client.token_data:
+            try:
+                await tenant.token_manager.save_token_data(tenant.client.token_data)
+            except Exception as e:
+                logger.error("Failed to save token of tenant %s: %s" % (key[0], e))
+
+        # Requests in flight keep working, the connection pool is shared
+        await tenant.client.close()
+        logger.info("Closed HikClient for tenant %s (%s)" % key)
+
+    def _is_evictable(self, key: TenantKey) -> bool:
+        tenant = self._tenants[key]
+        return (
+            key != self._default_key
+            and not tenant.leases
+            and not tenant.client.is_polling
+        )
+
+    async def _evict_over_capacity(self) -> None:
+        """
+        Close least recently used tenants above max_clients.
+
+        The most recently used tenant was just handed out and is kept.
+        """
+        for key in list(self._tenants)[:-1]:
+            if len(self._tenants) <= self.max_clients:
+                break
+            if self._is_evictable(key):
+                await self._close_tenant(key)
+
+    async def _evict_idle_loop(self) -> None:
+        """Close tenants unused for longer than idle_ttl until cancelled."""
+        while True:
+            await asyncio.sleep(min(self.idle_ttl, 60.0))
+
+            now = time.monotonic()
+            for key in list(self._tenants):
+                tenant = self._tenants.get(key)
+                if (
+                    tenant
+                    and now - tenant.last_used > self.idle_ttl
+                    and self._is_evictable(key)
+                ):
+                    await self._close_tenant(key)
+
+    def _get_http_client(self, base_url: str) -> httpx.AsyncClient:
+        """Get the connection pool shared by all tenants of a base URL."""
+        http_client = self._http_clients.get(base_url)
+        if http_client is None or http_client.is_closed:
+            http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(
+                    settings.HIK.DEFAULT_TIMEOUT,
+                    connect=settings.HIK.DEFAULT_CONNECT_TIMEOUT,
+                ),
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                http2=True,
+            )
+            self._http_clients[base_url] = http_client
+        return http_client
+
+    async def _subscribe_token_changes(self):
+        pubsub = self._redis.pubsub()
+        # Token channels of all app keys, see TokenManager._refreshed_channel
+        await pubsub.psubscribe(f"{TOKEN_KEY_PREFIX}:refreshed:*")
+        return pubsub
+
+    async def _listen_token_changes(self, pubsub) -> None:
+        """Forward token changes of all app keys to the open tenants."""
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    app_key = channel.rsplit(":", 1)[-1]
+
+                    for tenant in list(self._tenants.values()):
+                        if tenant.token_manager.app_key == app_key:
+                            await tenant.token_manager.handle_change(message["data"])
+
+            except asyncio.CancelledError:
+                await pubsub.aclose()
+                raise
+            except Exception as e:
+                logger.error("Token change listener error: %s" % str(e))
+                await pubsub.aclose()
+                await asyncio.sleep(1)
+
+                # Changes may have been missed while disconnected
+                try:
+                    pubsub = await self._subscribe_token_changes()
+                    for tenant in list(self._tenants.values()):
+                        await tenant.token_manager.reload()
+                except Exception as e:
+                    logger.error("Failed to resubscribe to token changes: %s" % str(e))
+
+    async def _refresh_shared_token(
+        self,
+        client: HikClient,
+        token_manager: TokenManager,
+        stale_token: Optional[str],
+    ) -> dict[str, Any]:
+        """Token refresher of a pooled client, see TokenManager.refresh()."""
+        return await token_manager.refresh(client.fetch_token, stale_token=stale_token)
+
+    def _next_renewal_delay(self, client: HikClient) -> float:
+        """
+        Seconds until the client's token should be renewed.
 
-    async def _sync_token_with_cache(self) -> None:
+        Renewal is due at TOKEN_RENEW_FRACTION of the token lifetime, minus a
+        random jitter so processes sharing the token don't renew together:
+        the first one refreshes, the others find the new token in Redis.
+        """
+        token_data = client.token_data or {}
+        expire_time = token_data.get("expire_time")
+        if not expire_time:
+            return settings.HIK.TOKEN_RENEW_RETRY_DELAY
+
+        now = time.time()
+        # Tokens cached before issued_at was recorded: use the remaining time
+        issued_at = token_data.get("issued_at") or now
+        lifetime = max(expire_time - issued_at, 0)
+
+        renew_at = issued_at + lifetime * settings.HIK.TOKEN_RENEW_FRACTION
+        renew_at -= random.uniform(0, lifetime * settings.HIK.TOKEN_RENEW_JITTER)
+
+        return max(renew_at - now, 0)
+
+    async def _renewal_loop(self, client: HikClient) -> None:
+        """Renew the client's token in the background until cancelled."""
+        while True:
+            delay = self._next_renewal_delay(client)
+            logger.info("Next token renewal in %.0f seconds" % delay)
+            # The token due for renewal, taken before the sleep: a token
+            # pushed meanwhile by another process is not stale
+            stale_token = client._token
+            await asyncio.sleep(delay)
+
+            if client._token != stale_token:
+                logger.info("Token renewed by another process, rescheduling")
+                continue
+
+            try:
+                # Adopts the token if another process renewed it already
+                await client.refresh_token(stale_token=stale_token)
+                logger.info("Token renewed in background")
+            except Exception as e:
+                logger.error("Background token renewal failed: %s" % str(e))
+                await asyncio.sleep(settings.HIK.TOKEN_RENEW_RETRY_DELAY)
+
+    def _apply_token(
+        self, client: HikClient, token_data: Optional[dict[str, Any]]
+    ) -> None:
         """
-        Sync client's token with cached token.
+        Use a token written by another process.
 
-        Ensures client uses the latest token from cache (in case another
-        process refreshed it).
+        Cleared or expired tokens are ignored, the client keeps its token
+        until a refresh replaces it.
         """
-        if not self._token_manager or not self._client:
+        if not token_data:
             return
 
-        # Check if cached token is different and valid
-        cached_token = await self._token_manager.get_valid_token()
+        access_token = token_data.get("access_token")
+        expire_time = token_data.get("expire_time")
+        if not access_token or not expire_time or is_token_expired(expire_time):
+            return
 
-        if cached_token and cached_token != self._client._token:
+        if access_token != client._token:
             logger.info("Updating client with newer cached token")
-            cached_data = await self._token_manager.get_token_data()
-
-            if cached_data:
-                self._client._token = cached_data.get("access_token")
-                self._client._token_expire_time = cached_data.get("expire_time")
-                self._client._user_id = cached_data.get("user_id")
-                self._client.token_data = cached_data
+            client._set_token_data(token_data)
 
     @property
     def is_initialized(self) -> bool:
         """Check if manager is initialized."""
         return self._initialized
 
+    @property
+    def redis(self) -> Optional[Redis]:
+        """Redis client shared with the token managers."""
+        return self._redis
+
+    @property
+    def token_manager(self) -> Optional[TokenManager]:
+        """Token manager of the default tenant."""
+        tenant = self._tenants.get(self._default_key)
+        return tenant.token_manager if tenant else None
+
 
 # Global singleton instance
 _client_manager = HikClientManager()
@@ -42,3 +42,11 @@ class ValidationError(HikClientError):
     """Raised when data validation fails"""
 
     pass
+
+
+class CircuitOpenError(NetworkError):
+    """Raised without calling the API while the circuit breaker is open"""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
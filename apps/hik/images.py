@@ -0,0 +1,234 @@
+"""
+Face photo processing off the event loop.
+
+Decoding, resizing and re-encoding a photo takes tens to hundreds of
+milliseconds of CPU time. Running it inline would stall every other request
+of the process, so photos are processed in a pool of worker processes.
+
+Normalized photos are identified by the SHA-256 digest of their JPEG bytes.
+Comparing digests instead of payloads lets callers skip photos that are
+already uploaded, and a small cache remembers which source photos were
+normalized to which digest and which digests HikCentral rejected.
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Optional
+
+from loguru import logger
+
+from apps.hik.utils import resize_image_optimal
+from apps.utils.metrics import metrics
+from core.config import settings
+
+# Defaults optimized for Hikvision face recognition, see resize_image_optimal
+FACE_IMAGE_DEFAULTS: dict[str, Any] = {
+    "max_width": 600,
+    "max_height": 800,
+    "maintain_aspect": True,
+    "quality": 85,
+    "max_file_size": 200 * 1024,
+}
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_image_pool() -> ProcessPoolExecutor:
+    """
+    Get the process pool for image processing, creating it on first use.
+
+    Workers are started with forkserver, so they do not inherit the event
+    loop, sockets or threads of the calling process.
+
+    Returns:
+        Shared ProcessPoolExecutor instance
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.HIK.IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+        logger.info(
+            "Image processing pool started with %d worker(s)"
+            % settings.HIK.IMAGE_WORKERS
+        )
+    return _pool
+
+
+def shutdown_image_pool() -> None:
+    """Stop the image processing pool if it was started."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+        logger.info("Image processing pool stopped")
+
+
+async def process_face_image(image_data: bytes, **resize_kwargs) -> bytes:
+    """
+    Resize and compress a face photo in the process pool
+
+    Args:
+        image_data: Original image data in bytes
+        **resize_kwargs: Overrides of FACE_IMAGE_DEFAULTS, see
+            resize_image_optimal()
+
+    Returns:
+        Resized image data in bytes (JPEG format)
+    """
+    kwargs = {**FACE_IMAGE_DEFAULTS, **resize_kwargs}
+    loop = asyncio.get_running_loop()
+
+    started = time.perf_counter()
+    result = await loop.run_in_executor(
+        get_image_pool(), partial(resize_image_optimal, image_data, **kwargs)
+    )
+
+    metrics.incr("hik.images.processed")
+    metrics.incr("hik.images.seconds", time.perf_counter() - started)
+    return result
+
+
+def decode_photo_base64(photo_base64: str) -> bytes:
+    """
+    Decode a Base64 encoded photo
+
+    Args:
+        photo_base64: Photo data encoded in Base64, optionally as a data URL
+
+    Returns:
+        Image data in bytes
+
+    Raises:
+        ValueError: If the photo is not valid Base64
+    """
+    # Strip the "data:image/...;base64," prefix of data URLs
+    if photo_base64.startswith("data:"):
+        photo_base64 = photo_base64.partition(",")[2]
+
+    try:
+        return base64.b64decode(photo_base64)
+    except binascii.Error as e:
+        raise ValueError("Invalid Base64 photo data: %s" % e) from e
+
+
+def photo_digest(image_data: bytes) -> str:
+    """Get the hex SHA-256 digest identifying a photo."""
+    return hashlib.sha256(image_data).hexdigest()
+
+
+async def process_face_image_base64(photo_base64: str, **resize_kwargs) -> str:
+    """
+    Resize and compress a Base64 encoded face photo in the process pool
+
+    Args:
+        photo_base64: Photo data encoded in Base64, optionally as a data URL
+        **resize_kwargs: Overrides of FACE_IMAGE_DEFAULTS
+
+    Returns:
+        Processed photo encoded in Base64
+
+    Raises:
+        ValueError: If the photo is not valid Base64
+    """
+    result = await process_face_image(
+        decode_photo_base64(photo_base64), **resize_kwargs
+    )
+    return base64.b64encode(result).decode("utf-8")
+
+
+@dataclass(frozen=True, slots=True)
+class FacePhoto:
+    """Face photo normalized for upload"""
+
+    data: bytes
+    digest: str
+
+    @property
+    def base64(self) -> str:
+        return base64.b64encode(self.data).decode("utf-8")
+
+
+async def normalize_face_photo(image_data: bytes) -> FacePhoto:
+    """
+    Normalize a face photo in the process pool and compute its digest
+
+    Normalizing is deterministic, so the same source photo always has the
+    same digest.
+
+    Args:
+        image_data: Original image data in bytes
+
+    Returns:
+        Normalized photo and the digest of its JPEG bytes
+    """
+    data = await process_face_image(image_data)
+    photo = FacePhoto(data=data, digest=photo_digest(data))
+    face_photo_cache.remember_normalized(photo_digest(image_data), photo.digest)
+    return photo
+
+
+@dataclass(frozen=True, slots=True)
+class FaceUploadStatus:
+    """Outcome of the last upload of a photo digest"""
+
+    person_id: Optional[str] = None  # Person the photo was uploaded to
+    error: Optional[str] = None  # HikCentral rejection of the photo
+    error_code: Optional[str] = None
+
+
+class FacePhotoCache:
+    """
+    Bounded LRU caches keyed by photo digest.
+
+    Maps source photo digests to the digest of their normalized photo, so an
+    unchanged photo is recognized without normalizing it again, and
+    normalized digests to their last upload status.
+    """
+
+    def __init__(self, max_size: int = 4096):
+        """
+        Args:
+            max_size: Entries kept per cache
+        """
+        self.max_size = max_size
+        self._normalized: OrderedDict[str, str] = OrderedDict()
+        self._status: OrderedDict[str, FaceUploadStatus] = OrderedDict()
+
+    def _get(self, cache: OrderedDict, key: str):
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+    def _put(self, cache: OrderedDict, key: str, value) -> None:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.max_size:
+            cache.popitem(last=False)
+
+    def normalized_digest(self, source_digest: str) -> Optional[str]:
+        """Get the normalized digest of a source photo, if known."""
+        return self._get(self._normalized, source_digest)
+
+    def remember_normalized(self, source_digest: str, digest: str) -> None:
+        self._put(self._normalized, source_digest, digest)
+
+    def upload_status(self, digest: str) -> Optional[FaceUploadStatus]:
+        """Get the last upload status of a normalized photo, if known."""
+        return self._get(self._status, digest)
+
+    def remember_upload(self, digest: str, status: FaceUploadStatus) -> None:
+        self._put(self._status, digest, status)
+
+
+face_photo_cache = FacePhotoCache(max_size=settings.HIK.FACE_CACHE_SIZE)
@@ -1,5 +1,8 @@
-from typing import Any
+import re
+from dataclasses import dataclass
+from typing import Any, Optional
 
+import orjson
 from pydantic import Field
 
 from .common import BaseModel
@@ -18,3 +21,59 @@ class MessageBatch(BaseModel):
     batch_id: str = Field(..., alias="batchId")
     remaining_number: int = Field(..., alias="remainingNumber")
     event: list[dict[str, Any]] | None = None
+
+
+_BATCH_ID = re.compile(rb'"batchId"\s*:\s*("(?:[^"\\]|\\.)*")')
+_REMAINING_NUMBER = re.compile(rb'"remainingNumber"\s*:\s*(-?\d+)')
+
+
+@dataclass(frozen=True, slots=True)
+class RawMessageBatch:
+    """
+    Message batch kept as the JSON bytes received from HikCentral
+
+    Only the batch header is parsed, the events are forwarded untouched.
+    """
+
+    batch_id: str
+    remaining_number: int
+    body: bytes  # JSON object of the batch, as in the response
+
+    @classmethod
+    def from_json(cls, body: bytes) -> Optional["RawMessageBatch"]:
+        """
+        Read the batch header from the JSON of a batch
+
+        The header fields are looked up before the events. When they are not
+        found there the batch is parsed in full instead.
+
+        Args:
+            body: JSON object of the batch
+
+        Returns:
+            RawMessageBatch object or None if the batch is empty
+        """
+        events_at = body.find(b'"event"')
+        head = body[:events_at] if events_at != -1 else body
+
+        batch_id = _BATCH_ID.search(head)
+        remaining_number = _REMAINING_NUMBER.search(head)
+        if batch_id and remaining_number:
+            return cls(
+                batch_id=orjson.loads(batch_id.group(1)),
+                remaining_number=int(remaining_number.group(1)),
+                body=body,
+            )
+
+        data = orjson.loads(body)
+        if not data:
+            return None
+        batch = MessageBatch(**data)
+        return cls(
+            batch_id=batch.batch_id,
+            remaining_number=batch.remaining_number,
+            body=body,
+        )
+
+
+AnyMessageBatch = MessageBatch | RawMessageBatch
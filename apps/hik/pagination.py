@@ -0,0 +1,77 @@
+"""
+Page prefetching for paginated list endpoints.
+"""
+
+import asyncio
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Maximum page size accepted by the list endpoints
+MAX_PAGE_SIZE = 500
+
+
+async def iter_pages(
+    fetch_page: Callable[[int], Awaitable[list[T]]],
+    page_size: int,
+    prefetch: int = 1,
+    max_pages: Optional[int] = None,
+) -> AsyncIterator[T]:
+    """
+    Stream the items of all pages, fetching ahead of the consumer.
+
+    While the items of one page are consumed, up to `prefetch` following
+    pages are already being requested. A page shorter than `page_size`
+    is the last one; requests for pages past it are cancelled.
+
+    Args:
+        fetch_page: Coroutine function returning the items of a page (1-based)
+        page_size: Page size the fetch function requests
+        prefetch: Number of pages requested ahead of the current one
+        max_pages: Stop after this many pages, if known
+
+    Yields:
+        Items of all pages in order
+    """
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError("page_size must be between 1 and %d" % MAX_PAGE_SIZE)
+    if prefetch < 0:
+        raise ValueError("prefetch must be 0 or more")
+
+    pending: deque[asyncio.Future[list[T]]] = deque()
+    next_page = 1
+
+    def schedule(count: int) -> None:
+        nonlocal next_page
+        while len(pending) < count and (max_pages is None or next_page <= max_pages):
+            pending.append(asyncio.ensure_future(fetch_page(next_page)))
+            next_page += 1
+
+    try:
+        while True:
+            schedule(1)
+            if not pending:
+                break
+
+            items = await pending.popleft()
+            last_page = len(items) < page_size
+
+            if last_page:
+                # Requests for pages past the last one are pointless
+                for future in pending:
+                    future.cancel()
+                pending.clear()
+            else:
+                # Keep the next pages loading while this one is consumed
+                schedule(prefetch)
+
+            for item in items:
+                yield item
+
+            if last_page:
+                break
+    finally:
+        for future in pending:
+            future.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
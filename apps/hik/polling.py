@@ -0,0 +1,63 @@
+from .models.message import AnyMessageBatch
+
+
+class AdaptiveInterval:
+    """
+    Polling delay driven by the message backlog and idle streaks
+
+    - Backlog (remaining_number > 0): poll again immediately
+    - Non-empty batch: snap back to the minimum interval
+    - Empty poll: back off exponentially up to the maximum interval
+    """
+
+    def __init__(
+        self,
+        min_interval: float,
+        max_interval: float | None = None,
+        backoff_factor: float = 2.0,
+        drain: bool = True,
+    ):
+        """
+        Args:
+            min_interval: Interval used while events are flowing
+            max_interval: Ceiling for the back-off (None disables back-off)
+            backoff_factor: Multiplier applied per consecutive empty poll
+            drain: Poll back-to-back while the server reports a backlog
+        """
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval or min_interval, min_interval)
+        self.backoff_factor = backoff_factor
+        self.drain = drain
+
+        self.current = min_interval
+        self.idle_streak = 0
+
+    def next_delay(self, batch: AnyMessageBatch | None) -> float:
+        """
+        Compute the delay before the next poll
+
+        Args:
+            batch: Batch returned by the last poll (None if empty)
+
+        Returns:
+            Delay in seconds
+        """
+        if batch and batch.batch_id and batch.batch_id != "0":
+            self.idle_streak = 0
+            self.current = self.min_interval
+
+            if self.drain and batch.remaining_number > 0:
+                return 0.0
+
+            return self.current
+
+        # Grow from the current interval, a power of the streak overflows
+        # after enough idle polls at the ceiling
+        self.idle_streak += 1
+        self.current = min(self.current * self.backoff_factor, self.max_interval)
+        return self.current
+
+    def reset(self) -> None:
+        """Return to the minimum interval"""
+        self.current = self.min_interval
+        self.idle_streak = 0
@@ -0,0 +1,295 @@
+"""
+Client-side rate limiting for HikCentral OpenAPI calls.
+
+Every request takes a token from the bucket of its endpoint family and from
+a global bucket for the app key. Polling requests (the "messages" family)
+may use the whole global bucket, all other requests must leave a reserved
+share of it untouched, so bulk jobs can never starve event ingestion.
+
+Buckets live in memory by default. With a Redis client they are kept in
+Redis, so all processes using the same app key share one budget.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from loguru import logger
+from redis.asyncio import Redis
+
+from apps.utils.metrics import metrics
+from core.config import settings
+
+# Endpoint path prefixes and their family, first match wins
+ENDPOINT_FAMILIES: tuple[tuple[str, str], ...] = (
+    ("/api/hccgw/rawmsg/", "messages"),
+    ("/api/hccgw/person/", "persons"),
+    ("/api/hccgw/resource/v1/device", "devices"),
+    ("/api/hccgw/platform/v1/token", "token"),
+)
+
+DEFAULT_FAMILY = "other"
+
+# Families allowed to consume the reserved share of the global bucket
+PRIORITY_FAMILIES = frozenset({"messages"})
+
+# Refills both buckets to the current time, then takes a token from each if
+# both have one (the global bucket must keep the reserve for non-priority
+# requests). Returns 0 on success, otherwise milliseconds to wait.
+_ACQUIRE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+
+local blocked_ms = redis.call('PTTL', KEYS[3])
+if blocked_ms > 0 then
+    return blocked_ms
+end
+
+local function refill(key, rate, burst)
+    local data = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(data[1]) or burst
+    local ts = tonumber(data[2]) or now
+    return math.min(burst, tokens + math.max(now - ts, 0) / 1000 * rate)
+end
+
+local family_rate, family_burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local global_rate, global_burst = tonumber(ARGV[3]), tonumber(ARGV[4])
+local reserve = tonumber(ARGV[5])
+
+local family_tokens = refill(KEYS[1], family_rate, family_burst)
+local global_tokens = refill(KEYS[2], global_rate, global_burst)
+
+local wait = 0
+if family_tokens < 1 then
+    wait = math.max(wait, (1 - family_tokens) / family_rate * 1000)
+end
+if global_tokens < 1 + reserve then
+    wait = math.max(wait, (1 + reserve - global_tokens) / global_rate * 1000)
+end
+
+if wait == 0 then
+    family_tokens = family_tokens - 1
+    global_tokens = global_tokens - 1
+end
+
+redis.call('HSET', KEYS[1], 'tokens', family_tokens, 'ts', now)
+redis.call('HSET', KEYS[2], 'tokens', global_tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(family_burst / family_rate * 1000) + 1000)
+redis.call('PEXPIRE', KEYS[2], math.ceil(global_burst / global_rate * 1000) + 1000)
+
+return math.ceil(wait)
+"""
+
+
+def endpoint_family(endpoint: str) -> str:
+    """Get the rate limit family of an endpoint path."""
+    for prefix, family in ENDPOINT_FAMILIES:
+        if endpoint.startswith(prefix):
+            return family
+    return DEFAULT_FAMILY
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header value.
+
+    Args:
+        value: Delay in seconds or an HTTP date
+
+    Returns:
+        Seconds to wait, or None if the value is missing or invalid
+    """
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class _Bucket:
+    rate: float
+    burst: float
+    tokens: float
+    updated_at: float
+
+    def refill(self, now: float) -> None:
+        elapsed = max(now - self.updated_at, 0.0)
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter with per-family budgets and a global budget.
+    """
+
+    def __init__(
+        self,
+        family_rates: dict[str, float],
+        global_rate: float,
+        burst_seconds: float = 1.0,
+        reserved_share: float = 0.2,
+        redis_client: Optional[Redis] = None,
+        key_prefix: str = "hikvision:ratelimit",
+    ):
+        """
+        Args:
+            family_rates: Requests per second for each endpoint family,
+                unknown families use the DEFAULT_FAMILY rate (the global
+                rate if that is not configured either)
+            global_rate: Requests per second for the app key as a whole
+            burst_seconds: Bucket capacity as seconds worth of rate
+            reserved_share: Share of the global bucket only polling may use
+            redis_client: Share the buckets through Redis if given
+            key_prefix: Redis key prefix, should include the app key
+        """
+        self.family_rates = family_rates
+        self.default_rate = family_rates.get(DEFAULT_FAMILY, global_rate)
+        self.global_rate = global_rate
+        self.burst_seconds = burst_seconds
+        self.redis = redis_client
+        self.key_prefix = key_prefix
+
+        self.global_burst = self._burst(global_rate)
+        # At least one token must stay usable for non-priority requests,
+        # a small burst would otherwise block them for good
+        self.reserve = max(
+            min(self.global_burst * reserved_share, self.global_burst - 1), 0.0
+        )
+
+        # In-memory state, unused in Redis mode
+        now = time.monotonic()
+        self._buckets: dict[str, _Bucket] = {}
+        self._global = _Bucket(global_rate, self.global_burst, self.global_burst, now)
+        self._blocked_until = 0.0
+
+        self._script = (
+            redis_client.register_script(_ACQUIRE_SCRIPT) if redis_client else None
+        )
+
+    def _burst(self, rate: float) -> float:
+        return max(rate * self.burst_seconds, 1.0)
+
+    def _family_rate(self, family: str) -> float:
+        return self.family_rates.get(family, self.default_rate)
+
+    async def acquire(self, family: str) -> None:
+        """
+        Wait until a request of the given family may be sent.
+
+        Args:
+            family: Endpoint family, see endpoint_family()
+        """
+        waited = 0.0
+        while True:
+            wait = await self._try_acquire(family)
+            if wait <= 0:
+                break
+
+            waited += wait
+            await asyncio.sleep(wait)
+
+        if waited:
+            metrics.incr("hik.rate_limit.waits")
+            metrics.incr("hik.rate_limit.wait_seconds", waited)
+
+    async def block(self, seconds: float) -> None:
+        """
+        Hold back all requests for the given time, e.g. after a 429.
+
+        Args:
+            seconds: Delay requested by the server (Retry-After)
+        """
+        metrics.incr("hik.rate_limit.throttled")
+        logger.warning("Rate limited by server, pausing requests for %.1fs" % seconds)
+
+        if self.redis is not None:
+            # The key's remaining TTL is the remaining block time
+            await self.redis.set(
+                f"{self.key_prefix}:blocked", 1, px=max(int(seconds * 1000), 1)
+            )
+        else:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    async def _try_acquire(self, family: str) -> float:
+        """Take a token, or return the seconds to wait before trying again."""
+        reserve = 0.0 if family in PRIORITY_FAMILIES else self.reserve
+        rate = self._family_rate(family)
+
+        if self._script is not None:
+            wait_ms = await self._script(
+                keys=[
+                    f"{self.key_prefix}:{family}",
+                    f"{self.key_prefix}:global",
+                    f"{self.key_prefix}:blocked",
+                ],
+                args=[
+                    rate,
+                    self._burst(rate),
+                    self.global_rate,
+                    self.global_burst,
+                    reserve,
+                ],
+            )
+            return int(wait_ms) / 1000
+
+        now = time.monotonic()
+        if self._blocked_until > now:
+            return self._blocked_until - now
+
+        bucket = self._buckets.get(family)
+        if bucket is None:
+            burst = self._burst(rate)
+            bucket = self._buckets[family] = _Bucket(rate, burst, burst, now)
+
+        bucket.refill(now)
+        self._global.refill(now)
+
+        wait = 0.0
+        if bucket.tokens < 1:
+            wait = max(wait, (1 - bucket.tokens) / bucket.rate)
+        if self._global.tokens < 1 + reserve:
+            wait = max(wait, (1 + reserve - self._global.tokens) / self._global.rate)
+
+        if wait == 0:
+            bucket.tokens -= 1
+            self._global.tokens -= 1
+
+        return wait
+
+
+def create_rate_limiter(
+    app_key: str,
+    redis_client: Optional[Redis] = None,
+) -> Optional[RateLimiter]:
+    """
+    Create a rate limiter for an app key from settings.
+
+    Args:
+        app_key: App key the budget belongs to
+        redis_client: Share the budget through Redis if given
+
+    Returns:
+        RateLimiter instance, or None if rate limiting is disabled
+    """
+    if not settings.HIK.RATE_LIMIT_ENABLED:
+        return None
+
+    return RateLimiter(
+        family_rates=settings.HIK.RATE_LIMITS,
+        global_rate=settings.HIK.RATE_LIMIT_GLOBAL,
+        burst_seconds=settings.HIK.RATE_LIMIT_BURST_SECONDS,
+        reserved_share=settings.HIK.RATE_LIMIT_POLL_RESERVED_SHARE,
+        redis_client=redis_client,
+        key_prefix=f"hikvision:ratelimit:{app_key}",
+    )
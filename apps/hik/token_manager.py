@@ -7,12 +7,25 @@ and sharing between different processes (poller, API server, workers).
 
 import asyncio
 import time
-from typing import Any, Optional
+import uuid
+from typing import Any, Awaitable, Callable, Optional
 
 from loguru import logger
 from redis.asyncio import Redis
 
 from apps.hik.utils import is_token_expired
+from apps.utils.metrics import metrics
+
+TOKEN_KEY_PREFIX = "hikvision:token"
+
+# Delete the lock only if it still holds our value, so an expired lock
+# re-acquired by another process is not released by us
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
 
 
 class TokenManager:
@@ -24,6 +37,9 @@ class TokenManager:
     - Shared tokens between multiple processes
     - Automatic token refresh before expiration
     - Thread-safe token acquisition with distributed locks
+    - Single-flight refresh across processes (see refresh())
+    - Pub/sub invalidation: while listening, the local copy is updated only
+      when a token is written, so reads never touch Redis
     """
 
     def __init__(
@@ -31,7 +47,7 @@ class TokenManager:
         redis_client: Redis,
         app_key: str,
         secret_key: str,
-        cache_key_prefix: str = "hikvision:token",
+        cache_key_prefix: str = TOKEN_KEY_PREFIX,
     ):
         """
         Initialize Token Manager.
@@ -53,6 +69,16 @@ class TokenManager:
         self._local_cache_ttl = 60.0  # Re-check Redis every 60 seconds
 
         self._lock = asyncio.Lock()
+        # Value identifying this instance as the distributed lock holder
+        self._lock_owner = uuid.uuid4().hex
+
+        # Keeps the local cache in sync with token writes of all processes
+        self._listener_task: Optional[asyncio.Task] = None
+        self._externally_notified = False
+        # Called with the new token data (None when cleared) on every change
+        self.on_token_change: Optional[Callable[[Optional[dict[str, Any]]], None]] = (
+            None
+        )
 
     @property
     def _token_key(self) -> str:
@@ -64,6 +90,112 @@ class TokenManager:
         """Redis key for distributed lock."""
         return f"{self.cache_key_prefix}:lock:{self.app_key}"
 
+    @property
+    def _refreshed_channel(self) -> str:
+        """Pub/sub channel announcing a written or cleared token."""
+        return f"{self.cache_key_prefix}:refreshed:{self.app_key}"
+
+    @property
+    def is_listening(self) -> bool:
+        """Whether the local cache is kept in sync with token changes."""
+        if self._externally_notified:
+            return True
+        return self._listener_task is not None and not self._listener_task.done()
+
+    async def start(self, subscribe: bool = True) -> None:
+        """
+        Load the current token and start following token changes.
+
+        Args:
+            subscribe: Subscribe to the token channel. Pass False when the
+                caller already listens (e.g. one pattern subscription for
+                many tenants) and forwards changes to handle_change().
+        """
+        if self.is_listening:
+            return
+
+        if not subscribe:
+            await self.reload()
+            self._externally_notified = True
+            return
+
+        pubsub = self.redis.pubsub()
+        # Subscribe before loading so no write in between is missed
+        await pubsub.subscribe(self._refreshed_channel)
+        await self.reload()
+
+        self._listener_task = asyncio.create_task(self._listen(pubsub))
+
+    async def stop(self) -> None:
+        """Stop following token changes."""
+        self._externally_notified = False
+        if self._listener_task:
+            self._listener_task.cancel()
+            await asyncio.gather(self._listener_task, return_exceptions=True)
+            self._listener_task = None
+
+    async def handle_change(self, access_token: bytes | str) -> None:
+        """
+        Apply a token change announced on the token channel.
+
+        Args:
+            access_token: Announced token, empty if the token was cleared
+        """
+        if isinstance(access_token, bytes):
+            access_token = access_token.decode()
+
+        # Our own write, the local copy is already current
+        if (
+            access_token
+            and self._local_cache
+            and self._local_cache.get("access_token") == access_token
+        ):
+            return
+
+        await self.reload()
+
+    async def _listen(self, pubsub) -> None:
+        """Reload the token whenever a change is announced."""
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        await self.handle_change(message["data"])
+
+            except asyncio.CancelledError:
+                await pubsub.aclose()
+                raise
+            except Exception as e:
+                logger.error("Token change listener error: %s" % str(e))
+                await pubsub.aclose()
+                await asyncio.sleep(1)
+
+                # Changes may have been missed while disconnected
+                pubsub = self.redis.pubsub()
+                try:
+                    await pubsub.subscribe(self._refreshed_channel)
+                    await self.reload()
+                except Exception as e:
+                    logger.error("Failed to resubscribe to token changes: %s" % str(e))
+
+    async def reload(self) -> None:
+        """Replace the local copy with the token stored in Redis."""
+        async with self._lock:
+            try:
+                token_data = await self._fetch_from_redis()
+            except ValueError as e:
+                logger.warning("Clearing corrupted cached token: %s" % str(e))
+                await self.redis.delete(self._token_key)
+                metrics.incr("token_manager.redis_round_trips")
+                token_data = None
+
+            self._local_cache = token_data
+            self._local_cache_time = time.time() if token_data else None
+
+        logger.info("Token cache reloaded from Redis")
+        if self.on_token_change:
+            self.on_token_change(token_data)
+
     async def get_token_data(self) -> Optional[dict[str, Any]]:
         """
         Get current token data from Redis or local cache.
@@ -131,44 +263,137 @@ class TokenManager:
         lock_acquired = await self.acquire_distributed_lock(timeout=5.0)
 
         try:
-            async with self._lock:
-                # Calculate TTL for Redis (token lifetime)
-                expire_time = token_data["expire_time"]
-                current_time = int(time.time())
-                ttl = expire_time - current_time
-
-                if ttl <= 0:
-                    logger.warning("Attempting to save already expired token")
-                    return
-
-                # Save to Redis with TTL
-                await self.redis.hset(
-                    self._token_key,
-                    mapping={
-                        "access_token": token_data["access_token"],
-                        "expire_time": str(token_data["expire_time"]),
-                        "user_id": token_data.get("user_id", ""),
-                    },
-                )
-                await self.redis.expire(self._token_key, ttl)
-
-                # Update local cache
-                self._local_cache = token_data
-                self._local_cache_time = time.time()
-
-                logger.info(
-                    f"Token saved to cache. User: {token_data.get('user_id')}, "
-                    f"Expires in: {ttl} seconds ({ttl / 3600:.1f} hours)"
-                )
+            await self._store_token_data(token_data)
         finally:
             # Always release the distributed lock
             if lock_acquired:
                 await self.release_distributed_lock()
 
+    async def refresh(
+        self,
+        fetch: Callable[[], Awaitable[dict[str, Any]]],
+        stale_token: Optional[str] = None,
+        timeout: float = 15.0,
+    ) -> dict[str, Any]:
+        """
+        Refresh the token once for all processes sharing the app key.
+
+        The process holding the distributed lock calls `fetch`, saves the
+        result and announces it on a pub/sub channel. Other processes wait
+        for that announcement (or the token key changing) and adopt the
+        new token instead of requesting their own.
+
+        Args:
+            fetch: Coroutine function requesting a new token from the API
+            stale_token: Token the caller found expired or rejected
+            timeout: How long to wait for another process's refresh before
+                fetching a token anyway
+
+        Returns:
+            Token data dictionary with access_token, expire_time, user_id
+        """
+        deadline = time.time() + timeout
+
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self._refreshed_channel)
+
+        try:
+            while time.time() < deadline:
+                # Another process may have refreshed already
+                token_data = await self._fetch_fresh_token(stale_token)
+                if token_data:
+                    return token_data
+
+                # A single quiet attempt, the lock is usually held meanwhile
+                if await self._try_acquire_lock():
+                    try:
+                        # Re-check, the previous holder may have just finished
+                        token_data = await self._fetch_fresh_token(stale_token)
+                        if token_data:
+                            return token_data
+
+                        token_data = await fetch()
+                        await self._store_token_data(token_data)
+                        return token_data
+                    finally:
+                        await self.release_distributed_lock()
+
+                # Wait for the holder's announcement; the timeout bounds the
+                # wait if it was missed or the holder died
+                await pubsub.get_message(ignore_subscribe_messages=True, timeout=0.5)
+        finally:
+            await pubsub.unsubscribe(self._refreshed_channel)
+            await pubsub.aclose()
+
+        logger.warning(
+            "No token refresh observed after %s seconds, fetching directly" % timeout
+        )
+        token_data = await fetch()
+        # The holder is stuck or gone, waiting for its lock again is pointless
+        await self._store_token_data(token_data)
+        return token_data
+
+    async def _fetch_fresh_token(
+        self, stale_token: Optional[str]
+    ) -> Optional[dict[str, Any]]:
+        """Get the token from Redis if it is valid and not the stale one."""
+        token_data = await self._fetch_from_redis()
+
+        if (
+            not token_data
+            or not token_data.get("expire_time")
+            or is_token_expired(token_data["expire_time"])
+            or token_data.get("access_token") == stale_token
+        ):
+            return None
+
+        self._local_cache = token_data
+        self._local_cache_time = time.time()
+        return token_data
+
+    async def _store_token_data(self, token_data: dict[str, Any]) -> None:
+        """Write token data to Redis and the local cache."""
+        async with self._lock:
+            # Calculate TTL for Redis (token lifetime)
+            expire_time = token_data["expire_time"]
+            current_time = int(time.time())
+            ttl = expire_time - current_time
+
+            if ttl <= 0:
+                logger.warning("Attempting to save already expired token")
+                return
+
+            mapping = {
+                "access_token": token_data["access_token"],
+                "expire_time": str(token_data["expire_time"]),
+                "user_id": token_data.get("user_id", ""),
+            }
+            if token_data.get("issued_at"):
+                mapping["issued_at"] = str(token_data["issued_at"])
+
+            # Save to Redis with TTL and announce the change
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(self._token_key, mapping=mapping)
+                pipe.expire(self._token_key, ttl)
+                pipe.publish(self._refreshed_channel, token_data["access_token"])
+                await pipe.execute()
+            metrics.incr("token_manager.redis_round_trips")
+
+            # Update local cache
+            self._local_cache = token_data
+            self._local_cache_time = time.time()
+
+            logger.info(
+                f"Token saved to cache. User: {token_data.get('user_id')}, "
+                f"Expires in: {ttl} seconds ({ttl / 3600:.1f} hours)"
+            )
+
     async def clear_token(self) -> None:
         """Clear token from both Redis and local cache."""
         async with self._lock:
             await self.redis.delete(self._token_key)
+            await self.redis.publish(self._refreshed_channel, "")
+            metrics.incr("token_manager.redis_round_trips", 2)
             self._local_cache = None
             self._local_cache_time = None
             logger.info("Token cleared from cache")
@@ -176,6 +401,7 @@ class TokenManager:
     async def _fetch_from_redis(self) -> Optional[dict[str, Any]]:
         """Fetch token data from Redis."""
         token_hash = await self.redis.hgetall(self._token_key)
+        metrics.incr("token_manager.redis_round_trips")
 
         if not token_hash:
             return None
@@ -188,9 +414,10 @@ class TokenManager:
             for key, value in token_hash.items()
         }
 
-        # Convert expire_time back to int
-        if "expire_time" in token_data:
-            token_data["expire_time"] = int(token_data["expire_time"])
+        # Convert timestamps back to int
+        for key in ("expire_time", "issued_at"):
+            if key in token_data:
+                token_data[key] = int(token_data[key])
 
         return token_data
 
@@ -199,9 +426,9 @@ class TokenManager:
         if not self._local_cache or self._local_cache_time is None:
             return False
 
-        # Check if cache is too old
+        # Check if cache is too old, unless changes are pushed to us
         cache_age = time.time() - self._local_cache_time
-        if cache_age > self._local_cache_ttl:
+        if not self.is_listening and cache_age > self._local_cache_ttl:
             return False
 
         # Check if token itself is expired
@@ -228,26 +455,48 @@ class TokenManager:
         """
         start_time = time.time()
 
-        while time.time() - start_time < timeout:
-            # Try to acquire lock with NX (only set if not exists)
-            acquired = await self.redis.set(
-                self._lock_key,
-                "1",
-                nx=True,
-                ex=lock_ttl,
-            )
-
-            if acquired:
-                logger.debug("Distributed lock acquired")
+        while True:
+            if await self._try_acquire_lock(lock_ttl):
                 return True
 
+            if time.time() - start_time >= timeout:
+                break
+
             # Lock held by another process, wait a bit
             await asyncio.sleep(0.1)
 
         logger.warning("Failed to acquire distributed lock after %s seconds" % timeout)
         return False
 
+    async def _try_acquire_lock(self, lock_ttl: int = 30) -> bool:
+        """
+        Try once to acquire the distributed lock, without waiting or logging
+        a failure.
+
+        Args:
+            lock_ttl: Lock time-to-live in seconds
+
+        Returns:
+            True if lock acquired, False if another process holds it
+        """
+        # NX: only set if not exists
+        acquired = await self.redis.set(
+            self._lock_key,
+            self._lock_owner,
+            nx=True,
+            ex=lock_ttl,
+        )
+        metrics.incr("token_manager.redis_round_trips")
+
+        if acquired:
+            logger.debug("Distributed lock acquired")
+        return bool(acquired)
+
     async def release_distributed_lock(self) -> None:
-        """Release the distributed lock."""
-        await self.redis.delete(self._lock_key)
-        logger.debug("Distributed lock released")
+        """Release the distributed lock if this instance still holds it."""
+        released = await self.redis.eval(
+            _RELEASE_LOCK_SCRIPT, 1, self._lock_key, self._lock_owner
+        )
+        metrics.incr("token_manager.redis_round_trips")
+        if released:
+            logger.debug("Distributed lock released")
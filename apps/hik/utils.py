@@ -1,8 +1,9 @@
 import base64
 import io
+import math
 import time
 from datetime import datetime
-from typing import Any
+from typing import Any, Optional
 
 import orjson
 from PIL import Image
@@ -53,6 +54,56 @@ def deserialize_json(data: bytes | str) -> dict[str, Any]:
     return orjson.loads(data)
 
 
+def split_json_envelope(
+    content: bytes, key: str = "data"
+) -> tuple[dict[str, Any], Optional[bytes]]:
+    """
+    Parse a JSON response envelope without parsing one of its object values
+
+    When the value of `key` is an object and the last member of the envelope,
+    which is how HikCentral lays out its responses, the value is sliced out
+    of `content` and only the rest of the envelope is parsed. Any other
+    layout is parsed in full and the value serialized again.
+
+    Args:
+        content: JSON response body
+        key: Envelope member to keep as raw JSON
+
+    Returns:
+        Envelope without `key`, and the JSON bytes of its value (None if the
+        value is missing or null)
+    """
+    marker = b'"%s":' % key.encode()
+    start = content.find(marker)
+    if start != -1:
+        value_start = start + len(marker)
+        while content[value_start : value_start + 1] in (b" ", b"\t", b"\r", b"\n"):
+            value_start += 1
+
+        envelope_end = content.rfind(b"}")
+        value_end = content.rfind(b"}", value_start, envelope_end) + 1
+
+        # The value must be an object directly followed by the envelope's end
+        if (
+            content[value_start : value_start + 1] == b"{"
+            and value_end > value_start
+            and not content[value_end:envelope_end].strip()
+        ):
+            try:
+                envelope = orjson.loads(
+                    content[:value_start] + b"null" + content[value_end:]
+                )
+            except orjson.JSONDecodeError:
+                envelope = None
+
+            if isinstance(envelope, dict) and envelope.pop(key, False) is None:
+                return envelope, content[value_start:value_end]
+
+    envelope = deserialize_json(content)
+    value = envelope.pop(key, None)
+    return envelope, serialize_json(value) if value is not None else None
+
+
 def format_iso_datetime(dt: datetime) -> str:
     """
     Format datetime to ISO 8601 format required by HikCentral API
@@ -89,6 +140,7 @@ def resize_image_optimal(
     maintain_aspect: bool = True,
     quality: int = 85,
     max_file_size: int = 200 * 1024,
+    min_quality: int = 50,
 ) -> bytes:
     """
     Resize image to optimal dimensions for Hikvision face recognition
@@ -100,6 +152,8 @@ def resize_image_optimal(
     - File size: ≤ 200 KB
     - Face should occupy 60-70% of frame
 
+    CPU bound, use apps.hik.images.process_face_image from async code.
+
     Args:
         image_data: Original image data in bytes
         max_width: Target width in pixels (default: 600 for 3:4 ratio)
@@ -107,6 +161,7 @@ def resize_image_optimal(
         maintain_aspect: Whether to maintain aspect ratio (default: True)
         quality: JPEG quality 1-100 (default: 85)
         max_file_size: Maximum file size in bytes (default: 200 KB)
+        min_quality: Lowest JPEG quality tried to meet max_file_size (default: 50)
 
     Returns:
         Resized image data in bytes (JPEG format)
@@ -114,6 +169,16 @@ def resize_image_optimal(
     # Load image from bytes
     img = Image.open(io.BytesIO(image_data))
 
+    # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding, as
+    # far as the result still covers the target size
+    if img.format == "JPEG":
+        if maintain_aspect:
+            scale = max(max_width / img.width, max_height / img.height)
+            draft_size = (math.ceil(img.width * scale), math.ceil(img.height * scale))
+        else:
+            draft_size = (min(img.width, max_width), min(img.height, max_height))
+        img.draft("RGB", draft_size)
+
     # Convert to RGB if necessary (remove alpha channel)
     if img.mode in ("RGBA", "LA", "P"):
         background = Image.new("RGB", img.size, (255, 255, 255))
@@ -151,24 +216,30 @@ def resize_image_optimal(
     if new_width != img.width or new_height != img.height:
         img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
 
-    # Save to bytes with quality adjustment to meet file size requirement
-    output = io.BytesIO()
-    current_quality = quality
-
-    # Try to compress to meet file size limit
-    for _ in range(5):  # Max 5 attempts
+    def encode(encode_quality: int) -> bytes:
         output = io.BytesIO()
-        img.save(output, format="JPEG", quality=current_quality, optimize=True)
-        output.seek(0)
-
-        if output.getbuffer().nbytes <= max_file_size or current_quality <= 50:
-            break
-
-        # Reduce quality by 10 for next iteration
-        current_quality -= 10
-
-    output.seek(0)
-    return output.read()
+        img.save(output, format="JPEG", quality=encode_quality, optimize=True)
+        return output.getvalue()
+
+    # Most photos fit at the requested quality
+    data = encode(quality)
+    if len(data) <= max_file_size or quality <= min_quality:
+        return data
+
+    # Bisect for the highest quality that fits, the file size grows with it
+    low, high = min_quality, quality - 1
+    data = None
+    while low <= high:
+        middle = (low + high) // 2
+        candidate = encode(middle)
+        if len(candidate) <= max_file_size:
+            data = candidate
+            low = middle + 1
+        else:
+            high = middle - 1
+
+    # Nothing fits, settle for the lowest quality
+    return data if data is not None else encode(min_quality)
 
 
 def image_to_base64(image_data: bytes, resize: bool = True, **resize_kwargs) -> str:
@@ -0,0 +1,89 @@
+"""
+Content-addressed store for biometric payloads.
+
+Face photos and fingerprint templates are large Base64 strings. They live in
+the `biometric` table, keyed by digest, so the `person` table only carries
+the digests and list queries stay small. Identical payloads are stored once.
+Payloads are loaded only when explicitly requested.
+"""
+
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from loguru import logger
+
+from apps.hr.tables import Biometric
+
+# Unreferenced payloads stored less than this ago may belong to a person
+# still being saved and are kept by prune_biometrics()
+PRUNE_GRACE = timedelta(hours=1)
+
+
+def finger_digest(finger_data: str) -> str:
+    """Get the hex SHA-256 digest of a fingerprint template."""
+    return hashlib.sha256(finger_data.encode("utf-8")).hexdigest()
+
+
+async def store_biometric(kind: Biometric.Kind, digest: str, data: str) -> None:
+    """
+    Store a payload unless one with the same digest exists.
+
+    An existing payload has its updated_at renewed instead, so that
+    prune_biometrics() running meanwhile keeps it for the person being saved.
+
+    Args:
+        kind: Payload kind
+        digest: Digest of the payload
+        data: Base64 encoded payload
+    """
+    await Biometric.insert(Biometric(digest=digest, kind=kind, data=data)).on_conflict(
+        target=Biometric.digest,
+        action="DO UPDATE",
+        values=[(Biometric.updated_at, datetime.now(timezone.utc))],
+    )
+
+
+async def load_biometrics(digests: list[Optional[str]]) -> dict[str, str]:
+    """
+    Load payloads by digest.
+
+    Args:
+        digests: Digests to load, None entries are ignored
+
+    Returns:
+        Payloads by digest, missing digests are left out
+    """
+    wanted = [digest for digest in digests if digest]
+    if not wanted:
+        return {}
+
+    rows = await Biometric.select(Biometric.digest, Biometric.data).where(
+        Biometric.digest.is_in(wanted)
+    )
+    return {row["digest"]: row["data"] for row in rows}
+
+
+async def prune_biometrics(grace: timedelta = PRUNE_GRACE) -> int:
+    """
+    Delete payloads no person references anymore.
+
+    Args:
+        grace: Keep unreferenced payloads stored less than this ago
+
+    Returns:
+        Number of deleted payloads
+    """
+    cutoff = datetime.now(timezone.utc) - grace
+    rows = await Biometric.raw(
+        "DELETE FROM biometric "
+        "WHERE updated_at < {} AND digest NOT IN ("
+        "SELECT face_digest FROM person WHERE face_digest IS NOT NULL "
+        "UNION SELECT finger_digest FROM person WHERE finger_digest IS NOT NULL"
+        ") RETURNING digest",
+        cutoff,
+    )
+
+    if rows:
+        logger.info("Pruned %d unreferenced biometric payload(s)" % len(rows))
+    return len(rows)
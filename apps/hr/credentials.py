@@ -0,0 +1,118 @@
+"""
+Concurrent credential pushes for person enrollment.
+
+After a person is created in HikCentral its photo, PIN code, fingerprint and
+card are independent requests. They are sent concurrently, so enrolling a
+fully provisioned person takes about two round trips instead of five. The
+outcome of every credential is reported, and a failed push can be
+compensated by the caller as a whole.
+"""
+
+import asyncio
+from dataclasses import asdict, dataclass
+from enum import Enum
+from typing import Any, Awaitable, Callable, Optional
+
+from apps.hik.exceptions import HikClientError
+
+
+class CredentialStatus(str, Enum):
+    applied = "applied"
+    failed = "failed"
+    cancelled = "cancelled"  # Not finished because another credential failed
+
+
+@dataclass
+class CredentialOutcome:
+    """Result of pushing one credential"""
+
+    credential: str
+    status: CredentialStatus
+    error: Optional[str] = None
+    error_code: Optional[str] = None
+
+
+class CredentialPushError(Exception):
+    """Raised when at least one credential of a person could not be pushed"""
+
+    def __init__(
+        self,
+        person_id: str,
+        outcomes: list[CredentialOutcome],
+        rolled_back: bool,
+    ):
+        self.person_id = person_id
+        self.outcomes = outcomes
+        self.rolled_back = rolled_back
+
+        failed = ", ".join(
+            "%s (%s)" % (outcome.credential, outcome.error)
+            for outcome in outcomes
+            if outcome.status == CredentialStatus.failed
+        )
+        super().__init__("Failed to push credentials: %s" % failed)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "message": str(self),
+            "person_id": self.person_id,
+            "rolled_back": self.rolled_back,
+            "credentials": [
+                {**asdict(outcome), "status": outcome.status.value}
+                for outcome in self.outcomes
+            ],
+        }
+
+
+async def push_credentials(
+    steps: dict[str, Callable[[], Awaitable[Any]]],
+    max_concurrency: int = 4,
+) -> list[CredentialOutcome]:
+    """
+    Run credential pushes concurrently.
+
+    The first failure cancels the pushes still running, their work is
+    undone by the caller's compensation anyway.
+
+    Args:
+        steps: Coroutine functions pushing one credential each, by name
+        max_concurrency: Maximum number of pushes in flight
+
+    Returns:
+        Outcome of every step, in the order of `steps`
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(step: Callable[[], Awaitable[Any]]) -> None:
+        async with semaphore:
+            await step()
+
+    tasks = {name: asyncio.create_task(run(step)) for name, step in steps.items()}
+    if not tasks:
+        return []
+
+    try:
+        await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    outcomes = []
+    for name, task in tasks.items():
+        if task.cancelled():
+            outcomes.append(CredentialOutcome(name, CredentialStatus.cancelled))
+        elif (error := task.exception()) is not None:
+            outcomes.append(
+                CredentialOutcome(
+                    name,
+                    CredentialStatus.failed,
+                    error=str(error),
+                    error_code=(
+                        error.error_code if isinstance(error, HikClientError) else None
+                    ),
+                )
+            )
+        else:
+            outcomes.append(CredentialOutcome(name, CredentialStatus.applied))
+    return outcomes
@@ -6,6 +6,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import JSONResponse
 from loguru import logger
 
+from apps.hik.circuit_breaker import CircuitState, circuit_breakers
 from apps.hik.client import HikClient
 from apps.hik.client_manager import get_hik_client, get_hik_client_manager
 from apps.hr.models import (
@@ -13,8 +14,12 @@ from apps.hr.models import (
     CardCollectResponse,
     FingerprintCollectRequest,
     FingerprintCollectResponse,
+    PersonBiometricsResponse,
 )
-from apps.hr.tables import Message
+from apps.hr.biometrics import load_biometrics
+from apps.hr.reconcile import Reconciler
+from apps.hr.tables import Message, Person
+from apps.utils.metrics import read_metrics
 from core.mq.broker import broker
 
 router = APIRouter()
@@ -85,6 +90,45 @@ async def collect_card(
         )
 
 
+@router.get(
+    "/persons/{person_id}/biometrics",
+    response_model=PersonBiometricsResponse,
+    tags=["Persons"],
+)
+async def get_person_biometrics(person_id: str):
+    """
+    Get the face photo and fingerprint data of a person.
+
+    Person listings only carry the digests of these payloads, they are
+    loaded here on request.
+    """
+    person = (
+        await Person.select(
+            Person.person_id,
+            Person.face_digest,
+            Person.finger_digest,
+        )
+        .where(Person.person_id == person_id)
+        .first()
+    )
+
+    if person is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Person with id %s not found" % person_id,
+        )
+
+    payloads = await load_biometrics([person["face_digest"], person["finger_digest"]])
+
+    return PersonBiometricsResponse(
+        person_id=person["person_id"],
+        face_digest=person["face_digest"],
+        face_data=payloads.get(person["face_digest"]),
+        finger_digest=person["finger_digest"],
+        finger_data=payloads.get(person["finger_digest"]),
+    )
+
+
 @router.post("/admin/refresh-token", tags=["Admin"])
 async def refresh_hikvision_token():
     """
@@ -149,8 +193,8 @@ async def get_token_status():
             )
 
         # Access token manager through the client manager
-        if manager._token_manager:
-            token_data = await manager._token_manager.get_token_data()
+        if manager.token_manager:
+            token_data = await manager.token_manager.get_token_data()
 
             if token_data:
                 current_time = int(datetime.now().timestamp())
@@ -185,6 +229,97 @@ async def get_token_status():
         )
 
 
+@router.get("/admin/metrics", tags=["Admin"])
+async def get_metrics():
+    """
+    Get the latest metrics published by the app, poller and worker processes.
+
+    Includes polling state such as the current adaptive interval and the
+    idle streak, keyed by component and host.
+    """
+    try:
+        manager = await get_hik_client_manager()
+
+        if not manager.redis:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="HikClient manager not initialized",
+            )
+
+        return JSONResponse(content=await read_metrics(manager.redis))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Failed to read metrics: %s" % str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to read metrics: %s" % str(e),
+        )
+
+
+@router.get("/admin/hik-health", tags=["Admin"])
+async def get_hik_health():
+    """
+    Get the HikCentral circuit breaker state of this process.
+
+    Responds with 503 while any circuit is open, so it can back a health
+    check. Requests to an open circuit fail immediately without calling
+    HikCentral.
+    """
+    breakers = [breaker.snapshot() for breaker in circuit_breakers()]
+    healthy = all(b["state"] != CircuitState.open.value for b in breakers)
+
+    return JSONResponse(
+        status_code=(
+            status.HTTP_200_OK if healthy else status.HTTP_503_SERVICE_UNAVAILABLE
+        ),
+        content={"healthy": healthy, "circuits": breakers},
+    )
+
+
+@router.post("/admin/reconcile", tags=["Admin"])
+async def reconcile_hikvision(full: bool = False, dry_run: bool = False):
+    """
+    Reconcile the Area, Group, Device and Person tables with HikCentral.
+
+    Only rows that differ are written, pages unchanged since the last run
+    are skipped. Use `full` to compare every page with the database and
+    `dry_run` to only report the diff.
+
+    Returns the diff summary per table.
+    """
+    try:
+        manager = await get_hik_client_manager()
+
+        if not manager.is_initialized:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="HikClient manager not initialized",
+            )
+
+        reconciler = Reconciler(
+            await manager.get_client(),
+            redis_client=manager.redis,
+            full=full,
+            dry_run=dry_run,
+        )
+        summary = await reconciler.run()
+
+        return JSONResponse(content=summary.as_dict())
+
+    except HTTPException:
+        raise
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except Exception as e:
+        logger.error("Failed to reconcile with HikVision: %s" % str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to reconcile with HikVision: %s" % str(e),
+        )
+
+
 @router.post(
     "/persons/send-fake-event",
     tags=["Persons"],
@@ -1,15 +1,124 @@
+from functools import partial
+
 from loguru import logger
 from starlette.exceptions import HTTPException
 
+from apps.hik.client import HikClient
+from apps.hik.exceptions import APIError
+from apps.hik.images import (
+    FacePhoto,
+    FaceUploadStatus,
+    decode_photo_base64,
+    face_photo_cache,
+    normalize_face_photo,
+    photo_digest,
+)
 from apps.hik.models.person import Person as HikPerson
 from apps.hik.models.person import PersonCardUpdate, PersonFingerprintUpdate
+from apps.hr.biometrics import finger_digest, store_biometric
+from apps.hr.credentials import (
+    CredentialPushError,
+    CredentialStatus,
+    push_credentials,
+)
 from apps.hr.hooks.base import BaseHikHook
-from apps.hr.tables import Person
+from apps.hr.tables import Biometric, Person
+from core.config import settings
 
 
 class PersonHook(BaseHikHook):
     """Hook for Person CRUD operations with HikVision API integration"""
 
+    @staticmethod
+    def _raise_if_rejected(photo: FacePhoto) -> None:
+        """Fail without a request if HikCentral already rejected the photo."""
+        status = face_photo_cache.upload_status(photo.digest)
+        if status is not None and status.error is not None:
+            raise APIError(status.error, error_code=status.error_code)
+
+    async def _upload_photo(
+        self, client: HikClient, person_id: str, photo: FacePhoto
+    ) -> None:
+        """
+        Upload a normalized face photo unless it is known to be rejected.
+
+        Args:
+            client: HikClient instance
+            person_id: Person to upload the photo to
+            photo: Normalized face photo
+        """
+        self._raise_if_rejected(photo)
+
+        try:
+            await client.update_person_photo(
+                person_id=person_id, photo_base64=photo.base64
+            )
+        except APIError as e:
+            # The same photo would be rejected again, e.g. no face detected
+            face_photo_cache.remember_upload(
+                photo.digest,
+                FaceUploadStatus(error=e.message, error_code=e.error_code),
+            )
+            raise
+
+        face_photo_cache.remember_upload(
+            photo.digest, FaceUploadStatus(person_id=person_id)
+        )
+        logger.info("Updated person photo for %s" % person_id)
+
+    async def _push_fingerprint(
+        self, client: HikClient, person_id: str, finger_data: str
+    ) -> None:
+        finger_update = PersonFingerprintUpdate(
+            id=None,  # Add new fingerprint
+            name="fingerprint",
+            data=finger_data,
+        )
+        response = await client.update_person_fingers(
+            person_id=person_id,
+            finger_list=[finger_update],
+        )
+        if response.finger_failed:
+            raise APIError(
+                "Fingerprint rejected",
+                error_code=response.finger_failed.error_code,
+            )
+        logger.info("Updated person fingerprint for %s" % person_id)
+
+    async def _push_card(self, client: HikClient, person_id: str, card_no: str) -> None:
+        card_update = PersonCardUpdate(
+            id=None,  # Add new card
+            card_no=card_no,
+        )
+        response = await client.update_person_cards(
+            person_id=person_id,
+            card_list=[card_update],
+        )
+        if response.card_failed:
+            raise APIError(
+                "Card rejected",
+                error_code=response.card_failed.error_code,
+            )
+        logger.info("Updated person card for %s" % person_id)
+
+    async def _rollback_person(self, client: HikClient, person_id: str) -> bool:
+        """
+        Delete a person created in HikVision whose enrollment failed.
+
+        Returns:
+            True if the person was deleted
+        """
+        try:
+            await client.delete_person(person_id=person_id)
+        except Exception as e:
+            logger.error(
+                "Failed to roll back person %s in HikVision: %s" % (person_id, str(e))
+            )
+            return False
+
+        logger.warning("Rolled back person %s in HikVision" % person_id)
+        return True
+
     async def pre_save(self, row: Person) -> Person:
         """
         Add person to HikVision before saving to database.
@@ -23,6 +132,14 @@ class PersonHook(BaseHikHook):
         try:
             client = await self._get_client()
 
+            # Normalize the photo first, a broken or known rejected photo
+            # fails before the person is created
+            photo = None
+            if row.face_data:
+                photo = await normalize_face_photo(decode_photo_base64(row.face_data))
+                self._raise_if_rejected(photo)
+                row.face_digest = photo.digest
+
             # Prepare person data for HikVision API
             hik_person = HikPerson(
                 person_id=None,  # Will be generated by HikVision
@@ -46,61 +163,55 @@ class PersonHook(BaseHikHook):
                 % (person_id, row.first_name, row.last_name, row.code)
             )
 
-            # If person has face data, update it
-            if row.face_data:
-                await client.update_person_photo(
-                    person_id=person_id,
-                    photo_base64=row.face_data,
-                )
-                logger.info("Updated person photo for %s" % person_id)
-
-            # If person has PIN code, update it
+            # Credentials are independent, push them concurrently
+            steps = {}
+            if photo is not None:
+                steps["photo"] = partial(self._upload_photo, client, person_id, photo)
             if row.pin_code:
-                await client.update_person_pincode(
+                steps["pin_code"] = partial(
+                    client.update_person_pincode,
                     person_id=person_id,
                     pin_code=row.pin_code,
                 )
-                logger.info("Updated person PIN code for %s" % person_id)
-
-            # If person has fingerprint data, update it
             if row.finger_data:
-                finger_update = PersonFingerprintUpdate(
-                    id=None,  # Add new fingerprint
-                    name="fingerprint",
-                    data=row.finger_data,
+                steps["fingerprint"] = partial(
+                    self._push_fingerprint, client, person_id, row.finger_data
                 )
-                response = await client.update_person_fingers(
-                    person_id=person_id,
-                    finger_list=[finger_update],
-                )
-                if response.finger_failed:
-                    logger.warning(
-                        "Failed to update fingerprint for %s: %s"
-                        % (person_id, response.finger_failed.error_code)
-                    )
-                else:
-                    logger.info("Updated person fingerprint for %s" % person_id)
-
-            # If person has card number, update it
             if row.card_no:
-                card_update = PersonCardUpdate(
-                    id=None,  # Add new card
-                    card_no=row.card_no,
-                )
-                response = await client.update_person_cards(
-                    person_id=person_id,
-                    card_list=[card_update],
+                steps["card"] = partial(self._push_card, client, person_id, row.card_no)
+
+            outcomes = await push_credentials(
+                steps, max_concurrency=settings.HIK.CREDENTIAL_PUSH_CONCURRENCY
+            )
+            if any(o.status != CredentialStatus.applied for o in outcomes):
+                rolled_back = await self._rollback_person(client, person_id)
+                raise CredentialPushError(person_id, outcomes, rolled_back)
+
+            logger.info(
+                "Pushed credentials for %s: %s"
+                % (person_id, ", ".join(o.credential for o in outcomes) or "none")
+            )
+
+            # Biometric payloads are stored by digest, outside the person row
+            if photo is not None:
+                await store_biometric(Biometric.Kind.face, photo.digest, photo.base64)
+                row.face_data = None
+            if row.finger_data:
+                row.finger_digest = finger_digest(row.finger_data)
+                await store_biometric(
+                    Biometric.Kind.finger, row.finger_digest, row.finger_data
                 )
-                if response.card_failed:
-                    logger.warning(
-                        "Failed to update card for %s: %s"
-                        % (person_id, response.card_failed.error_code)
-                    )
-                else:
-                    logger.info("Updated person card for %s" % person_id)
+                row.finger_data = None
 
             return row
 
+        except CredentialPushError as e:
+            logger.error(
+                "Failed to add person to HikVision: %s (rolled back: %s)"
+                % (str(e), e.rolled_back)
+            )
+            raise HTTPException(status_code=500, detail=e.as_dict())
+
         except Exception as e:
             logger.error("Failed to add person to HikVision: %s" % str(e))
             raise HTTPException(
@@ -120,8 +231,21 @@ class PersonHook(BaseHikHook):
             Updated values dictionary
         """
         try:
-            # Fetch current person from database
-            current_person = await Person.objects().get(Person.id == row_id)
+            # Fetch current person from database, photos are compared by digest
+            current_person = (
+                await Person.select(
+                    Person.person_id,
+                    Person.code,
+                    Person.first_name,
+                    Person.last_name,
+                    Person.face_digest,
+                    Person.pin_code,
+                    Person.finger_digest,
+                    Person.card_no,
+                )
+                .where(Person.person_id == row_id)
+                .first()
+            )
 
             if current_person is None:
                 raise HTTPException(
@@ -129,43 +253,63 @@ class PersonHook(BaseHikHook):
                     detail="Person with id %s not found" % row_id,
                 )
 
-            if not current_person.person_id:
+            if not current_person["person_id"]:
                 raise HTTPException(
                     status_code=400,
                     detail="Person %s has no person_id from HikVision"
-                    % current_person.code,
+                    % current_person["code"],
                 )
 
             client = await self._get_client()
 
             # Update photo if face_data is in values
             if "face_data" in values and values["face_data"]:
-                # Only update if changed
-                if values["face_data"] != current_person.face_data:
-                    await client.update_person_photo(
-                        person_id=current_person.person_id,
-                        photo_base64=values["face_data"],
-                    )
-                    logger.info(
-                        "Updated person photo for %s" % current_person.person_id
+                source = decode_photo_base64(values["face_data"])
+                source_digest = photo_digest(source)
+                current_digest = current_person["face_digest"]
+
+                # Either the stored normalized photo or its known source
+                if current_digest is not None and current_digest in (
+                    source_digest,
+                    face_photo_cache.normalized_digest(source_digest),
+                ):
+                    # Unchanged, do not rewrite the stored photo either
+                    del values["face_data"]
+                else:
+                    photo = await normalize_face_photo(source)
+                    if photo.digest != current_digest:
+                        await self._upload_photo(
+                            client, current_person["person_id"], photo
+                        )
+                    await store_biometric(
+                        Biometric.Kind.face, photo.digest, photo.base64
                     )
+                    values["face_data"] = None
+                    values["face_digest"] = photo.digest
 
             # Update PIN code if pin_code is in values
             if "pin_code" in values and values["pin_code"]:
                 # Only update if changed
-                if values["pin_code"] != current_person.pin_code:
+                if values["pin_code"] != current_person["pin_code"]:
                     await client.update_person_pincode(
-                        person_id=current_person.person_id,
+                        person_id=current_person["person_id"],
                         pin_code=values["pin_code"],
                     )
                     logger.info(
-                        "Updated person PIN code for %s" % current_person.person_id
+                        "Updated person PIN code for %s" % current_person["person_id"]
                     )
 
             # Update fingerprint if finger_data is in values
             if "finger_data" in values:
+                new_finger_digest = (
+                    finger_digest(values["finger_data"])
+                    if values["finger_data"]
+                    else None
+                )
                 # Only update if changed
-                if values["finger_data"] != current_person.finger_data:
+                if new_finger_digest == current_person["finger_digest"]:
+                    del values["finger_data"]
+                else:
                     if values["finger_data"]:
                         # Add/update fingerprint
                         finger_update = PersonFingerprintUpdate(
@@ -174,37 +318,46 @@ class PersonHook(BaseHikHook):
                             data=values["finger_data"],
                         )
                         response = await client.update_person_fingers(
-                            person_id=current_person.person_id,
+                            person_id=current_person["person_id"],
                             finger_list=[finger_update],
                         )
                         if response.finger_failed:
                             logger.warning(
                                 "Failed to update fingerprint for %s: %s"
                                 % (
-                                    current_person.person_id,
+                                    current_person["person_id"],
                                     response.finger_failed.error_code,
                                 )
                             )
                         else:
                             logger.info(
                                 "Updated person fingerprint for %s"
-                                % current_person.person_id
+                                % current_person["person_id"]
                             )
                     else:
                         # Delete all fingerprints if finger_data is empty/None
                         await client.update_person_fingers(
-                            person_id=current_person.person_id,
+                            person_id=current_person["person_id"],
                             finger_list=None,
                         )
                         logger.info(
                             "Deleted person fingerprints for %s"
-                            % current_person.person_id
+                            % current_person["person_id"]
+                        )
+
+                    if new_finger_digest is not None:
+                        await store_biometric(
+                            Biometric.Kind.finger,
+                            new_finger_digest,
+                            values["finger_data"],
                         )
+                    values["finger_data"] = None
+                    values["finger_digest"] = new_finger_digest
 
             # Update card if card_no is in values
             if "card_no" in values:
                 # Only update if changed
-                if values["card_no"] != current_person.card_no:
+                if values["card_no"] != current_person["card_no"]:
                     if values["card_no"]:
                         # Add/update card
                         card_update = PersonCardUpdate(
@@ -212,37 +365,38 @@ class PersonHook(BaseHikHook):
                             card_no=values["card_no"],
                         )
                         response = await client.update_person_cards(
-                            person_id=current_person.person_id,
+                            person_id=current_person["person_id"],
                             card_list=[card_update],
                         )
                         if response.card_failed:
                             logger.warning(
                                 "Failed to update card for %s: %s"
                                 % (
-                                    current_person.person_id,
+                                    current_person["person_id"],
                                     response.card_failed.error_code,
                                 )
                             )
                         else:
                             logger.info(
-                                "Updated person card for %s" % current_person.person_id
+                                "Updated person card for %s"
+                                % current_person["person_id"]
                             )
                     else:
                         # Delete all cards if card_no is empty/None
                         await client.update_person_cards(
-                            person_id=current_person.person_id,
+                            person_id=current_person["person_id"],
                             card_list=None,
                         )
                         logger.info(
-                            "Deleted person cards for %s" % current_person.person_id
+                            "Deleted person cards for %s" % current_person["person_id"]
                         )
 
             logger.info(
                 "Updated person in HikVision: %s - %s %s"
                 % (
-                    current_person.person_id,
-                    current_person.first_name,
-                    current_person.last_name,
+                    current_person["person_id"],
+                    current_person["first_name"],
+                    current_person["last_name"],
                 )
             )
 
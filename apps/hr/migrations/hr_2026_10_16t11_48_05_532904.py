@@ -0,0 +1,35 @@
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.columns.column_types import Varchar
+from piccolo.columns.indexes import IndexMethod
+
+ID = "2026-10-16T11:48:05:532904"
+VERSION = "1.30.0"
+DESCRIPTION = "Face photo digest"
+
+
+async def forwards():
+    manager = MigrationManager(migration_id=ID, app_name="hr", description=DESCRIPTION)
+
+    manager.add_column(
+        table_class_name="Person",
+        tablename="person",
+        column_name="face_digest",
+        db_column_name="face_digest",
+        column_class_name="Varchar",
+        column_class=Varchar,
+        params={
+            "length": 64,
+            "default": "",
+            "null": True,
+            "primary_key": False,
+            "unique": False,
+            "index": False,
+            "index_method": IndexMethod.btree,
+            "choices": None,
+            "db_column_name": None,
+            "secret": False,
+        },
+        schema=None,
+    )
+
+    return manager
@@ -0,0 +1,96 @@
+import base64
+import binascii
+import hashlib
+
+from piccolo.apps.migrations.auto.migration_manager import MigrationManager
+from piccolo.table import Table
+
+ID = "2026-10-16T13:06:02:117254"
+VERSION = "1.30.0"
+DESCRIPTION = "Move biometric payloads out of the person table"
+
+BATCH_SIZE = 500
+
+
+class RawTable(Table):
+    pass
+
+
+def face_digest(face_data: str) -> str:
+    # Same digest the hooks compute: SHA-256 of the decoded photo
+    if face_data.startswith("data:"):
+        face_data = face_data.partition(",")[2]
+    try:
+        return hashlib.sha256(base64.b64decode(face_data)).hexdigest()
+    except binascii.Error:
+        return hashlib.sha256(face_data.encode("utf-8")).hexdigest()
+
+
+def finger_digest(finger_data: str) -> str:
+    return hashlib.sha256(finger_data.encode("utf-8")).hexdigest()
+
+
+async def move_payloads():
+    last_id = ""
+    while True:
+        rows = await RawTable.raw(
+            "SELECT person_id, face_data, finger_data FROM person "
+            "WHERE person_id > {} "
+            "AND (face_data IS NOT NULL OR finger_data IS NOT NULL) "
+            "ORDER BY person_id LIMIT {}",
+            last_id,
+            BATCH_SIZE,
+        )
+        if not rows:
+            break
+
+        for row in rows:
+            digests = {}
+            for kind, column, digest in (
+                ("face", "face_data", face_digest),
+                ("finger", "finger_data", finger_digest),
+            ):
+                data = row[column]
+                if not data:
+                    continue
+                digests[kind] = digest(data)
+                await RawTable.raw(
+                    "INSERT INTO biometric (digest, kind, data, created_at, updated_at) "
+                    "VALUES ({}, {}, {}, now(), now()) ON CONFLICT DO NOTHING",
+                    digests[kind],
+                    kind,
+                    data,
+                )
+
+            await RawTable.raw(
+                "UPDATE person SET "
+                "face_digest = COALESCE({}, face_digest), "
+                "finger_digest = COALESCE({}, finger_digest), "
+                "face_data = NULL, finger_data = NULL "
+                "WHERE person_id = {}",
+                digests.get("face"),
+                digests.get("finger"),
+                row["person_id"],
+            )
+
+        last_id = rows[-1]["person_id"]
+
+
+async def restore_payloads():
+    await RawTable.raw(
+        "UPDATE person AS p SET face_data = b.data "
+        "FROM biometric AS b WHERE b.digest = p.face_digest"
+    )
+    await RawTable.raw(
+        "UPDATE person AS p SET finger_data = b.data "
+        "FROM biometric AS b WHERE b.digest = p.finger_digest"
+    )
+
+
+async def forwards():
+    manager = MigrationManager(migration_id=ID, app_name="hr", description=DESCRIPTION)
+
+    manager.add_raw(move_payloads)
+    manager.add_raw_backwards(restore_payloads)
+
+    return manager
@@ -16,3 +16,11 @@ class CardCollectRequest(BaseModel):
 
 class CardCollectResponse(BaseModel):
     card_no: str | None = Field(None)
+
+
+class PersonBiometricsResponse(BaseModel):
+    person_id: str = Field(...)
+    face_digest: str | None = Field(None)
+    face_data: str | None = Field(None)
+    finger_digest: str | None = Field(None)
+    finger_data: str | None = Field(None)
@@ -0,0 +1,564 @@
+"""
+Incremental reconciliation of the hr tables with HikCentral.
+
+Streams the remote areas, groups, devices and persons page by page and
+writes only what differs. Every reconciled row stores a content hash of its
+synced columns, so a page is compared against the database with one SELECT
+and written with one upsert for all changed rows. With a Redis client the
+digest of every page that was fully in sync is remembered as well: on the
+next run an identical page is skipped without touching the database.
+
+Rows missing remotely are deleted once the whole inventory was streamed,
+children before parents. A stale row still referenced by a local row that
+stays is kept rather than deleted, so foreign keys never cascade into local
+data (e.g. the credentials of a person).
+Only columns HikCentral returns are synced; credentials, biometrics and the
+device area are left as they are.
+"""
+
+import hashlib
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, AsyncIterator, Callable, Optional, TypeVar
+
+import orjson
+from loguru import logger
+from piccolo.columns import Column
+from piccolo.table import Table
+from redis.asyncio import Redis
+
+from apps.hik.client import HikClient
+from apps.hik.pagination import MAX_PAGE_SIZE
+from apps.hr.tables import Area, Device, Group, Person
+from apps.utils.metrics import metrics
+from core.config import settings
+
+T = TypeVar("T")
+
+# Bump when the synced columns or their mapping change, so stored hashes
+# and page digests of older runs no longer match
+HASH_VERSION = 1
+
+KEY_PREFIX = "hr:reconcile"
+
+# Rows per DELETE statement
+DELETE_BATCH_SIZE = 1000
+
+
+def content_hash(values: dict[str, Any]) -> str:
+    """
+    Hash the synced column values of a row.
+
+    Args:
+        values: Synced columns and their values, in a fixed order
+
+    Returns:
+        Hex digest stored in the row's content_hash column
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(orjson.dumps([HASH_VERSION, *values.values()]))
+    return digest.hexdigest()
+
+
+@dataclass
+class TableDiff:
+    """Changes applied to one table."""
+
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    kept: int = 0  # Rows missing remotely, kept as local rows reference them
+    unchanged: int = 0
+    invalid: int = 0  # Remote rows that cannot be stored locally
+    pages: int = 0
+    pages_skipped: int = 0
+
+
+@dataclass
+class ReconcileSummary:
+    """Diff summary of a reconciliation run."""
+
+    dry_run: bool = False
+    tables: dict[str, TableDiff] = field(default_factory=dict)
+    duration: float = 0.0
+
+    @property
+    def changed(self) -> int:
+        return sum(
+            diff.inserted + diff.updated + diff.deleted for diff in self.tables.values()
+        )
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "dry_run": self.dry_run,
+            "changed": self.changed,
+            "duration_seconds": round(self.duration, 3),
+            "tables": {name: asdict(diff) for name, diff in self.tables.items()},
+        }
+
+
+@dataclass(frozen=True)
+class _TableSpec:
+    table: type[Table]
+    # Written on insert and update, in hash order
+    synced: tuple[str, ...]
+    # Only written on insert (required columns HikCentral does not return)
+    insert_only: tuple[str, ...] = ()
+    # Foreign keys of other tables referencing this one
+    referenced_by: tuple[Column, ...] = ()
+
+    @property
+    def name(self) -> str:
+        return self.table._meta.tablename
+
+    @property
+    def pk(self) -> Column:
+        return self.table._meta.primary_key
+
+
+AREA_SPEC = _TableSpec(
+    Area,
+    synced=("area_id", "name", "parent_area_id"),
+    referenced_by=(Group.area, Device.area),
+)
+GROUP_SPEC = _TableSpec(
+    Group,
+    synced=("group_id", "name", "parent_group_id", "description"),
+    insert_only=("area",),
+    referenced_by=(Person.group,),
+)
+DEVICE_SPEC = _TableSpec(Device, synced=("device_id", "name", "category", "serial_no"))
+PERSON_SPEC = _TableSpec(
+    Person,
+    synced=(
+        "person_id",
+        "code",
+        "first_name",
+        "last_name",
+        "start_date",
+        "end_date",
+        "group",
+    ),
+)
+
+
+@dataclass
+class _TableResult:
+    diff: TableDiff = field(default_factory=TableDiff)
+    # Synced values of every valid remote row, by primary key
+    rows: dict[str, dict[str, Any]] = field(default_factory=dict)
+    # Primary keys present locally, before stale rows are deleted
+    stored: set[str] = field(default_factory=set)
+    # Primary keys of local rows missing remotely
+    stale: set[str] = field(default_factory=set)
+
+
+async def _chunks(items: AsyncIterator[T], size: int) -> AsyncIterator[list[T]]:
+    """Regroup a stream of items into lists of `size` items."""
+    chunk: list[T] = []
+    async for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _quote(identifier: str) -> str:
+    return '"%s"' % identifier
+
+
+class Reconciler:
+    """
+    Brings the hr tables in line with the HikCentral inventory.
+
+    Tables are reconciled in foreign key order (areas, groups, devices,
+    persons) and stale rows deleted in reverse order. Remote rows
+    referencing something that does not exist locally are counted as
+    invalid and left out.
+    """
+
+    def __init__(
+        self,
+        client: HikClient,
+        redis_client: Optional[Redis] = None,
+        page_size: int = MAX_PAGE_SIZE,
+        full: bool = False,
+        dry_run: bool = False,
+    ):
+        """
+        Args:
+            client: HikClient used to stream the remote inventory
+            redis_client: Remember in-sync page digests and lock runs if given
+            page_size: Records requested per page (1-500)
+            full: Compare every page with the database, ignoring page digests
+            dry_run: Compute the diff without writing anything
+        """
+        self.client = client
+        self.redis = redis_client
+        self.page_size = page_size
+        self.full = full
+        self.dry_run = dry_run
+
+    async def run(self) -> ReconcileSummary:
+        """
+        Reconcile all tables.
+
+        Returns:
+            Diff summary of the run
+
+        Raises:
+            RuntimeError: If another run holds the lock
+        """
+        lock_key = f"{KEY_PREFIX}:lock"
+        if self.redis is not None:
+            acquired = await self.redis.set(
+                lock_key, 1, nx=True, ex=settings.RECONCILE.LOCK_TTL
+            )
+            if not acquired:
+                raise RuntimeError("Reconciliation is already running")
+
+        summary = ReconcileSummary(dry_run=self.dry_run)
+        started = time.monotonic()
+
+        try:
+            areas = await self._reconcile(
+                AREA_SPEC, self.client.iter_areas(page_size=self.page_size)
+            )
+            summary.tables[AREA_SPEC.name] = areas.diff
+
+            # Groups created in HikCentral have no area, new rows get the root one
+            root_area = self._root_area(areas.rows)
+            groups = await self._reconcile(
+                GROUP_SPEC,
+                self.client.iter_person_groups(depth_traversal=True),
+                defaults={"area": root_area},
+            )
+            summary.tables[GROUP_SPEC.name] = groups.diff
+
+            devices = await self._reconcile(
+                DEVICE_SPEC, self.client.iter_devices(page_size=self.page_size)
+            )
+            summary.tables[DEVICE_SPEC.name] = devices.diff
+
+            persons = await self._reconcile(
+                PERSON_SPEC,
+                self.client.iter_persons(page_size=self.page_size),
+                valid=lambda row: row["group"] in groups.stored,
+            )
+            summary.tables[PERSON_SPEC.name] = persons.diff
+
+            # Children first, a parent is only deleted once nothing refers to it
+            deleted: dict[str, set[str]] = {}
+            for spec, result in (
+                (PERSON_SPEC, persons),
+                (DEVICE_SPEC, devices),
+                (GROUP_SPEC, groups),
+                (AREA_SPEC, areas),
+            ):
+                deleted[spec.name] = await self._delete_stale(spec, result, deleted)
+        finally:
+            if self.redis is not None:
+                await self.redis.delete(lock_key)
+
+        summary.duration = time.monotonic() - started
+        metrics.incr("hr.reconcile.runs")
+        metrics.set("hr.reconcile.last_changed", summary.changed)
+        metrics.set("hr.reconcile.last_duration_seconds", summary.duration)
+
+        logger.info(
+            "Reconciliation %s in %.2fs: %s"
+            % (
+                "dry run finished" if self.dry_run else "finished",
+                summary.duration,
+                ", ".join(
+                    "%s +%d ~%d -%d (%d kept, %d unchanged, %d invalid, "
+                    "%d/%d pages skipped)"
+                    % (
+                        name,
+                        diff.inserted,
+                        diff.updated,
+                        diff.deleted,
+                        diff.kept,
+                        diff.unchanged,
+                        diff.invalid,
+                        diff.pages_skipped,
+                        diff.pages,
+                    )
+                    for name, diff in summary.tables.items()
+                ),
+            )
+        )
+        return summary
+
+    @staticmethod
+    def _root_area(areas: dict[str, dict[str, Any]]) -> Optional[str]:
+        for area_id, row in areas.items():
+            if row["parent_area_id"] not in areas:
+                return area_id
+        return None
+
+    async def _reconcile(
+        self,
+        spec: _TableSpec,
+        remote: AsyncIterator[Any],
+        defaults: Optional[dict[str, Any]] = None,
+        valid: Optional[Callable[[dict[str, Any]], bool]] = None,
+    ) -> _TableResult:
+        """
+        Reconcile one table with a stream of remote records.
+
+        Args:
+            spec: Table and its synced columns
+            remote: Remote records, mapped with the `_<table>_row` methods
+            defaults: Values of the insert-only columns
+            valid: Returns False for rows that cannot be stored
+
+        Stale rows are only collected, `_delete_stale` deletes them once
+        every table is reconciled.
+
+        Returns:
+            Diff, the ids of the rows present locally and of the stale ones
+        """
+        to_row = getattr(self, "_%s_row" % spec.name)
+        pk_name = spec.pk._meta.name
+        defaults = defaults or {}
+        result = _TableResult()
+        diff = result.diff
+
+        cache_key = f"{KEY_PREFIX}:{spec.name}:{self.page_size}"
+        cached: dict[bytes, bytes] = {}
+        if self.redis is not None and not self.full:
+            cached = await self.redis.hgetall(cache_key)
+        in_sync_pages: dict[str, str] = {}
+        cached_ids: set[str] = set()
+        # Remote rows that cannot be stored, their local rows are not stale
+        invalid_ids: set[str] = set()
+
+        page_index = 0
+        async for records in _chunks(remote, self.page_size):
+            page_index += 1
+            diff.pages += 1
+
+            rows: dict[str, dict[str, Any]] = {}
+            for record in records:
+                row = to_row(record)
+                if row is None:
+                    diff.invalid += 1
+                    continue
+                for column in spec.insert_only:
+                    row[column] = defaults.get(column)
+                if (valid is not None and not valid(row)) or any(
+                    row[column] is None for column in spec.insert_only
+                ):
+                    diff.invalid += 1
+                    invalid_ids.add(row[pk_name])
+                    continue
+                rows[row[pk_name]] = row
+
+            result.rows.update(rows)
+            hashes = {
+                pk: content_hash({c: row[c] for c in spec.synced})
+                for pk, row in rows.items()
+            }
+            page_digest = hashlib.blake2b(
+                "\n".join(sorted(hashes.values())).encode(), digest_size=16
+            ).hexdigest()
+
+            # Pages with invalid rows are never cached, they are retried
+            complete = len(rows) == len(records)
+            if complete and cached.get(str(page_index).encode()) == (
+                page_digest.encode()
+            ):
+                diff.pages_skipped += 1
+                diff.unchanged += len(rows)
+                cached_ids.update(rows)
+                in_sync_pages[str(page_index)] = page_digest
+                continue
+
+            local = await self._local_hashes(spec, list(rows))
+            changed = [row for pk, row in rows.items() if local.get(pk) != hashes[pk]]
+            for row in changed:
+                row["content_hash"] = hashes[row[pk_name]]
+
+            inserted = sum(1 for row in changed if row[pk_name] not in local)
+            diff.inserted += inserted
+            diff.updated += len(changed) - inserted
+            diff.unchanged += len(rows) - len(changed)
+
+            if changed and not self.dry_run:
+                await self._upsert(spec, changed)
+            if complete:
+                in_sync_pages[str(page_index)] = page_digest
+
+        local_ids = set(await spec.table.select(spec.pk).output(as_list=True))
+
+        # A skipped page only proves the remote side is unchanged, rows
+        # removed locally meanwhile are written again
+        missing = [result.rows[pk] for pk in cached_ids - local_ids]
+        if missing:
+            logger.warning(
+                "%d %s row(s) of unchanged pages missing locally, restoring"
+                % (len(missing), spec.name)
+            )
+            for row in missing:
+                row["content_hash"] = content_hash({c: row[c] for c in spec.synced})
+            diff.inserted += len(missing)
+            diff.unchanged -= len(missing)
+            if not self.dry_run:
+                await self._upsert(spec, missing)
+
+        result.stored = local_ids | result.rows.keys()
+        result.stale = local_ids - result.rows.keys() - invalid_ids
+        if result.stale and not result.rows:
+            # An empty inventory is far more likely a broken response
+            logger.warning(
+                "HikCentral returned no %s rows, keeping %d local row(s)"
+                % (spec.name, len(result.stale))
+            )
+            result.stale = set()
+
+        if self.redis is not None and not self.dry_run:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(cache_key)
+                if in_sync_pages:
+                    pipe.hset(cache_key, mapping=in_sync_pages)
+                    pipe.expire(cache_key, settings.RECONCILE.PAGE_CACHE_TTL)
+                await pipe.execute()
+
+        return result
+
+    async def _local_hashes(
+        self, spec: _TableSpec, pks: list[str]
+    ) -> dict[str, Optional[str]]:
+        if not pks:
+            return {}
+        rows = await spec.table.select(spec.pk, spec.table.content_hash).where(
+            spec.pk.is_in(pks)
+        )
+        return {row[spec.pk._meta.name]: row["content_hash"] for row in rows}
+
+    async def _upsert(self, spec: _TableSpec, rows: list[dict[str, Any]]) -> None:
+        """Insert or update rows with one `INSERT ... ON CONFLICT` statement."""
+        columns = [*spec.synced, *spec.insert_only, "content_hash"]
+        values = []
+        args: list = []
+        for row in rows:
+            values.append("(%s, now(), now())" % ", ".join("{}" for _ in columns))
+            args.extend(row[column] for column in columns)
+
+        updates = [*spec.synced[1:], "content_hash"]
+        query = "INSERT INTO %s (%s, created_at, updated_at) VALUES %s " % (
+            _quote(spec.name),
+            ", ".join(_quote(c) for c in columns),
+            ", ".join(values),
+        ) + "ON CONFLICT (%s) DO UPDATE SET %s, updated_at = now()" % (
+            _quote(spec.pk._meta.db_column_name),
+            ", ".join("%s = EXCLUDED.%s" % (_quote(c), _quote(c)) for c in updates),
+        )
+
+        await spec.table.raw(query, *args)
+
+    async def _delete_stale(
+        self, spec: _TableSpec, result: _TableResult, deleted: dict[str, set[str]]
+    ) -> set[str]:
+        """
+        Delete the stale rows of a table no remaining local row refers to
+
+        Foreign keys cascade, deleting a stale row still referenced (e.g. a
+        group of persons HikCentral did not report elsewhere) would delete
+        its children with it. Such rows are kept until nothing refers to them.
+
+        Args:
+            spec: Table and the foreign keys referencing it
+            result: Reconciliation result of the table
+            deleted: Primary keys deleted so far, by table name
+
+        Returns:
+            Primary keys of the deleted rows
+        """
+        stale = set(result.stale)
+        referenced: set[str] = set()
+        for column in spec.referenced_by:
+            child = column._meta.table
+            child_pk = child._meta.primary_key
+            gone = deleted.get(child._meta.tablename, set())
+            pks = sorted(stale)
+            for start in range(0, len(pks), DELETE_BATCH_SIZE):
+                rows = await child.select(child_pk, column).where(
+                    column.is_in(pks[start : start + DELETE_BATCH_SIZE])
+                )
+                referenced.update(
+                    row[column._meta.name]
+                    for row in rows
+                    if row[child_pk._meta.name] not in gone
+                )
+
+        kept = stale & referenced
+        if kept:
+            logger.warning(
+                "Keeping %d %s row(s) missing in HikCentral, still referenced "
+                "locally: %s" % (len(kept), spec.name, ", ".join(sorted(kept)))
+            )
+            stale -= kept
+
+        result.diff.kept = len(kept)
+        result.diff.deleted = len(stale)
+        if stale and not self.dry_run:
+            await self._delete(spec, sorted(stale))
+        return stale
+
+    async def _delete(self, spec: _TableSpec, pks: list[str]) -> None:
+        async with spec.table._meta.db.transaction():
+            for start in range(0, len(pks), DELETE_BATCH_SIZE):
+                await spec.table.delete().where(
+                    spec.pk.is_in(pks[start : start + DELETE_BATCH_SIZE])
+                )
+
+    # Remote record to synced column values, None if it cannot be stored
+
+    @staticmethod
+    def _area_row(area) -> Optional[dict[str, Any]]:
+        return {
+            "area_id": area.id,
+            "name": area.name,
+            "parent_area_id": area.parentAreaID or "",
+        }
+
+    @staticmethod
+    def _group_row(group) -> Optional[dict[str, Any]]:
+        return {
+            "group_id": group.group_id,
+            "name": group.group_name,
+            "parent_group_id": group.parent_id,
+            "description": group.description,
+        }
+
+    @staticmethod
+    def _device_row(device) -> Optional[dict[str, Any]]:
+        if not device.serial_number:
+            return None
+        category = device.category
+        if category not in Device.Category.__members__:
+            category = Device.Category.accessControllerDevice.value
+        return {
+            "device_id": device.id,
+            "name": device.name,
+            "category": category,
+            "serial_no": device.serial_number,
+        }
+
+    @staticmethod
+    def _person_row(person) -> Optional[dict[str, Any]]:
+        if not person.person_id:
+            return None
+        return {
+            "person_id": person.person_id,
+            "code": person.person_code,
+            "first_name": person.first_name,
+            "last_name": person.last_name,
+            "start_date": person.start_date,
+            "end_date": person.end_date,
+            "group": person.group_id,
+        }
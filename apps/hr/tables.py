@@ -11,6 +11,7 @@ class Area(UpdatesMixin, Table):
     name = Varchar(null=False)
     area_id = Varchar(length=36, primary_key=True, null=False, index=True)
     parent_area_id = Varchar(length=36, null=False, index=True)
+    content_hash = Varchar(length=32, null=True)  # Set by reconciliation
 
     @classmethod
     def get_readable(cls):
@@ -47,6 +48,7 @@ class Device(UpdatesMixin, Table):
     password = Varchar(length=64, null=True)
 
     area = ForeignKey(references=Area, null=True, index=True)
+    content_hash = Varchar(length=32, null=True)  # Set by reconciliation
 
     @classmethod
     def get_readable(cls):
@@ -65,6 +67,7 @@ class Group(UpdatesMixin, Table):
     name = Varchar(length=100, null=False)
     description = Text(null=True)
     area = ForeignKey(references=Area, null=False, index=True)
+    content_hash = Varchar(length=32, null=True)  # Set by reconciliation
 
     @classmethod
     def get_readable(cls):
@@ -89,18 +92,39 @@ class Person(UpdatesMixin, Table):
     start_date = Timestamptz(default=start_date_default, null=False)
     end_date = Timestamptz(default=end_date_default, null=False)
 
+    # Biometric payloads are input only: PersonHook moves them to the
+    # Biometric table and keeps their digests, the columns stay empty
     finger_data = Text(null=True)  # Base64 encoded fingerprint data
+    finger_digest = Varchar(length=64, null=True)
     card_no = Varchar(length=20, null=True, index=True)
     pin_code = Varchar(length=8, null=True)
     face_data = Text(null=True)  # Base64 encoded face data
+    face_digest = Varchar(length=64, null=True)  # SHA-256 of the face JPEG
 
     group = ForeignKey(references=Group, null=False, index=True)
+    content_hash = Varchar(length=32, null=True)  # Set by reconciliation
 
     @classmethod
     def get_readable(cls):
         return Readable("%s %s [%s]", [cls.first_name, cls.last_name, cls.code])
 
 
+class Biometric(UpdatesMixin, Table):
+    """Biometric payloads of persons, stored once per digest"""
+
+    class Kind(str, Enum):
+        face = "face"
+        finger = "finger"
+
+    digest = Varchar(length=64, primary_key=True, null=False)
+    kind = Varchar(length=6, choices=Kind, null=False)
+    data = Text(null=False)  # Base64 encoded payload
+
+    @classmethod
+    def get_readable(cls):
+        return Readable("%s [%s]", [cls.kind, cls.digest])
+
+
 class Message(UpdatesMixin, Table):
     class Status(str, Enum):
         pending = "pending"
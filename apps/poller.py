@@ -1,13 +1,16 @@
 import asyncio
-import uuid
+from typing import Optional
 
 from loguru import logger
 from redis.asyncio import Redis
 
+from apps.events.archive import DroppedEventArchive
+from apps.events.rules import event_filter
+from apps.events.writer import MessageWriter
 from apps.hik.client_manager import get_hik_client_manager
-from apps.hik.models.message import MessageBatch
-from apps.hr.tables import Message
+from apps.hik.models.message import RawMessageBatch
 from apps.utils.logger import setup_logger
+from apps.utils.metrics import report_metrics
 from core.config import settings
 from core.db import database_connection
 from core.mq.broker import broker
@@ -16,27 +19,45 @@ from core.mq.broker import broker
 setup_logger("poller")
 
 
-async def handle_event(batch: MessageBatch) -> None:
+# Buffers batches into multi-row inserts and pipelined stream publishes
+writer = MessageWriter(
+    max_items=settings.POLLER.WRITER_MAX_ITEMS,
+    max_delay=settings.POLLER.WRITER_MAX_DELAY_MS / 1000,
+    seen_ttl=settings.POLLER.SEEN_TTL,
+)
+
+# Keeps dropped events out of the hot path, None when archiving is disabled
+archive: Optional[DroppedEventArchive] = (
+    DroppedEventArchive(
+        settings.EVENT_FILTER.ARCHIVE_DIR,
+        flush_interval=settings.EVENT_FILTER.ARCHIVE_FLUSH_INTERVAL,
+    )
+    if settings.EVENT_FILTER.ARCHIVE_DIR
+    else None
+)
+
+
+async def handle_event(batch: RawMessageBatch) -> None:
     logger.info(
         "Received batch %s, remaining: %s" % (batch.batch_id, batch.remaining_number)
     )
 
-    message_id = uuid.uuid4()
+    if settings.EVENT_FILTER.ENABLED:
+        batch_id = batch.batch_id
+        batch, dropped = event_filter.filter_batch(batch)
 
-    message = Message(
-        id=message_id,
-        payload=batch.model_dump(),
-        status=Message.Status.pending,
-    )
-    await message.save()
-    logger.info("Saved message %s to database" % message_id)
+        if archive is not None:
+            for reason, event in dropped:
+                archive.add(batch_id, reason, event)
 
-    await broker.publish(
-        batch.model_dump_json().encode(),
-        stream="events",
-        headers={"event_id": str(message_id)},
-    )
-    logger.info("Published message %s to Redis stream" % message_id)
+        if batch is None:
+            # Confirmed without being stored or published
+            logger.info("Batch %s has no relevant events, skipped" % batch_id)
+            return
+
+    # Returns once the batch is both stored and published
+    message_id = await writer.write(batch)
+    logger.info("Saved and published message %s" % message_id)
 
 
 async def main():
@@ -57,6 +78,9 @@ async def main():
     manager = await get_hik_client_manager()
     await manager.initialize(redis_client)
 
+    if archive is not None:
+        await archive.start()
+
     # Get shared client instance
     client = await manager.get_client()
 
@@ -64,19 +88,33 @@ async def main():
 
     await client.start_polling(
         callback=handle_event,
-        interval=0.5,
+        interval=settings.HIK.POLL_INTERVAL,
         auto_confirm=True,
+        max_in_flight=settings.HIK.POLL_MAX_IN_FLIGHT,
+        # Irrelevant msgTypes are not even fetched
+        subscribe_msg_types=settings.EVENT_FILTER.MSG_TYPES or None,
+        # Batches are forwarded as received, without parsing the events
+        raw=True,
     )
 
     logger.info("Polling active, waiting for events...")
 
+    metrics_task = asyncio.create_task(
+        report_metrics(redis_client, "poller", settings.METRICS_INTERVAL)
+    )
+
     try:
         await asyncio.Event().wait()
     except asyncio.CancelledError:
         logger.info("Poller cancelled")
     finally:
         # Cleanup
+        metrics_task.cancel()
+        await asyncio.gather(metrics_task, return_exceptions=True)
         await client.stop_polling()
+        await writer.close()
+        if archive is not None:
+            await archive.close()
         await manager.shutdown()
         await redis_client.aclose()
         await broker.stop()
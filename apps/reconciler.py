@@ -0,0 +1,41 @@
+from loguru import logger
+from redis.asyncio import Redis
+
+from apps.hik.client_manager import get_hik_client_manager
+from apps.hr.biometrics import prune_biometrics
+from apps.hr.reconcile import ReconcileSummary, Reconciler
+from apps.utils.logger import setup_logger
+from core.config import settings
+from core.db import database_connection
+
+# Setup reconciler-specific logging
+setup_logger("reconciler")
+
+
+async def main(full: bool = False, dry_run: bool = False) -> ReconcileSummary:
+    await database_connection()
+
+    redis_client = Redis.from_url(
+        settings.REDIS_URL,
+        encoding="utf-8",
+        decode_responses=False,
+    )
+
+    # Shares the token with the API server and the poller
+    manager = await get_hik_client_manager()
+    await manager.initialize(redis_client)
+
+    try:
+        client = await manager.get_client()
+        reconciler = Reconciler(
+            client, redis_client=redis_client, full=full, dry_run=dry_run
+        )
+        summary = await reconciler.run()
+        if not dry_run:
+            await prune_biometrics()
+        return summary
+    finally:
+        await manager.shutdown()
+        await redis_client.aclose()
+        await database_connection(close=True)
+        logger.info("Reconciler stopped")
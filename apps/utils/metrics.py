@@ -0,0 +1,117 @@
+"""
+Lightweight in-process metrics with Redis publishing.
+
+Each process (app, poller, worker) keeps its own counters and gauges and
+periodically publishes a snapshot to a Redis hash, so the API server can
+expose the metrics of all components from a single endpoint.
+"""
+
+import asyncio
+import socket
+import time
+from typing import Optional
+
+from loguru import logger
+from redis.asyncio import Redis
+
+METRICS_KEY_PREFIX = "metrics"
+
+
+class MetricsRegistry:
+    """
+    Process-local registry of named numeric metrics.
+
+    Gauges are overwritten with set(), counters are accumulated with incr().
+    Both live in the same flat namespace, e.g. "poller.idle_streak".
+    """
+
+    def __init__(self):
+        self._values: dict[str, float] = {}
+
+    def set(self, name: str, value: float) -> None:
+        """Set a gauge to the given value."""
+        self._values[name] = value
+
+    def incr(self, name: str, amount: float = 1) -> None:
+        """Increase a counter by the given amount."""
+        self._values[name] = self._values.get(name, 0) + amount
+
+    def get(self, name: str, default: float = 0) -> float:
+        """Get the current value of a metric."""
+        return self._values.get(name, default)
+
+    def snapshot(self) -> dict[str, float]:
+        """Get a copy of all current values."""
+        return dict(self._values)
+
+    async def publish(
+        self,
+        redis_client: Redis,
+        component: str,
+        ttl: int = 60,
+    ) -> None:
+        """
+        Publish a snapshot to Redis.
+
+        Args:
+            redis_client: Redis async client instance
+            component: Component name (e.g. "poller", "worker")
+            ttl: Seconds before the snapshot expires if not refreshed
+        """
+        key = f"{METRICS_KEY_PREFIX}:{component}:{socket.gethostname()}"
+        values = self.snapshot()
+        values["published_at"] = time.time()
+
+        await redis_client.hset(key, mapping=values)
+        await redis_client.expire(key, ttl)
+
+
+# Global registry for the current process
+metrics = MetricsRegistry()
+
+
+async def report_metrics(
+    redis_client: Redis,
+    component: str,
+    interval: float,
+    registry: Optional[MetricsRegistry] = None,
+) -> None:
+    """
+    Publish metrics to Redis every `interval` seconds until cancelled.
+
+    Args:
+        redis_client: Redis async client instance
+        component: Component name (e.g. "poller", "worker")
+        interval: Seconds between publications
+        registry: Registry to publish (default: global registry)
+    """
+    registry = registry or metrics
+    ttl = max(int(interval * 3), 30)
+
+    while True:
+        try:
+            await registry.publish(redis_client, component, ttl=ttl)
+        except Exception as e:
+            logger.warning("Failed to publish metrics: %s" % str(e))
+
+        await asyncio.sleep(interval)
+
+
+async def read_metrics(redis_client: Redis) -> dict[str, dict[str, float]]:
+    """
+    Read the latest published snapshots of all components.
+
+    Returns:
+        Mapping of "<component>:<host>" to its metric values
+    """
+    result: dict[str, dict[str, float]] = {}
+
+    async for key in redis_client.scan_iter(match=f"{METRICS_KEY_PREFIX}:*"):
+        values = await redis_client.hgetall(key)
+        name = key.decode() if isinstance(key, bytes) else key
+        result[name.split(":", 1)[1]] = {
+            (k.decode() if isinstance(k, bytes) else k): float(v)
+            for k, v in values.items()
+        }
+
+    return result
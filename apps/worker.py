@@ -1,15 +1,23 @@
+import asyncio
 import uuid
 from typing import Annotated
 
 import httpx
-from faststream import Context, Depends, FastStream
+from faststream import AckPolicy, Context, FastStream
 from loguru import logger
 
+from apps.events.dedup import PunchDeduplicator
+from apps.events.delivery import WebhookBatcher, WebhookDeliveryError
+from apps.events.extract import event_extractors
+from apps.events.status import StatusBuffer
 from apps.hr.tables import Message
 from apps.utils.logger import setup_logger
+from apps.utils.metrics import metrics, report_metrics
 from core.config import settings
 from core.db import database_connection
-from core.mq.broker import broker, stream
+from core.mq.broker import broker, reclaim_stream, stream
+from core.mq.middlewares import retry_schedule
+from core.mq.pending import report_pending
 
 # Setup worker-specific logging
 setup_logger("worker")
@@ -55,141 +63,193 @@ class HTTPClientManager:
 
 http_client_manager = HTTPClientManager()
 
+# Coalesces Message status updates into one UPDATE per flush interval
+status_buffer = StatusBuffer(
+    flush_interval=settings.WORKER.STATUS_FLUSH_INTERVAL_MS / 1000,
+    max_items=settings.WORKER.STATUS_FLUSH_MAX_ITEMS,
+)
+
 
 async def get_http_client() -> httpx.AsyncClient:
     return await http_client_manager.get_client()
 
 
+# Merges events of concurrently handled messages into one webhook request
+webhook_batcher = WebhookBatcher(
+    get_client=get_http_client,
+    url=settings.HTTP_WEBHOOK_URL,
+    token=settings.HTTP_WEBHOOK_TOKEN,
+    max_events=settings.WORKER.WEBHOOK_BATCH_MAX_EVENTS,
+    max_bytes=settings.WORKER.WEBHOOK_BATCH_MAX_BYTES,
+    max_linger=settings.WORKER.WEBHOOK_BATCH_MAX_LINGER_MS / 1000,
+)
+
+# Drops repeated punches before they reach the webhook
+punch_dedup = PunchDeduplicator(
+    window=settings.WORKER.PUNCH_DEDUP_WINDOW_MS / 1000,
+    key_fields=settings.WORKER.PUNCH_DEDUP_KEY,
+    time_field=settings.WORKER.PUNCH_DEDUP_TIME_FIELD,
+    max_keys=settings.WORKER.PUNCH_DEDUP_MAX_KEYS,
+)
+
+# Long-running loops owned by this worker process
+background_tasks: set[asyncio.Task] = set()
+
+
+def start_background_task(coro) -> None:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
 @app.on_startup
 async def on_startup():
     await database_connection()
     await http_client_manager.get_client()  # Pre-warm the client
+    await status_buffer.start()
     logger.info("Worker startup complete")
 
 
+@app.after_startup
+async def after_startup():
+    # Broker connection is only available once the broker has started
+    if settings.WORKER.PUNCH_DEDUP_SHARED:
+        punch_dedup.use_redis(broker._connection)
+    start_background_task(
+        report_metrics(broker._connection, "worker", settings.METRICS_INTERVAL)
+    )
+    # Re-injects failed entries into the stream once their retry is due
+    start_background_task(
+        retry_schedule.run(
+            broker, interval=settings.WORKER.RETRY_POLL_INTERVAL_MS / 1000
+        )
+    )
+    start_background_task(
+        report_pending(
+            broker._connection, stream.name, stream.group, settings.METRICS_INTERVAL
+        )
+    )
+
+
 @app.on_shutdown
 async def on_shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
+
+@app.after_shutdown
+async def after_shutdown():
+    # Runs after the broker stopped, so no handler records anything anymore
+    await webhook_batcher.close()
+    # Final flush must happen before the connection pool is closed
+    await status_buffer.close()
     await database_connection(close=True)
     await http_client_manager.close()
     logger.info("Worker shutdown complete")
 
 
-@broker.subscriber(stream=stream)
+# Up to MAX_CONCURRENCY entries are handled at once, so a slow webhook does
+# not block the entries behind it and their events can share webhook batches.
+# Each entry is acked only after its handler returned.
+@broker.subscriber(
+    stream=stream,
+    max_workers=settings.WORKER.MAX_CONCURRENCY,
+    ack_policy=AckPolicy.REJECT_ON_ERROR,
+)
 async def handle_event(
     body: dict,
     event_id: Annotated[str, Context("message.headers.event_id")],
-    client: Annotated[httpx.AsyncClient, Depends(get_http_client)],
 ):
-    message_id = uuid.UUID(event_id)
-    logger.info("Processing message %s" % message_id)
-
-    await Message.update({Message.status: Message.Status.processing}).where(
-        Message.id == message_id
-    )
-
-    customized_envents = []
-    events = body.get("event", [])
-
-    for event in events:
-        first_basic_info = event.get("basicInfo") or {}
-        device_id = (first_basic_info.get("device") or {}).get("id", None)
-        msg_type = first_basic_info.get("msgType", None)
-
-        event_data = ((event.get("data") or {}).get("openDoorInfo") or {}).get(
-            "event"
-        ) or {}
-
-        second_basic_info = event_data.get("basicInfo", {})
-        intelli_info = event_data.get("intelliInfo", {})
+    metrics.incr("worker.in_flight")
+    try:
+        await process_event(body, uuid.UUID(event_id))
+    finally:
+        metrics.incr("worker.in_flight", -1)
+        metrics.incr("worker.handled")
+
+
+# Re-runs entries another consumer received but never acked (e.g. the worker
+# died mid-handler) through the same processing path.
+@broker.subscriber(
+    stream=reclaim_stream,
+    ack_policy=AckPolicy.REJECT_ON_ERROR,
+)
+async def reclaim_event(
+    body: dict,
+    event_id: Annotated[str, Context("message.headers.event_id")],
+):
+    logger.warning("Reclaimed pending message %s" % event_id)
+    metrics.incr("worker.reclaimed")
+    metrics.incr("worker.in_flight")
+    try:
+        await process_event(body, uuid.UUID(event_id))
+    finally:
+        metrics.incr("worker.in_flight", -1)
+        metrics.incr("worker.handled")
 
-        occur_time = second_basic_info.get("occurTime", None)
-        person_id = intelli_info.get("personId", None)
-        attendance_status = intelli_info.get("attendanceStatus", None)
-        auth_result = intelli_info.get("authResult", None)
 
-        if auth_result != 1:
-            continue  # Skip non-successful authentications
+async def process_event(body: dict, message_id: uuid.UUID) -> None:
+    logger.info("Processing message %s" % message_id)
 
-        if attendance_status not in [1, 2]:  # 1: Check-in, 2: Check-out
-            continue  # Skip irrelevant attendance statuses
+    status_buffer.set(message_id, Message.Status.processing)
 
-        if not person_id or not occur_time or not device_id:
-            continue  # Skip if essential data is missing
+    # Rules, fields and shape per msgType, see settings.EVENT_FILTER and
+    # settings.WORKER.EVENT_EXTRACTORS. Dropped events and events missing
+    # essential data are skipped.
+    customized_envents = event_extractors.extract_all(body.get("event") or [])
 
-        customized_envents.append(
-            {
-                "device_id": device_id,
-                "msg_type": msg_type,
-                "occur_time": occur_time,
-                "person_id": person_id,
-                "attendance_status": attendance_status,
-            }
-        )
+    # Punches repeated within the dedup window are counted and dropped
+    customized_envents = await punch_dedup.filter(customized_envents, message_id)
 
     if not customized_envents:
-        await Message.update({Message.status: Message.Status.not_needed}).where(
-            Message.id == message_id
-        )
+        status_buffer.set(message_id, Message.Status.not_needed)
         logger.info(
             "Message %s has no relevant events, marked as not_needed" % message_id
         )
         return
 
     try:
-        response = await client.post(
-            settings.HTTP_WEBHOOK_URL,
-            json={"events": customized_envents},
-            headers={
-                "Content-Type": "application/json",
-                "X-EXTERNAL-TOKEN": settings.HTTP_WEBHOOK_TOKEN,
-            },
+        # Returns once the webhook accepted the batch containing these events
+        await webhook_batcher.deliver(customized_envents)
+
+        status_buffer.set(message_id, Message.Status.done)
+        logger.info(
+            "Message %s delivered successfully to %s"
+            % (message_id, settings.HTTP_WEBHOOK_URL)
         )
 
-        if response.status_code == 200:
-            await Message.update({Message.status: Message.Status.done}).where(
-                Message.id == message_id
-            )
-            logger.info(
-                "Message %s delivered successfully to %s"
-                % (message_id, settings.HTTP_WEBHOOK_URL)
-            )
-        else:
-            error_msg = "HTTP %d: %s" % (response.status_code, response.text)
-            await Message.update(
-                {
-                    Message.status: Message.Status.failed,
-                    Message.last_error: error_msg,
-                    Message.retry_count: Message.retry_count + 1,
-                }
-            ).where(Message.id == message_id)
-            logger.error(
-                "Message %s failed with status %d" % (message_id, response.status_code)
-            )
-            raise Exception(error_msg)
+    except WebhookDeliveryError as e:
+        status_buffer.set(
+            message_id,
+            Message.Status.failed,
+            last_error=str(e),
+            increment_retry=True,
+        )
+        logger.error("Message %s failed with status %d" % (message_id, e.status_code))
+        raise
 
     except httpx.ConnectError as e:
         # Network-level failures - mark client as unhealthy
         http_client_manager.mark_unhealthy()
         error_msg = "Connection error: %s" % str(e)
-        await Message.update(
-            {
-                Message.status: Message.Status.failed,
-                Message.last_error: error_msg,
-                Message.retry_count: Message.retry_count + 1,
-            }
-        ).where(Message.id == message_id)
+        status_buffer.set(
+            message_id,
+            Message.Status.failed,
+            last_error=error_msg,
+            increment_retry=True,
+        )
         logger.error("Message %s connection error: %s" % (message_id, str(e)))
         raise
 
     except Exception as e:
         error_msg = str(e)
-        await Message.update(
-            {
-                Message.status: Message.Status.failed,
-                Message.last_error: error_msg,
-                Message.retry_count: Message.retry_count + 1,
-            }
-        ).where(Message.id == message_id)
+        status_buffer.set(
+            message_id,
+            Message.Status.failed,
+            last_error=error_msg,
+            increment_retry=True,
+        )
         logger.error("Message %s processing error: %s" % (message_id, error_msg))
         raise
 
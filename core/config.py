@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from typing import Final
+from typing import Any, Final, Literal
 
 from dotenv import load_dotenv
 from pydantic import BaseModel, PostgresDsn, computed_field
@@ -64,10 +64,170 @@ class HikvisionConfig(BaseModel):
     DEFAULT_TIMEOUT: float = 30.0
     DEFAULT_CONNECT_TIMEOUT: float = 10.0
 
+    # Pages requested ahead by the list iterators (iter_persons, ...)
+    PAGE_PREFETCH: int = 2
+
+    # Worker processes resizing face photos off the event loop
+    IMAGE_WORKERS: int = 2
+    # Photo digests remembered for skipping unchanged or rejected uploads
+    FACE_CACHE_SIZE: int = 4096
+
+    # Credential updates sent at once when enrolling a person
+    CREDENTIAL_PUSH_CONCURRENCY: int = 4
+
     # Retry settings
     MAX_RETRIES: int = 3
     RETRY_BACKOFF_FACTOR: float = 0.5
 
+    # Polling settings
+    POLL_INTERVAL: float = 0.5
+    POLL_MAX_IN_FLIGHT: int = 4
+    POLL_MAX_INTERVAL: float = 10.0
+    POLL_BACKOFF_FACTOR: float = 2.0
+
+    # Background token renewal: renew at this fraction of the token lifetime,
+    # minus up to JITTER of the lifetime so processes don't renew at once
+    TOKEN_RENEW_FRACTION: float = 0.8
+    TOKEN_RENEW_JITTER: float = 0.05
+    TOKEN_RENEW_RETRY_DELAY: float = 30.0
+
+    # Tenant client pool: open clients at most, closed after idle seconds
+    CLIENT_POOL_MAX_SIZE: int = 64
+    CLIENT_POOL_IDLE_TTL: float = 900.0
+
+    # Client-side rate limits (requests per second) per endpoint family and
+    # for the app key as a whole. Polling may use the reserved share of the
+    # global budget, other requests may not. Set RATE_LIMIT_SHARED to share
+    # the budget of an app key between processes through Redis.
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_SHARED: bool = False
+    RATE_LIMITS: dict[str, float] = {
+        "messages": 10.0,
+        "persons": 10.0,
+        "devices": 5.0,
+        "token": 1.0,
+        "other": 10.0,
+    }
+    RATE_LIMIT_GLOBAL: float = 20.0
+    RATE_LIMIT_BURST_SECONDS: float = 1.0
+    RATE_LIMIT_POLL_RESERVED_SHARE: float = 0.2
+
+    # Circuit breaker per base URL: opens when CIRCUIT_FAILURE_RATE of the
+    # last CIRCUIT_WINDOW calls failed or took over CIRCUIT_SLOW_CALL_SECONDS
+    CIRCUIT_WINDOW: int = 20
+    CIRCUIT_MIN_CALLS: int = 10
+    CIRCUIT_FAILURE_RATE: float = 0.5
+    CIRCUIT_SLOW_CALL_SECONDS: float = 10.0
+    CIRCUIT_OPEN_SECONDS: float = 30.0
+
+
+class PollerConfig(BaseModel):
+    # Buffered Message writer: flush after N batches or T milliseconds
+    WRITER_MAX_ITEMS: int = 50
+    WRITER_MAX_DELAY_MS: int = 20
+
+    # Published batch ids are remembered this long to drop re-deliveries
+    SEEN_TTL: int = 86400
+
+
+class EventRule(BaseModel):
+    # Dotted path into a HikCentral event, e.g. "basicInfo.device.id"
+    path: str
+    # present: not null, empty or 0, in/not_in: value is a list
+    op: Literal["eq", "ne", "in", "not_in", "present"] = "eq"
+    value: Any = None
+    # Name in metrics and archives, defaults to the last path segment
+    name: str | None = None
+
+
+class EventExtractor(BaseModel):
+    # msgTypes this extractor handles, "*" for any other msgType
+    msg_types: list[str] = ["*"]
+    # Output field -> dotted path into the event
+    fields: dict[str, str]
+    # Output fields that must not be null, empty or 0
+    required: list[str] = []
+    # Rules an event must also match, on top of EVENT_FILTER__RULES
+    rules: list[EventRule] = []
+
+
+class WorkerConfig(BaseModel):
+    # Message status transitions are coalesced and flushed periodically
+    STATUS_FLUSH_INTERVAL_MS: int = 500
+    STATUS_FLUSH_MAX_ITEMS: int = 500
+
+    # Stream entries handled concurrently per worker process
+    MAX_CONCURRENCY: int = 32
+
+    # Entries fetched per XREADGROUP and its BLOCK timeout
+    STREAM_READ_COUNT: int = 32
+    STREAM_BLOCK_MS: int = 5000
+
+    # Webhook batching: send after N events, N bytes or N milliseconds
+    WEBHOOK_BATCH_MAX_EVENTS: int = 500
+    WEBHOOK_BATCH_MAX_BYTES: int = 1024 * 1024
+    WEBHOOK_BATCH_MAX_LINGER_MS: int = 50
+
+    # Failed entries are retried after 1x, 2x, 4x... the base delay, then
+    # moved to the dead-letter stream
+    RETRY_MAX_ATTEMPTS: int = 3
+    RETRY_BASE_DELAY_MS: int = 1000
+    RETRY_POLL_INTERVAL_MS: int = 500
+
+    # Pending entries idle this long are reclaimed from crashed consumers.
+    # Must exceed the longest handling time of a single entry.
+    RECLAIM_MIN_IDLE_MS: int = 60000
+    RECLAIM_INTERVAL_MS: int = 5000
+
+    # Repeated punches with the same key closer than this (by event time)
+    # are suppressed, 0 to disable
+    PUNCH_DEDUP_WINDOW_MS: int = 10000
+    PUNCH_DEDUP_KEY: list[str] = ["person_id", "device_id", "attendance_status"]
+    PUNCH_DEDUP_TIME_FIELD: str = "occur_time"
+    # Keys remembered per worker, kept punches are shared through Redis
+    # across replicas unless disabled
+    PUNCH_DEDUP_MAX_KEYS: int = 100_000
+    PUNCH_DEDUP_SHARED: bool = True
+
+    # Webhook event shape of msgTypes other than door access events, which
+    # are extracted by the built-in code ("*" replaces it for all msgTypes)
+    EVENT_EXTRACTORS: list[EventExtractor] = []
+
+
+class ReconcileConfig(BaseModel):
+    # Digests of in-sync pages are kept this long, so every table is fully
+    # compared with the database at least once per TTL
+    PAGE_CACHE_TTL: int = 24 * 60 * 60
+    # Lock against concurrent runs, released early when a run finishes
+    LOCK_TTL: int = 30 * 60
+
+
+class EventFilterConfig(BaseModel):
+    # Evaluate the rules in the poller, so dropped events are never stored
+    # or published. When disabled, the worker applies them instead.
+    ENABLED: bool = True
+
+    # msgTypes subscribed to on HikCentral, others are not even fetched
+    # (empty for all)
+    MSG_TYPES: list[str] = []
+
+    # An event is kept only if it matches every rule
+    RULES: list[EventRule] = [
+        # Successful authentications only
+        EventRule(path="data.openDoorInfo.event.intelliInfo.authResult", value=1),
+        # 1: Check-in, 2: Check-out
+        EventRule(
+            path="data.openDoorInfo.event.intelliInfo.attendanceStatus",
+            op="in",
+            value=[1, 2],
+        ),
+    ]
+
+    # Dropped events are appended to gzip files in this directory (empty to
+    # only count them)
+    ARCHIVE_DIR: str = ""
+    ARCHIVE_FLUSH_INTERVAL: float = 5.0
+
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
@@ -109,12 +269,27 @@ class Settings(BaseSettings):
 
     REDIS_URL: str = "redis://localhost:6379"
 
+    # Seconds between metric snapshots published to Redis
+    METRICS_INTERVAL: float = 10.0
+
     HTTP_WEBHOOK_URL: str = "http://example.com/webhook"
     HTTP_WEBHOOK_TOKEN: str = "supersecrettoken"
 
     # Hikvision Configuration
     HIK: HikvisionConfig = HikvisionConfig()
 
+    # Poller Configuration
+    POLLER: PollerConfig = PollerConfig()
+
+    # Worker Configuration
+    WORKER: WorkerConfig = WorkerConfig()
+
+    # Ingest event filter Configuration
+    EVENT_FILTER: EventFilterConfig = EventFilterConfig()
+
+    # HikCentral reconciliation Configuration
+    RECONCILE: ReconcileConfig = ReconcileConfig()
+
     # Database configuration
     DATABASE: PostgresConfig = PostgresConfig()
 
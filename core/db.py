@@ -63,6 +63,8 @@ person_table_config = TableConfig(
         Person.card_no,
         Person.pin_code,
         Person.face_data,
+        Person.face_digest,
+        Person.finger_digest,
     ],
     order_by=ORDER_BY,
     menu_group=MENU_GROUPS["Hikvision"],
@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import Depends, FastAPI
@@ -12,10 +13,12 @@ from starlette.routing import Mount, Route
 from starlette.staticfiles import StaticFiles
 
 from apps.hik.client_manager import get_hik_client_manager
+from apps.hik.images import shutdown_image_pool
 from apps.home.endpoints import HomeEndpoint
 from apps.hr.endpoints import router as api_router
 from apps.utils.hooks import handle_auth_exception
 from apps.utils.logger import setup_logger
+from apps.utils.metrics import report_metrics
 from core.config import settings as config
 from core.db import admin_panel, create_user, database_connection
 from core.mq.broker import broker
@@ -43,10 +46,17 @@ async def lifespan(app: FastAPI):
     # Initialize broker
     await broker.connect()
 
+    metrics_task = asyncio.create_task(
+        report_metrics(redis_client, "app", config.METRICS_INTERVAL)
+    )
+
     logger.info("Application startup complete")
 
     yield
 
+    metrics_task.cancel()
+    await asyncio.gather(metrics_task, return_exceptions=True)
+
     # Shutdown broker
     await broker.stop()
 
@@ -56,6 +66,9 @@ async def lifespan(app: FastAPI):
     # Close Redis connection
     await redis_client.aclose()
 
+    # Stop face photo workers
+    shutdown_image_pool()
+
     # Close database
     await database_connection(close=True)
 
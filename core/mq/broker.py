@@ -1,3 +1,5 @@
+import socket
+
 from faststream.redis import RedisBroker, StreamSub
 
 from core.config import settings
@@ -8,9 +10,24 @@ broker = RedisBroker(
     middlewares=[RetryMiddleware],
 )
 
+# Each worker replica reads as its own consumer of the group, up to
+# STREAM_READ_COUNT entries per XREADGROUP. polling_interval is the BLOCK
+# timeout in milliseconds: the read returns as soon as an entry arrives.
 stream = StreamSub(
     "events",
     group="workers",
-    consumer="worker-{id}",
-    polling_interval=5000,
+    consumer="worker-%s" % socket.gethostname(),
+    polling_interval=settings.WORKER.STREAM_BLOCK_MS,
+    max_records=settings.WORKER.STREAM_READ_COUNT,
+)
+
+# Entries left pending by a crashed worker are claimed with XAUTOCLAIM once
+# idle for RECLAIM_MIN_IDLE_MS and handled again. polling_interval is the
+# pause after a full pass over the PEL found nothing to claim.
+reclaim_stream = StreamSub(
+    "events",
+    group="workers",
+    consumer="reclaimer-%s" % socket.gethostname(),
+    polling_interval=settings.WORKER.RECLAIM_INTERVAL_MS,
+    min_idle_time=settings.WORKER.RECLAIM_MIN_IDLE_MS,
 )
@@ -1,15 +1,28 @@
-import asyncio
 from collections.abc import Awaitable, Callable
-from typing import Any, Final
+from typing import Any
 
 from faststream import BaseMiddleware, Logger, StreamMessage
 from typing_extensions import override
 
+from core.config import settings
+from core.mq.retry import RetrySchedule
+
+# Shared by the middleware and the scheduler loop in the worker
+retry_schedule = RetrySchedule(
+    stream="events",
+    max_attempts=settings.WORKER.RETRY_MAX_ATTEMPTS,
+    base_delay=settings.WORKER.RETRY_BASE_DELAY_MS / 1000,
+)
+
 
 class RetryMiddleware(BaseMiddleware):
-    """Retry middleware with exponential backoff for message processing"""
+    """Retry middleware that defers failed messages to the retry schedule
 
-    MAX_RETRIES: Final[int] = 3
+    The consumer never sleeps: a failed message is handed to the schedule
+    (or dead-lettered after the maximum attempts) and acked, so the entries
+    behind it are processed right away. If scheduling itself fails the
+    error propagates and the entry stays pending.
+    """
 
     @override
     async def consume_scope(
@@ -18,21 +31,21 @@ class RetryMiddleware(BaseMiddleware):
         msg: StreamMessage[Any],
     ) -> Any:
         logger_instance: Logger = self.context.get_local("logger")
-        for attempt in range(self.MAX_RETRIES + 1):
-            try:
-                return await call_next(msg)
-            except Exception as e:
-                if attempt == self.MAX_RETRIES:
-                    logger_instance.exception(
-                        "Failed after %s retries. Marking as failed." % self.MAX_RETRIES
-                    )
-                    raise
-
-                # Calculate exponential backoff delay
-                delay = 2**attempt
-                logger_instance.warning(
-                    "Attempt %s failed: %s. Retrying in %ss..."
-                    % (attempt + 1, str(e), delay)
+        try:
+            return await call_next(msg)
+        except Exception as e:
+            scheduled = await retry_schedule.schedule(
+                self.context.get("app").broker,
+                body=msg.body,
+                headers=msg.headers,
+                error=str(e),
+            )
+
+            if scheduled:
+                logger_instance.warning("Attempt failed: %s. Retry scheduled." % str(e))
+            else:
+                logger_instance.error(
+                    "Failed after %s retries. Moved to %s."
+                    % (retry_schedule.max_attempts, retry_schedule.dead_letter_stream)
                 )
-                await asyncio.sleep(delay)
         return None
@@ -0,0 +1,52 @@
+"""
+Consumer group pending-entries (PEL) monitoring.
+"""
+
+import asyncio
+import time
+
+from loguru import logger
+from redis.asyncio import Redis
+
+from apps.utils.metrics import metrics
+
+
+def entry_timestamp(entry_id: bytes | str) -> float:
+    """Get the creation time (unix seconds) encoded in a stream entry id."""
+    if isinstance(entry_id, bytes):
+        entry_id = entry_id.decode()
+    return int(entry_id.split("-", 1)[0]) / 1000
+
+
+async def report_pending(
+    redis_client: Redis,
+    stream: str,
+    group: str,
+    interval: float,
+) -> None:
+    """
+    Record the PEL size and oldest pending entry age every `interval` seconds.
+
+    Args:
+        redis_client: Redis async client instance
+        stream: Stream name
+        group: Consumer group name
+        interval: Seconds between checks
+    """
+    while True:
+        try:
+            summary = await redis_client.xpending(stream, group)
+
+            pending = summary["pending"]
+            oldest_age = 0.0
+            if pending and summary["min"]:
+                oldest_age = max(time.time() - entry_timestamp(summary["min"]), 0.0)
+
+            metrics.set("worker.pending", pending)
+            metrics.set("worker.pending_oldest_age_seconds", round(oldest_age, 3))
+            metrics.set("worker.pending_consumers", len(summary["consumers"] or []))
+
+        except Exception as e:
+            logger.error("Failed to read pending entries of %s: %s" % (stream, str(e)))
+
+        await asyncio.sleep(interval)
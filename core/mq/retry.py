@@ -0,0 +1,173 @@
+"""
+Delayed retries for stream entries.
+
+Failed entries are not retried inside the consumer. They are stored in a
+Redis sorted set scored by their due time and re-injected into their stream
+by a small scheduler loop, so healthy entries never wait behind failing
+ones. Entries that exhausted their attempts go to a dead-letter stream.
+"""
+
+import asyncio
+import base64
+import time
+import uuid
+from typing import Any
+
+import orjson
+from faststream.redis import RedisBroker
+from loguru import logger
+
+from apps.utils.metrics import metrics
+
+RETRY_ATTEMPT_HEADER = "retry_attempt"
+
+# Headers set by FastStream itself, they are regenerated on publish
+_INTERNAL_HEADERS = frozenset({"correlation_id", "reply_to", "content-type"})
+
+# Atomically lease due entries: move their score to the lease deadline so
+# another scheduler doesn't pick them up, and return them. If the process
+# dies before removing them, they become due again after the lease.
+_CLAIM_DUE_SCRIPT = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, member in ipairs(items) do
+    redis.call('ZADD', KEYS[1], ARGV[3], member)
+end
+return items
+"""
+
+
+class RetrySchedule:
+    """
+    Redis sorted-set based retry schedule for a stream.
+
+    Attempt N (1-based) becomes due after `base_delay * 2 ** (N - 1)`
+    seconds. After `max_attempts` failed retries the entry is published to
+    the `<stream>:dead` stream instead.
+    """
+
+    def __init__(
+        self,
+        stream: str = "events",
+        max_attempts: int = 3,
+        base_delay: float = 1.0,
+        lease: float = 30.0,
+    ):
+        """
+        Args:
+            stream: Stream the retried entries are re-injected into
+            max_attempts: Retries before an entry is dead-lettered
+            base_delay: Delay before the first retry (seconds)
+            lease: Time a claimed entry is hidden from other schedulers
+        """
+        self.stream = stream
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.lease = lease
+
+    @property
+    def schedule_key(self) -> str:
+        """Redis key of the sorted set holding scheduled retries."""
+        return f"{self.stream}:retry"
+
+    @property
+    def dead_letter_stream(self) -> str:
+        """Stream receiving entries that exhausted their attempts."""
+        return f"{self.stream}:dead"
+
+    async def schedule(
+        self,
+        broker: RedisBroker,
+        body: bytes,
+        headers: dict[str, Any],
+        error: str,
+    ) -> bool:
+        """
+        Schedule a failed entry for a later retry or dead-letter it.
+
+        Args:
+            broker: Connected broker
+            body: Raw message body
+            headers: Message headers
+            error: Error the handler failed with
+
+        Returns:
+            True if a retry was scheduled, False if the entry was dead-lettered
+        """
+        attempt = int(headers.get(RETRY_ATTEMPT_HEADER, 0)) + 1
+        headers = {
+            key: value for key, value in headers.items() if key not in _INTERNAL_HEADERS
+        }
+
+        if attempt > self.max_attempts:
+            await broker.publish(
+                body,
+                stream=self.dead_letter_stream,
+                headers={**headers, "last_error": error[:1000]},
+            )
+            metrics.incr("worker.dead_lettered")
+            return False
+
+        headers[RETRY_ATTEMPT_HEADER] = str(attempt)
+        member = orjson.dumps(
+            {
+                # Makes every scheduled retry a distinct set member
+                "id": uuid.uuid4().hex,
+                "body": base64.b64encode(body).decode(),
+                "headers": headers,
+            }
+        )
+        due_at = time.time() + self.base_delay * 2 ** (attempt - 1)
+
+        await broker._connection.zadd(self.schedule_key, {member: due_at})
+        metrics.incr("worker.retries_scheduled")
+        return True
+
+    async def run(
+        self,
+        broker: RedisBroker,
+        interval: float = 0.5,
+        batch_size: int = 100,
+    ) -> None:
+        """
+        Re-inject due retries into the stream until cancelled.
+
+        Args:
+            broker: Connected broker
+            interval: Seconds between checks for due retries
+            batch_size: Maximum entries re-injected per check
+        """
+        claim_due = broker._connection.register_script(_CLAIM_DUE_SCRIPT)
+
+        while True:
+            try:
+                now = time.time()
+                members = await claim_due(
+                    keys=[self.schedule_key],
+                    args=[now, batch_size, now + self.lease],
+                )
+
+                for member in members:
+                    entry = orjson.loads(member)
+                    await broker.publish(
+                        base64.b64decode(entry["body"]),
+                        stream=self.stream,
+                        headers=entry["headers"],
+                    )
+                    await broker._connection.zrem(self.schedule_key, member)
+
+                if members:
+                    logger.info("Re-injected %d retried entries" % len(members))
+
+                metrics.set(
+                    "worker.retry_schedule_size",
+                    await broker._connection.zcard(self.schedule_key),
+                )
+
+                # Keep going without waiting while a full batch was due
+                if len(members) >= batch_size:
+                    continue
+
+            except Exception as e:
+                logger.error("Retry scheduler error: %s" % str(e))
+
+            await asyncio.sleep(interval)
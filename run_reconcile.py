@@ -0,0 +1,37 @@
+import argparse
+import asyncio
+import sys
+
+import orjson
+
+from apps.reconciler import main as reconciler_main
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reconcile the hr tables with HikCentral"
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="compare every page with the database, ignoring cached page digests",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="report the diff without writing anything",
+    )
+    args = parser.parse_args()
+
+    try:
+        summary = asyncio.run(reconciler_main(full=args.full, dry_run=args.dry_run))
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+    sys.stdout.buffer.write(
+        orjson.dumps(summary.as_dict(), option=orjson.OPT_INDENT_2) + b"\n"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark face photo processing.
+
+Processes a corpus of photos inline on the event loop and through the
+process pool, and reports photos/sec, p50/p99 latency and the worst event
+loop stall seen meanwhile.
+
+Usage:
+    python -m tests.image_benchmark [photo_dir] [--concurrency N] [--rounds N]
+
+Without photo_dir a corpus of synthetic camera-sized JPEG and PNG photos is
+generated.
+"""
+
+import argparse
+import asyncio
+import io
+import random
+import statistics
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from apps.hik.images import (
+    FACE_IMAGE_DEFAULTS,
+    get_image_pool,
+    process_face_image,
+    shutdown_image_pool,
+)
+from apps.hik.utils import resize_image_optimal
+
+SAMPLE_SIZES = [(1200, 1600), (2448, 3264), (3024, 4032), (4000, 3000), (800, 600)]
+
+
+def generate_corpus(count: int = 20) -> list[bytes]:
+    """Generate noisy photos that compress like real camera shots."""
+    rng = random.Random(42)
+    corpus = []
+    for index in range(count):
+        width, height = SAMPLE_SIZES[index % len(SAMPLE_SIZES)]
+        img = Image.effect_noise((width, height), 60).convert("RGB")
+        draw = ImageDraw.Draw(img)
+        for _ in range(30):
+            x, y = rng.randrange(width), rng.randrange(height)
+            r = rng.randrange(20, max(width, height) // 4)
+            color = tuple(rng.randrange(256) for _ in range(3))
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=color)
+        img = img.filter(ImageFilter.GaussianBlur(1))
+
+        output = io.BytesIO()
+        if index % 5 == 4:
+            img.save(output, format="PNG")
+        else:
+            img.save(output, format="JPEG", quality=95)
+        corpus.append(output.getvalue())
+    return corpus
+
+
+def load_corpus(directory: Path) -> list[bytes]:
+    return [
+        path.read_bytes()
+        for path in sorted(directory.iterdir())
+        if path.suffix.lower() in (".jpg", ".jpeg", ".png")
+    ]
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """Return the longest delay of a periodic timer until stop is set."""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def run(name: str, corpus: list[bytes], process, concurrency: int) -> None:
+    latencies: list[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(image_data: bytes) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await process(image_data)
+            latencies.append(time.perf_counter() - started)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(image_data) for image_data in corpus))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    worst_lag = await lag_task
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{name:<8} {len(corpus) / elapsed:8.1f} photos/s"
+        f"  p50 {statistics.median(latencies) * 1000:7.1f} ms"
+        f"  p99 {p99 * 1000:7.1f} ms"
+        f"  max loop stall {worst_lag * 1000:7.1f} ms"
+    )
+
+
+async def inline(image_data: bytes) -> bytes:
+    # What callers did before: CPU work directly on the event loop
+    return resize_image_optimal(image_data, **FACE_IMAGE_DEFAULTS)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("photo_dir", nargs="?", type=Path)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.photo_dir) if args.photo_dir else generate_corpus()
+    corpus = corpus * args.rounds
+    print(
+        f"{len(corpus)} photos, {sum(map(len, corpus)) / len(corpus) / 1024:.0f} KB "
+        f"average, concurrency {args.concurrency}\n"
+    )
+
+    # Start the workers before measuring
+    await asyncio.gather(
+        *(
+            asyncio.get_running_loop().run_in_executor(get_image_pool(), int)
+            for _ in range(args.concurrency)
+        )
+    )
+
+    try:
+        await run("inline", corpus, inline, args.concurrency)
+        await run("pool", corpus, process_face_image, args.concurrency)
+    finally:
+        shutdown_image_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
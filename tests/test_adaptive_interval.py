@@ -0,0 +1,37 @@
+"""
+Check the back-off of the adaptive polling interval.
+
+A quiet tenant polls empty for hours. The interval must settle at its
+ceiling and keep returning it, however long the idle streak gets, and snap
+back to the minimum on the first batch.
+
+Usage:
+    python -m tests.test_adaptive_interval
+"""
+
+from loguru import logger
+
+from apps.hik.models.message import RawMessageBatch
+from apps.hik.polling import AdaptiveInterval
+
+IDLE_POLLS = 100_000
+
+
+def main() -> None:
+    scheduler = AdaptiveInterval(min_interval=0.5, max_interval=30.0)
+
+    delays = [scheduler.next_delay(None) for _ in range(IDLE_POLLS)]
+    assert delays[:7] == [1.0, 2.0, 4.0, 8.0, 16.0, 30.0, 30.0], delays[:7]
+    assert all(delay == 30.0 for delay in delays[5:]), "interval left its ceiling"
+    assert scheduler.idle_streak == IDLE_POLLS
+    logger.info("%d empty polls, interval stays at %.1fs" % (IDLE_POLLS, delays[-1]))
+
+    batch = RawMessageBatch(batch_id="1", remaining_number=0, body=b"{}")
+    assert scheduler.next_delay(batch) == 0.5
+    assert scheduler.idle_streak == 0
+    assert scheduler.next_delay(None) == 1.0
+    logger.info("Back to the minimum interval after a batch")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Check that reconciliation never cascades into local data.
+
+Runs the Reconciler against the configured database with a stand-in for
+HikCentral that reports the current local inventory plus a test area, two
+groups and a person with credentials. Then one of the groups is deleted in
+the stand-in:
+
+1. The person moved to the other group: the group is deleted, the person
+   keeps its credentials.
+2. The person is still reported in the deleted group: the group is kept
+   as the person refers to it.
+
+The test rows are removed afterwards.
+
+Usage:
+    python -m tests.test_reconcile_stale
+"""
+
+import asyncio
+import uuid
+from types import SimpleNamespace
+from typing import Any
+
+from loguru import logger
+
+from apps.hr.reconcile import Reconciler
+from apps.hr.tables import Area, Device, Group, Person
+from core.db import database_connection
+
+PREFIX = "rt-%s" % uuid.uuid4().hex[:8]
+AREA_ID = "%s-area" % PREFIX
+OLD_GROUP_ID = "%s-old" % PREFIX
+NEW_GROUP_ID = "%s-new" % PREFIX
+PERSON_ID = "%s-person" % PREFIX
+
+
+class FakeHikClient:
+    """Serves a fixed inventory the way HikClient streams it."""
+
+    def __init__(self, areas, groups, devices, persons):
+        self.areas = areas
+        self.groups = groups
+        self.devices = devices
+        self.persons = persons
+
+    async def iter_areas(self, **kwargs):
+        for area in self.areas:
+            yield area
+
+    async def iter_person_groups(self, **kwargs):
+        for group in self.groups:
+            yield group
+
+    async def iter_devices(self, **kwargs):
+        for device in self.devices:
+            yield device
+
+    async def iter_persons(self, **kwargs):
+        for person in self.persons:
+            yield person
+
+
+def area_record(row: dict[str, Any]) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=row["area_id"], name=row["name"], parentAreaID=row["parent_area_id"]
+    )
+
+
+def group_record(row: dict[str, Any]) -> SimpleNamespace:
+    return SimpleNamespace(
+        group_id=row["group_id"],
+        group_name=row["name"],
+        parent_id=row["parent_group_id"],
+        description=row["description"],
+    )
+
+
+def device_record(row: dict[str, Any]) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=row["device_id"],
+        name=row["name"],
+        category=row["category"],
+        serial_number=row["serial_no"],
+    )
+
+
+def person_record(row: dict[str, Any]) -> SimpleNamespace:
+    return SimpleNamespace(
+        person_id=row["person_id"],
+        person_code=row["code"],
+        first_name=row["first_name"],
+        last_name=row["last_name"],
+        start_date=row["start_date"],
+        end_date=row["end_date"],
+        group_id=row["group"],
+    )
+
+
+async def local_inventory() -> dict[str, list[SimpleNamespace]]:
+    """Get the local rows as HikCentral would report them."""
+    return {
+        "areas": [area_record(row) for row in await Area.select()],
+        "groups": [group_record(row) for row in await Group.select()],
+        "devices": [device_record(row) for row in await Device.select()],
+        "persons": [person_record(row) for row in await Person.select()],
+    }
+
+
+async def seed() -> None:
+    await Area.insert(Area(area_id=AREA_ID, name="Test area", parent_area_id=""))
+    await Group.insert(
+        Group(group_id=OLD_GROUP_ID, name="Old group", area=AREA_ID),
+        Group(group_id=NEW_GROUP_ID, name="New group", area=AREA_ID),
+    )
+    await Person.insert(
+        Person(
+            person_id=PERSON_ID,
+            code=PREFIX,
+            first_name="Test",
+            last_name="Person",
+            group=OLD_GROUP_ID,
+            card_no="0000012345",
+            pin_code="1234",
+            face_digest="f" * 64,
+        )
+    )
+
+
+async def reconcile_without_old_group(person_group: str) -> None:
+    inventory = await local_inventory()
+    inventory["groups"] = [
+        group for group in inventory["groups"] if group.group_id != OLD_GROUP_ID
+    ]
+    for person in inventory["persons"]:
+        if person.person_id == PERSON_ID:
+            person.group_id = person_group
+
+    summary = await Reconciler(FakeHikClient(**inventory), full=True).run()
+    logger.info("Reconciled: %s" % summary.as_dict())
+
+
+async def check_person(group_id: str) -> None:
+    person = await Person.select().where(Person.person_id == PERSON_ID).first()
+    assert person is not None, "person was deleted"
+    assert person["group"] == group_id, "person is in %s" % person["group"]
+    assert person["card_no"] == "0000012345", "card number was lost"
+    assert person["pin_code"] == "1234", "PIN code was lost"
+    assert person["face_digest"] == "f" * 64, "face digest was lost"
+
+
+async def group_exists(group_id: str) -> bool:
+    return await Group.exists().where(Group.group_id == group_id)
+
+
+async def main() -> None:
+    await database_connection()
+    await seed()
+    try:
+        # HikCentral still reports the person in the deleted group
+        await reconcile_without_old_group(OLD_GROUP_ID)
+        assert await group_exists(OLD_GROUP_ID), "referenced group was deleted"
+        await check_person(OLD_GROUP_ID)
+        logger.info("Group still referenced by a person is kept")
+
+        # HikCentral moved the person to another group
+        await reconcile_without_old_group(NEW_GROUP_ID)
+        assert not await group_exists(OLD_GROUP_ID), "stale group was kept"
+        await check_person(NEW_GROUP_ID)
+        logger.info("Stale group deleted, person kept with its credentials")
+    finally:
+        await Person.delete().where(Person.person_id == PERSON_ID)
+        await Group.delete().where(Group.group_id.is_in([OLD_GROUP_ID, NEW_GROUP_ID]))
+        await Area.delete().where(Area.area_id == AREA_ID)
+        await database_connection(close=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())